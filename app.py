@@ -3,11 +3,14 @@ from datetime import datetime
 from dotenv import load_dotenv
 from flask import Flask, send_from_directory
 from routes.all_routes import client_bp
+import db
 
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'default-unsecure-key-for-dev')
+# one pooled connection per request, returned at teardown
+db.init_app(app)
 
 
 @app.context_processor
@@ -22,6 +25,31 @@ app.register_blueprint(client_bp)
 from routes.backup_routes import backup_bp
 app.register_blueprint(backup_bp)
 
+def start_background_warmup():
+    """
+    Load the face engine in the encoder workers and build the embedding
+    galleries in the background, so /healthz/ready only turns green once the
+    first scan will be fast. Called by wsgi.py and by "python app.py"; never
+    at import, since spawned worker processes (Windows) re-import app.
+    """
+    import multiprocessing
+    if multiprocessing.parent_process() is not None:
+        return
+    from services.warmup import start_warmup
+    from services.face_service import face_service
+    from models.face_embedding_model import face_gallery
+    from models.admin_model import admin_gallery
+    # With a shared face server the engine and client gallery live there;
+    # its warm-up step then just waits for the server to report ready.
+    steps = [("face_engine", face_service.warm_up)]
+    if not face_service.remote:
+        steps.append(("face_gallery", lambda: len(face_gallery)))
+    steps.append(("admin_gallery", lambda: len(admin_gallery)))
+    start_warmup(steps)
+
 
 if __name__ == "__main__":
+    # skipped in the debug reloader's parent process, which serves nothing
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_warmup()
     app.run(host='0.0.0.0', debug=True)
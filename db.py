@@ -1,6 +1,11 @@
 import mysql.connector
 from mysql.connector import pooling
 import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from flask import g, has_request_context
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,6 +18,164 @@ db_config = {
     "database": os.getenv("MYSQL_DATABASE", "hrmo_elog_db")
 }
 
+# Optional read replica. When MYSQL_REPLICA_HOST is set, reads marked
+# read_only (reports, dashboards) use a second pool on the replica; writes
+# and all other reads stay on the primary. Other settings default to the
+# primary's.
+REPLICA_HOST = os.getenv("MYSQL_REPLICA_HOST", "").strip()
+replica_config = dict(db_config, host=REPLICA_HOST,
+                      user=os.getenv("MYSQL_REPLICA_USER", db_config["user"]),
+                      password=os.getenv("MYSQL_REPLICA_PASSWORD", db_config["password"]),
+                      database=os.getenv("MYSQL_REPLICA_DATABASE", db_config["database"])) if REPLICA_HOST else None
+# Reads fall back to the primary while the replica is further behind than this.
+REPLICA_MAX_LAG = float(os.getenv("MYSQL_REPLICA_MAX_LAG", "5"))
+# Seconds between replica lag checks, and before retrying a replica that failed.
+REPLICA_CHECK_INTERVAL = float(os.getenv("MYSQL_REPLICA_CHECK_INTERVAL", "5"))
+REPLICA_RETRY = float(os.getenv("MYSQL_REPLICA_RETRY", "30"))
+
+# Pool sizing. Connections beyond MYSQL_POOL_SIZE (up to MYSQL_POOL_OVERFLOW
+# more) are opened on demand and closed when returned. When all are in use a
+# request waits up to MYSQL_POOL_TIMEOUT seconds instead of failing at once.
+POOL_SIZE = min(int(os.getenv("MYSQL_POOL_SIZE", "10")), pooling.CNX_POOL_MAXSIZE)
+POOL_OVERFLOW = int(os.getenv("MYSQL_POOL_OVERFLOW", "0"))
+POOL_TIMEOUT = float(os.getenv("MYSQL_POOL_TIMEOUT", "10"))
+
+# Rows fetched per round trip by iter_db_rows().
+STREAM_BATCH_SIZE = int(os.getenv("MYSQL_STREAM_BATCH", "500"))
+
+# Upper bounds (seconds) of the checkout wait histogram buckets.
+_WAIT_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class PoolTimeout(mysql.connector.errors.PoolError):
+    """No connection became free within the pool timeout."""
+
+
+class _Checkout:
+    """
+    A connection handed out by ConnectionPool. Behaves like the underlying
+    connection; close() gives it back (and closes overflow connections).
+    """
+
+    def __init__(self, pool, cnx, overflow, checked_out_at):
+        self._pool = pool
+        self._cnx = cnx
+        self._overflow = overflow
+        self._checked_out_at = checked_out_at
+
+    def __getattr__(self, name):
+        return getattr(self._cnx, name)
+
+    def close(self):
+        if self._cnx is None:
+            return
+        cnx, self._cnx = self._cnx, None
+        try:
+            cnx.close()
+        finally:
+            self._pool._release(self._overflow, self._checked_out_at)
+
+
+class ConnectionPool:
+    """
+    Blocking, instrumented wrapper around mysql-connector's pool, which
+    raises PoolError as soon as it is exhausted. Admission is bounded by a
+    semaphore of size + overflow; get_connection() waits up to `timeout`
+    for a slot and raises PoolTimeout after that. stats() reports
+    connections in use, a wait-time histogram, exhaustion events (checkouts
+    that had to wait) and connection age.
+    """
+
+    def __init__(self, size=POOL_SIZE, overflow=POOL_OVERFLOW, timeout=POOL_TIMEOUT, name="mypool", pool=None, **config):
+        self.size = size
+        self.overflow = overflow
+        self.timeout = timeout
+        self._config = config
+        self._pool = pool or pooling.MySQLConnectionPool(pool_name=name, pool_size=size, **config)
+        self._slots = threading.BoundedSemaphore(size + overflow)
+        self._lock = threading.Lock()
+        # first checkout time of each pooled connection, for connection age
+        self._born = {}
+        self._stats = {
+            'checkouts': 0, 'in_use': 0, 'in_use_peak': 0, 'overflow_in_use': 0, 'overflow_opened': 0,
+            'waited': 0, 'timeouts': 0, 'errors': 0,
+            'wait_total_s': 0.0, 'wait_max_s': 0.0, 'hold_total_s': 0.0, 'hold_max_s': 0.0,
+        }
+        self._histogram = [0] * (len(_WAIT_BUCKETS) + 1)
+
+    def get_connection(self):
+        started = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['waited'] += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                raise PoolTimeout(f"No database connection free within {self.timeout}s "
+                                  f"(pool size {self.size}, overflow {self.overflow})")
+        waited = time.monotonic() - started
+
+        overflow = False
+        try:
+            try:
+                cnx = self._pool.get_connection()
+            except mysql.connector.errors.PoolError:
+                # every pooled connection is out; this slot is an overflow one
+                cnx = mysql.connector.connect(**self._config)
+                overflow = True
+        except Exception:
+            self._slots.release()
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+
+        now = time.monotonic()
+        with self._lock:
+            s = self._stats
+            s['checkouts'] += 1
+            s['in_use'] += 1
+            s['in_use_peak'] = max(s['in_use_peak'], s['in_use'])
+            s['wait_total_s'] += waited
+            s['wait_max_s'] = max(s['wait_max_s'], waited)
+            self._histogram[bisect.bisect_left(_WAIT_BUCKETS, waited)] += 1
+            if overflow:
+                s['overflow_in_use'] += 1
+                s['overflow_opened'] += 1
+            else:
+                self._born.setdefault(id(cnx._cnx), now)
+        return _Checkout(self, cnx, overflow, now)
+
+    def _release(self, overflow, checked_out_at):
+        held = time.monotonic() - checked_out_at
+        with self._lock:
+            s = self._stats
+            s['in_use'] -= 1
+            if overflow:
+                s['overflow_in_use'] -= 1
+            s['hold_total_s'] += held
+            s['hold_max_s'] = max(s['hold_max_s'], held)
+        self._slots.release()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self._stats)
+            histogram = list(self._histogram)
+            ages = [now - born for born in self._born.values()]
+        checkouts = stats['checkouts'] or 1
+        labels = [f"<={int(b * 1000)}ms" for b in _WAIT_BUCKETS] + [f">{int(_WAIT_BUCKETS[-1] * 1000)}ms"]
+        stats['wait_histogram'] = dict(zip(labels, histogram))
+        stats['wait_avg_s'] = stats['wait_total_s'] / checkouts
+        stats['hold_avg_s'] = stats['hold_total_s'] / checkouts
+        stats['connections'] = len(ages)
+        stats['connection_age_max_s'] = max(ages) if ages else 0.0
+        stats['connection_age_avg_s'] = sum(ages) / len(ages) if ages else 0.0
+        stats['size'] = self.size
+        stats['overflow'] = self.overflow
+        stats['timeout_s'] = self.timeout
+        return stats
+
+
 # Connection pool — created at startup if MySQL is available,
 # otherwise lazily created on first successful get_db() call.
 connection_pool = None
@@ -20,12 +183,8 @@ connection_pool = None
 def _create_pool():
     """Attempt to create the connection pool. Returns pool or None."""
     try:
-        pool = pooling.MySQLConnectionPool(
-            pool_name="mypool",
-            pool_size=10,
-            **db_config
-        )
-        print("Connection pool created successfully.")
+        pool = ConnectionPool(**db_config)
+        print(f"Connection pool created successfully (size {pool.size}, overflow {pool.overflow}).")
         return pool
     except mysql.connector.Error as err:
         print(f"Error creating connection pool: {err}")
@@ -34,24 +193,200 @@ def _create_pool():
 # Try to create pool at import time
 connection_pool = _create_pool()
 
-def get_db():
+# ── read replica ──────────────────────────────────────────────────────────────
+
+replica_pool = None
+_replica_lock = threading.Lock()
+_replica_state = {
+    'healthy': False, 'lag_s': None, 'checked_at': None, 'down_until': 0.0, 'last_error': None,
+    'reads': 0, 'fallbacks': 0,
+}
+# read_your_writes() nesting depth per thread
+_local = threading.local()
+
+def _replica_down(err):
+    with _replica_lock:
+        _replica_state.update(healthy=False, down_until=time.monotonic() + REPLICA_RETRY, last_error=str(err))
+    print(f"Read replica unavailable, reading from the primary for {REPLICA_RETRY:.0f}s: {err}")
+
+def _check_replica():
+    """Connect to the replica (creating its pool) and measure replication lag."""
+    global replica_pool
+    if replica_pool is None:
+        replica_pool = ConnectionPool(name="replica", **replica_config)
+        print(f"Replica connection pool created ({REPLICA_HOST}).")
+    connection = replica_pool.get_connection()
+    try:
+        cursor = connection.cursor(dictionary=True, buffered=True)
+        try:
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except mysql.connector.Error:
+                cursor.execute("SHOW SLAVE STATUS")  # MySQL < 8.0.22, MariaDB
+            status = cursor.fetchone()
+        except mysql.connector.Error:
+            status = None  # no REPLICATION CLIENT privilege: lag unknown
+        finally:
+            cursor.close()
+    finally:
+        connection.close()
+    if status is None:
+        return True, None
+    lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+    # NULL lag means replication is stopped: the replica is not catching up
+    return lag is not None and lag <= REPLICA_MAX_LAG, lag
+
+def _replica_usable():
+    if replica_config is None or getattr(_local, 'primary_reads', 0):
+        return False
+    now = time.monotonic()
+    with _replica_lock:
+        if now < _replica_state['down_until']:
+            return False
+        checked_at = _replica_state['checked_at']
+        if checked_at is not None and now - checked_at < REPLICA_CHECK_INTERVAL:
+            return _replica_state['healthy']
+        # this thread re-checks; the others keep using the last result meanwhile
+        _replica_state['checked_at'] = now
+    try:
+        healthy, lag = _check_replica()
+    except mysql.connector.Error as err:
+        _replica_down(err)
+        return False
+    with _replica_lock:
+        _replica_state.update(healthy=healthy, lag_s=lag)
+    return healthy
+
+@contextmanager
+def read_your_writes():
+    """
+    Send read_only reads inside this block to the primary, for callers that
+    must see what they (or the kiosk they serve) just wrote.
+    """
+    _local.primary_reads = getattr(_local, 'primary_reads', 0) + 1
+    try:
+        yield
+    finally:
+        _local.primary_reads -= 1
+
+def _count_read(replica):
+    with _replica_lock:
+        _replica_state['reads' if replica else 'fallbacks'] += 1
+
+# ── connections ───────────────────────────────────────────────────────────────
+
+def _get_replica():
+    """A replica connection for a read_only read, or None when the read should
+    go to the primary (no replica, down, lagging, busy or read_your_writes)."""
+    if _replica_usable():
+        try:
+            connection = replica_pool.get_connection()
+            _count_read(True)
+            return connection
+        except PoolTimeout:
+            pass  # replica pool busy, not broken: this read goes to the primary
+        except mysql.connector.Error as err:
+            _replica_down(err)
+    if replica_config is not None:
+        _count_read(False)
+    return None
+
+def get_db(read_only=False):
     """Return a connection from the pool. If pool is None (MySQL was down
     at startup), try to create the pool first so the app auto-recovers
-    after MySQL is fixed without needing a restart."""
+    after MySQL is fixed without needing a restart. Waits up to
+    MYSQL_POOL_TIMEOUT for a free connection, then raises PoolTimeout.
+
+    read_only=True takes a replica connection when a replica is configured,
+    reachable and within MYSQL_REPLICA_MAX_LAG; otherwise the primary."""
     global connection_pool
+    if read_only:
+        connection = _get_replica()
+        if connection is not None:
+            return connection
     if connection_pool is None:
         connection_pool = _create_pool()
     if connection_pool:
         return connection_pool.get_connection()
     return None
 
-from contextlib import contextmanager
+def pool_stats():
+    """Counters of the connection pool, or None while MySQL is unreachable.
+    With a replica configured, its pool and routing state are under 'replica'."""
+    if not connection_pool:
+        return None
+    stats = connection_pool.stats()
+    if replica_config is not None:
+        with _replica_lock:
+            replica = dict(_replica_state)
+        replica.pop('checked_at')
+        replica['host'] = REPLICA_HOST
+        replica['max_lag_s'] = REPLICA_MAX_LAG
+        replica['down'] = replica.pop('down_until') > time.monotonic()
+        replica['pool'] = replica_pool.stats() if replica_pool else None
+        stats['replica'] = replica
+    return stats
+
+
+def _request_connection(read_only=False):
+    """
+    The connection shared by every get_db_cursor() of the current request:
+    one on the primary and, for read_only cursors served by the replica, one
+    on the replica. A request never holds two primary connections, so it
+    cannot wait on the pool for a second one while holding the first.
+    Once the request has written, its reads stay on the primary.
+    """
+    if read_only and not g.get('_db_wrote'):
+        connection = g.get('_db_read_connection')
+        if connection is None:
+            connection = _get_replica()
+        if connection is not None:
+            g._db_read_connection = connection
+            return connection
+    connection = g.get('_db_connection')
+    if connection is None:
+        connection = get_db()
+        g._db_connection = connection
+    return connection
+
+def _release_request_connection(key):
+    connection = g.pop(key, None)
+    if connection is None:
+        return
+    try:
+        # reads leave a transaction open; never hand that back to the pool
+        connection.rollback()
+    except mysql.connector.Error:
+        pass
+    finally:
+        connection.close()
+
+def close_request_connection(exc=None):
+    """Return the request's shared connections to the pool (teardown handler)."""
+    for key in ('_db_connection', '_db_read_connection'):
+        _release_request_connection(key)
+    g.pop('_db_wrote', None)
+
+def init_app(app):
+    """Release the per-request connection when each request ends."""
+    app.teardown_appcontext(close_request_connection)
 
 @contextmanager
-def get_db_cursor(commit=False):
+def get_db_cursor(commit=False, read_only=False):
     """
     Context manager to get a database connection and cursor.
     Ensures that the connection is closed (returned to pool) even if an exception occurs.
+
+    Inside a Flask request every call shares one connection, kept on
+    flask.g and returned to the pool by close_request_connection() at
+    teardown, so a page making several model calls checks out (and resets)
+    one connection instead of one per call. Those cursors are buffered so
+    an unread result never blocks the next query on the same connection.
+    Outside a request (scripts, tests, background threads) each call takes
+    and returns its own connection.
+
+    read_only=True marks a read that may be served by the read replica (see
+    get_db); commit=True always uses the primary.
     
     Usage:
         with get_db_cursor(commit=True) as cursor:
@@ -63,21 +398,58 @@ def get_db_cursor(commit=False):
             result = cursor.fetchall()
             # connection closed automatically
     """
-    connection = get_db()
+    read_only = read_only and not commit
+    in_request = has_request_context()
+    connection = _request_connection(read_only) if in_request else get_db(read_only)
     if connection is None:
         raise Exception("Failed to get database connection")
         
-    cursor = connection.cursor(dictionary=True)
+    cursor = connection.cursor(dictionary=True, buffered=in_request)
     try:
         yield cursor
         if commit:
             connection.commit()
+            if in_request:
+                g._db_wrote = True
     except Exception:
         if commit:
             connection.rollback()
         raise
     finally:
         cursor.close()
-        connection.close()
+        if not in_request:
+            connection.close()
 
+def iter_db_rows(sql, params=(), batch_size=STREAM_BATCH_SIZE, read_only=False):
+    """
+    Yield the rows of a SELECT as dicts from an unbuffered cursor, fetching
+    batch_size rows per round trip, so memory stays flat however many rows
+    match. The generator takes its own connection on first iteration and
+    holds it until it is exhausted or closed; streamed responses should wrap
+    it in stream_with_context. read_only as for get_db_cursor.
 
+    Inside a request, the request's shared primary connection is handed back
+    to the pool first, so a request never holds two primary connections.
+    """
+    if has_request_context():
+        read_only = read_only and not g.get('_db_wrote')
+        _release_request_connection('_db_connection')
+    connection = get_db(read_only)
+    if connection is None:
+        raise Exception("Failed to get database connection")
+    cursor = connection.cursor(dictionary=True, buffered=False)
+    try:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        try:
+            # stopped early (client went away): drain so the connection can be reused
+            connection.consume_results()
+        except mysql.connector.Error:
+            pass
+        cursor.close()
+        connection.close()
@@ -48,6 +48,15 @@ def init_mysql():
         
         conn.commit()
         cursor.close()
+
+        # Indexes and later schema changes live in numbered migrations
+        from scripts.migrate import pending_migrations, apply_migration
+        cursor = conn.cursor(dictionary=True)
+        for migration in pending_migrations(cursor):
+            apply_migration(cursor, migration)
+            conn.commit()
+            print(f"Applied migration {migration.version:03d}_{migration.name}")
+        cursor.close()
         conn.close()
         print("MySQL schema initialization complete.")
 
@@ -1,15 +1,46 @@
 from db import get_db, get_db_cursor
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
-import numpy as np
-import json
 import mysql.connector
+from models.embedding_codec import encode_embeddings, read_stored_embeddings
+from models.face_gallery import FaceGallery
+
+
+def _decode_admin_embedding(admin):
+    # Binary column first, JSON column for admins not yet migrated. Always
+    # exposed as a list of per-angle lists under 'face_embedding'.
+    vectors = read_stored_embeddings(admin.pop('face_embedding_blob', None), admin.get('face_embedding'))
+    admin['face_embedding'] = vectors.tolist() if vectors is not None else None
+    return admin
+
+def _load_admin_gallery_rows():
+    with get_db_cursor() as cursor:
+        cursor.execute("""SELECT id, face_embedding, face_embedding_blob FROM admins
+                          WHERE face_embedding_blob IS NOT NULL OR face_embedding IS NOT NULL""")
+        rows = cursor.fetchall()
+    for r in rows:
+        # Binary rows decode straight to an (n, 128) array. JSON rows may be
+        # the new list of lists (one per angle) or a legacy single list;
+        # read_stored_embeddings handles both.
+        try:
+            candidates = read_stored_embeddings(r.get('face_embedding_blob'), r.get('face_embedding'))
+        except ValueError as e:
+            print(f"Error processing face data for admin {r.get('id')}: {e}")
+            continue
+        if candidates is None:
+            continue
+        for emb in candidates:
+            yield r['id'], str(r['id']), emb
+
+# Every admin angle embedding flattened into one matrix, owner = admin id.
+# Reloaded lazily after invalidate(), which runs whenever admin face data changes.
+admin_gallery = FaceGallery(_load_admin_gallery_rows)
 
 def add_admin(first_name, last_name, email, password, embedding_list=None, pin=None):
     ph = generate_password_hash(password)
     pin_hash = generate_password_hash(pin) if pin else None
     
-    query = """INSERT INTO admins (first_name, last_name, email, password_hash, pin_hash, face_embedding, created_at)
+    query = """INSERT INTO admins (first_name, last_name, email, password_hash, pin_hash, face_embedding_blob, created_at)
                VALUES (%s, %s, %s, %s, %s, %s, %s)"""
     values = (
         first_name.upper() if isinstance(first_name, str) else first_name,
@@ -17,7 +48,7 @@ def add_admin(first_name, last_name, email, password, embedding_list=None, pin=N
         email.lower() if isinstance(email, str) else email,
         ph,
         pin_hash,
-        json.dumps(embedding_list) if embedding_list else None,
+        encode_embeddings(embedding_list) if embedding_list else None,
         datetime.now()
     )
     
@@ -25,7 +56,9 @@ def add_admin(first_name, last_name, email, password, embedding_list=None, pin=N
         with get_db_cursor(commit=True) as cursor:
             cursor.execute(query, values)
             last_id = cursor.lastrowid
-            return str(last_id)
+        if embedding_list:
+            admin_gallery.invalidate()
+        return str(last_id)
     except mysql.connector.Error as err:
         print(f"Error adding admin: {err}")
         return None
@@ -40,11 +73,7 @@ def get_admin_by_email(email):
         
         if admin:
             admin['id'] = str(admin['id'])
-            emb_data = admin.get('face_embedding')
-            if isinstance(emb_data, (bytes, bytearray)):
-                admin['face_embedding'] = json.loads(emb_data.decode('utf-8'))
-            elif isinstance(emb_data, str):
-                admin['face_embedding'] = json.loads(emb_data)
+            _decode_admin_embedding(admin)
         return admin
 
 def verify_admin_credentials(email, password):
@@ -74,11 +103,7 @@ def get_admin_by_id(admin_id):
         
         if admin:
             admin['id'] = str(admin['id'])
-            emb_data = admin.get('face_embedding')
-            if isinstance(emb_data, (bytes, bytearray)):
-                admin['face_embedding'] = json.loads(emb_data.decode('utf-8'))
-            elif isinstance(emb_data, str):
-                admin['face_embedding'] = json.loads(emb_data)
+            _decode_admin_embedding(admin)
         return admin
 
 def update_admin_password(admin_id, new_password):
@@ -93,43 +118,7 @@ def update_admin_password(admin_id, new_password):
         return False
 
 def find_best_admin_match(embedding_list, threshold=0.6):
-    with get_db_cursor() as cursor:
-        cursor.execute("SELECT id, face_embedding FROM admins WHERE face_embedding IS NOT NULL")
-        target = np.array(embedding_list)
-        best_id = None
-        best_distance = None
-        
-        for r in cursor.fetchall():
-            stored_json = r.get('face_embedding')
-            if not stored_json:
-                continue
-                
-            if isinstance(stored_json, (bytes, bytearray)):
-                stored_data = json.loads(stored_json.decode('utf-8'))
-            elif isinstance(stored_json, str):
-                stored_data = json.loads(stored_json)
-            else:
-                stored_data = stored_json
-                
-            # Handle both old (single list) and new (list of lists) formats
-            # New format: [[...], [...], [...]]
-            # Old format: [...]
-            
-            candidates = []
-            if isinstance(stored_data, list) and len(stored_data) > 0:
-                if isinstance(stored_data[0], list):
-                    # Request returns list of lists
-                    candidates = [np.array(e) for e in stored_data]
-                else:
-                    # Legacy single embedding
-                    candidates = [np.array(stored_data)]
-            
-            # Check against all candidates for this admin
-            for emb in candidates:
-                dist = np.linalg.norm(emb - target)
-                if best_distance is None or dist < best_distance:
-                    best_distance = float(dist)
-                    best_id = str(r['id'])
+    best_id, best_distance = admin_gallery.search(embedding_list)
     
     if best_distance is not None and best_distance <= threshold:
         return best_id, best_distance
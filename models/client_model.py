@@ -1,4 +1,5 @@
-from db import get_db, get_db_cursor
+from db import get_db, get_db_cursor, iter_db_rows
+from models.face_embedding_model import face_gallery, notify_embeddings_changed
 import os
 import mysql.connector
 
@@ -157,14 +158,19 @@ def delete_client(id):
             except Exception:
                 pass
 
+    if cli:
+        # face_embeddings rows went with the client via ON DELETE CASCADE
+        face_gallery.remove_owner(cli['client_id'])
+        notify_embeddings_changed(cli['client_id'])
+
 def get_departments():
-    with get_db_cursor() as cursor:
+    with get_db_cursor(read_only=True) as cursor:
         cursor.execute("SELECT DISTINCT department FROM clients WHERE department IS NOT NULL")
         deps = [row['department'] for row in cursor.fetchall()]
         return sorted(deps)
 
 def get_client_count():
-    with get_db_cursor() as cursor:
+    with get_db_cursor(read_only=True) as cursor:
         cursor.execute("SELECT COUNT(*) as cnt FROM clients")
         result = cursor.fetchone()
         return result['cnt']
@@ -178,14 +184,16 @@ def get_next_client_id():
         max_id = result['max_id'] if result and result['max_id'] is not None else 0
         return str(max_id + 1)
 
-def search_clients(query, limit=10):
+def _like_escape(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _search_clients(where, params, limit):
     with get_db_cursor() as cursor:
-        search_val = f"%{query}%"
-        sql = """SELECT id, client_id, full_name, department, client_type 
+        sql = f"""SELECT id, client_id, full_name, department, client_type 
                  FROM clients 
-                 WHERE client_id LIKE %s OR full_name LIKE %s 
+                 WHERE {where} 
                  ORDER BY full_name ASC LIMIT %s"""
-        cursor.execute(sql, (search_val, search_val, limit))
+        cursor.execute(sql, (*params, limit))
         rows = cursor.fetchall()
         
         for row in rows:
@@ -193,25 +201,47 @@ def search_clients(query, limit=10):
             
         return rows
 
+def search_clients(query, limit=10):
+    # IDs, full names and last names starting with the text come first; those
+    # LIKEs use the indexes on the three columns (see scripts/migrations).
+    prefix = _like_escape(query) + '%'
+    rows = _search_clients("client_id LIKE %s OR full_name LIKE %s OR lname LIKE %s", [prefix] * 3, limit)
+    if len(rows) < limit:
+        # then anything containing it (middle names, parts of IDs), which
+        # needs a table scan, so only when the prefixes did not fill the list
+        contains = '%' + _like_escape(query) + '%'
+        seen = {row['id'] for row in rows}
+        more = _search_clients("client_id LIKE %s OR full_name LIKE %s", [contains] * 2, limit)
+        rows += [row for row in more if row['id'] not in seen][:limit - len(rows)]
+    return rows
+
+def _clients_query(search=None, limit=None):
+    sql = "SELECT *, client_id as employee_id FROM clients"
+    params = []
+    if search:
+        sql += " WHERE full_name LIKE %s OR client_id LIKE %s"
+        search_val = f"%{search}%"
+        params.extend([search_val, search_val])
+    
+    sql += " ORDER BY id DESC"
+    
+    if limit and limit != 'all':
+        sql += " LIMIT %s"
+        params.append(int(limit))
+    return sql, params
+
 def get_clients_filtered(search=None, limit=None):
-    with get_db_cursor() as cursor:
-        sql = "SELECT *, client_id as employee_id FROM clients"
-        params = []
-        if search:
-            sql += " WHERE full_name LIKE %s OR client_id LIKE %s"
-            search_val = f"%{search}%"
-            params.extend([search_val, search_val])
-        
-        sql += " ORDER BY id DESC"
-        
-        if limit and limit != 'all':
-            sql += " LIMIT %s"
-            params.append(int(limit))
-        
-        cursor.execute(sql, params)
+    with get_db_cursor(read_only=True) as cursor:
+        cursor.execute(*_clients_query(search, limit))
         data = cursor.fetchall()
         
         for doc in data:
             doc['id'] = str(doc['id'])
             
         return data
+
+def iter_clients_filtered(search=None, limit=None):
+    """Like get_clients_filtered, but yields rows from a streaming cursor."""
+    for doc in iter_db_rows(*_clients_query(search, limit), read_only=True):
+        doc['id'] = str(doc['id'])
+        yield doc
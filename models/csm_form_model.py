@@ -1,4 +1,4 @@
-from db import get_db, get_db_cursor
+from db import get_db, get_db_cursor, iter_db_rows
 from datetime import datetime
 import mysql.connector
 
@@ -47,47 +47,75 @@ def insert_csm_form(
         print(f"Error inserting CSM form: {err}")
         return None
 
-def get_csm_forms_filtered(start_date=None, end_date=None, gender=None, region=None, age_min=None, age_max=None, service=None, limit=None):
-    with get_db_cursor() as cursor:
-        sql = "SELECT * FROM csm_form"
-        where_clauses = []
-        params = []
+def _csm_forms_query(start_date=None, end_date=None, gender=None, region=None, age_min=None, age_max=None, service=None, limit=None):
+    sql = "SELECT * FROM csm_form"
+    where_clauses = []
+    params = []
+    
+    if start_date:
+        where_clauses.append("date >= %s")
+        params.append(start_date)
+    if end_date:
+        where_clauses.append("date <= %s")
+        params.append(end_date)
+    if gender:
+        where_clauses.append("sex = %s")
+        params.append(gender)
+    if region:
+        where_clauses.append("region_of_residence LIKE %s")
+        params.append(f"%{region}%")
+    if age_min is not None:
+        where_clauses.append("age >= %s")
+        params.append(age_min)
+    if age_max is not None:
+        where_clauses.append("age <= %s")
+        params.append(age_max)
+    if service:
+        where_clauses.append("service_availed LIKE %s")
+        params.append(f"%{service}%")
         
-        if start_date:
-            where_clauses.append("date >= %s")
-            params.append(start_date)
-        if end_date:
-            where_clauses.append("date <= %s")
-            params.append(end_date)
-        if gender:
-            where_clauses.append("sex = %s")
-            params.append(gender)
-        if region:
-            where_clauses.append("region_of_residence LIKE %s")
-            params.append(f"%{region}%")
-        if age_min is not None:
-            where_clauses.append("age >= %s")
-            params.append(age_min)
-        if age_max is not None:
-            where_clauses.append("age <= %s")
-            params.append(age_max)
-        if service:
-            where_clauses.append("service_availed LIKE %s")
-            params.append(f"%{service}%")
-            
-        if where_clauses:
-            sql += " WHERE " + " AND ".join(where_clauses)
-            
-        sql += " ORDER BY date DESC, id DESC"
+    if where_clauses:
+        sql += " WHERE " + " AND ".join(where_clauses)
         
-        if limit and limit != 'all':
-            sql += " LIMIT %s"
-            params.append(int(limit))
-            
-        cursor.execute(sql, params)
+    sql += " ORDER BY date DESC, id DESC"
+    
+    if limit and limit != 'all':
+        sql += " LIMIT %s"
+        params.append(int(limit))
+    return sql, params
+
+def get_csm_forms_filtered(start_date=None, end_date=None, gender=None, region=None, age_min=None, age_max=None, service=None, limit=None):
+    with get_db_cursor(read_only=True) as cursor:
+        cursor.execute(*_csm_forms_query(start_date, end_date, gender, region, age_min, age_max, service, limit))
         rows = cursor.fetchall()
         
         for doc in rows:
             doc['id'] = str(doc['id'])
             
         return rows
+
+def iter_csm_forms_filtered(start_date=None, end_date=None, gender=None, region=None, age_min=None, age_max=None, service=None, limit=None):
+    """Like get_csm_forms_filtered, but yields rows from a streaming cursor."""
+    for doc in iter_db_rows(*_csm_forms_query(start_date, end_date, gender, region, age_min, age_max, service, limit), read_only=True):
+        doc['id'] = str(doc['id'])
+        yield doc
+
+def get_csm_filter_options():
+    """Distinct services, regions and sexes for the CSM report's dropdowns.
+    service_availed is comma-separated, so each listed service counts."""
+    with get_db_cursor(read_only=True) as cursor:
+        cursor.execute("SELECT DISTINCT service_availed FROM csm_form WHERE service_availed IS NOT NULL AND service_availed != ''")
+        services = {svc.strip() for row in cursor.fetchall() for svc in row['service_availed'].split(',') if svc.strip()}
+        cursor.execute("SELECT DISTINCT region_of_residence FROM csm_form WHERE region_of_residence IS NOT NULL AND region_of_residence != ''")
+        regions = {row['region_of_residence'] for row in cursor.fetchall()}
+        cursor.execute("SELECT DISTINCT sex FROM csm_form WHERE sex IS NOT NULL AND sex != ''")
+        genders = {row['sex'] for row in cursor.fetchall()}
+        return sorted(services), sorted(regions), sorted(genders)
+
+def get_latest_control_no(prefix):
+    """Highest control_no starting with prefix (a range on its UNIQUE index), or None."""
+    with get_db_cursor() as cursor:
+        cursor.execute("SELECT control_no FROM csm_form WHERE control_no LIKE %s ORDER BY control_no DESC LIMIT 1",
+                       (f"{prefix}%",))
+        row = cursor.fetchone()
+        return row['control_no'] if row else None
@@ -0,0 +1,66 @@
+import json
+import struct
+import numpy as np
+
+# Binary embedding column layout (face_embeddings.embedding_blob,
+# admins.face_embedding_blob):
+#
+#   byte 0     format/version  (FORMAT_F32 or FORMAT_F64)
+#   bytes 1-2  vector dimension, little-endian uint16
+#   rest       one or more vectors as raw little-endian floats, row-major
+#
+# A 128-d float32 vector is 515 bytes against ~2.5 KB of JSON text.
+FORMAT_F32 = 1
+FORMAT_F64 = 2
+
+_HEADER = struct.Struct("<BH")
+_DTYPES = {
+    FORMAT_F32: np.dtype("<f4"),
+    FORMAT_F64: np.dtype("<f8"),
+}
+
+
+def encode_embeddings(vectors, fmt=FORMAT_F32):
+    """Pack one vector or a list of vectors into the binary column format."""
+    dtype = _DTYPES[fmt]
+    arr = np.asarray(vectors, dtype=dtype)
+    if arr.ndim == 1:
+        arr = arr.reshape(1, -1)
+    return _HEADER.pack(fmt, arr.shape[1]) + arr.tobytes()
+
+
+def decode_embeddings(blob):
+    """Unpack a binary column value into an (n, dim) float array."""
+    blob = bytes(blob)
+    fmt, dim = _HEADER.unpack_from(blob)
+    if fmt not in _DTYPES:
+        raise ValueError(f"unknown embedding format byte {fmt}")
+    arr = np.frombuffer(blob, dtype=_DTYPES[fmt], offset=_HEADER.size)
+    return arr.reshape(-1, dim)
+
+
+def parse_embedding_json(emb_data):
+    """Decode a legacy JSON column value (str, bytes or already-parsed list)."""
+    if isinstance(emb_data, (bytes, bytearray)):
+        return json.loads(emb_data.decode('utf-8'))
+    if isinstance(emb_data, str):
+        return json.loads(emb_data)
+    return emb_data
+
+
+def read_stored_embeddings(blob, emb_json):
+    """
+    Return stored vectors as an (n, dim) array, preferring the binary column
+    and falling back to the JSON column for rows not yet migrated. Handles
+    both a single JSON vector and the admins' list-of-lists. Returns None if
+    neither column holds data.
+    """
+    if blob:
+        return decode_embeddings(blob)
+    data = parse_embedding_json(emb_json)
+    if not data:
+        return None
+    arr = np.asarray(data, dtype=np.float64)
+    if arr.ndim == 1:
+        arr = arr.reshape(1, -1)
+    return arr
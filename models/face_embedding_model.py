@@ -1,18 +1,117 @@
+import os
 import json
 from db import get_db, get_db_cursor
 import numpy as np
 import mysql.connector
 from datetime import datetime
+from models.face_gallery import FaceGallery, index_from_env
+from models.embedding_codec import encode_embeddings, read_stored_embeddings
+
+
+# Distance under which /verify_identity accepts a claimed identity; the same
+# default as find_best_match so both kiosk paths agree.
+VERIFY_THRESHOLD = float(os.getenv("FACE_VERIFY_THRESHOLD", "0.7"))
+
+
+def _normalize_client_id(client_id):
+    return client_id.upper() if isinstance(client_id, str) else client_id
+
+def _decode_row(row):
+    # Rows written before scripts/migrate_embedding_blob.py only have the JSON
+    # column; newer rows only have the binary one. Callers always get a list
+    # under 'embedding_json'.
+    vectors = read_stored_embeddings(row.pop('embedding_blob', None), row.get('embedding_json'))
+    row['embedding_json'] = vectors[0].tolist() if vectors is not None else None
+    return row
+
+def _load_gallery_rows():
+    with get_db_cursor() as cursor:
+        cursor.execute("SELECT id, client_id, embedding_blob, embedding_json FROM face_embeddings")
+        rows = cursor.fetchall()
+    for r in rows:
+        try:
+            vectors = read_stored_embeddings(r.get('embedding_blob'), r.get('embedding_json'))
+        except ValueError as e:
+            print(f"Error processing embedding for {r.get('client_id')}: {e}")
+            continue
+        if vectors is not None:
+            yield r['id'], _normalize_client_id(r['client_id']), vectors[0]
+
+# Process-wide gallery of client embeddings used by find_best_match. The write
+# paths below keep it in step with MySQL instead of re-reading the table.
+face_gallery = FaceGallery(_load_gallery_rows, index=index_from_env())
+
+# Called with a client_id after that client's stored embeddings changed, or
+# with None when any of them may have (e.g. a restore). Unlike
+# face_gallery.subscribe this fires whether or not this process has loaded
+# the gallery, so it can reach caches and an out-of-process face server.
+_change_listeners = []
+
+def on_embeddings_changed(listener):
+    _change_listeners.append(listener)
+
+def notify_embeddings_changed(client_id):
+    for listener in _change_listeners:
+        try:
+            listener(_normalize_client_id(client_id))
+        except Exception as e:
+            print(f"Embedding change listener failed for {client_id}: {e}")
+
+def reload_client_embeddings(client_id):
+    """Re-read one client's rows into the gallery (None: reload everything)."""
+    if client_id is None:
+        face_gallery.invalidate()
+        return
+    client_id = _normalize_client_id(client_id)
+    with get_db_cursor() as cursor:
+        cursor.execute("SELECT id, embedding_blob, embedding_json FROM face_embeddings WHERE client_id = %s ORDER BY id",
+                       (client_id,))
+        rows = cursor.fetchall()
+    row_ids, vectors = [], []
+    for r in rows:
+        stored = read_stored_embeddings(r.get('embedding_blob'), r.get('embedding_json'))
+        if stored is not None:
+            row_ids.append(r['id'])
+            vectors.append(stored[0])
+    if row_ids:
+        face_gallery.replace_owner(client_id, row_ids, vectors)
+    else:
+        face_gallery.remove_owner(client_id)
 
 def add_face_embedding(client_id, embedding_list):
+    client_id = _normalize_client_id(client_id)
     with get_db_cursor(commit=True) as cursor:
-        query = "INSERT INTO face_embeddings (client_id, embedding_json) VALUES (%s, %s)"
-        cursor.execute(query, (client_id.upper() if isinstance(client_id, str) else client_id, json.dumps(embedding_list)))
+        query = "INSERT INTO face_embeddings (client_id, embedding_blob) VALUES (%s, %s)"
+        cursor.execute(query, (client_id, encode_embeddings(embedding_list)))
+        row_id = cursor.lastrowid
+    face_gallery.add(row_id, client_id, embedding_list)
+    notify_embeddings_changed(client_id)
 
 
 def delete_embeddings_by_client_id(client_id):
     with get_db_cursor(commit=True) as cursor:
         cursor.execute("DELETE FROM face_embeddings WHERE client_id = %s", (client_id,))
+    face_gallery.remove_owner(_normalize_client_id(client_id))
+    notify_embeddings_changed(client_id)
+
+def replace_client_embeddings(client_id, embeddings):
+    """
+    Atomically replace all of a client's embeddings (one per captured angle).
+    The DELETE and a single executemany INSERT share one transaction, so other
+    connections see either the old set or the new one, never an empty client;
+    the in-memory gallery is swapped under its lock the same way.
+    """
+    client_id = _normalize_client_id(client_id)
+    with get_db_cursor(commit=True) as cursor:
+        cursor.execute("DELETE FROM face_embeddings WHERE client_id = %s", (client_id,))
+        if embeddings:
+            cursor.executemany("INSERT INTO face_embeddings (client_id, embedding_blob) VALUES (%s, %s)",
+                               [(client_id, encode_embeddings(e)) for e in embeddings])
+        cursor.execute("SELECT id FROM face_embeddings WHERE client_id = %s ORDER BY id", (client_id,))
+        row_ids = [r['id'] for r in cursor.fetchall()]
+    face_gallery.replace_owner(client_id, row_ids, embeddings)
+    notify_embeddings_changed(client_id)
+    return len(row_ids)
 
 def update_face_embedding(client_id, embedding_list):
     # For a full update where we replace all embeddings (e.g. from edit page with 3 angles),
@@ -30,102 +129,173 @@ def get_embedding_by_client_id(client_id):
         row = cursor.fetchone()
         if row:
             row['employee_id'] = row['client_id']
-            emb_data = row.get('embedding_json')
-            if isinstance(emb_data, (bytes, bytearray)):
-                row['embedding_json'] = json.loads(emb_data.decode('utf-8'))
-            elif isinstance(emb_data, str):
-                row['embedding_json'] = json.loads(emb_data)
+            _decode_row(row)
         return row
 
 def find_best_match(embedding_list, threshold=0.7):
-    with get_db_cursor() as cursor:
-        cursor.execute("SELECT client_id, embedding_json FROM face_embeddings")
-        
-        target = np.array(embedding_list)
-        best_id = None
-        best_distance = None
-        count = 0
-        
-        for r in cursor.fetchall():
-            count += 1
-            try:
-                stored_emb = r.get('embedding_json')
-                if isinstance(stored_emb, (bytes, bytearray)):
-                    emb = np.array(json.loads(stored_emb.decode('utf-8')))
-                elif isinstance(stored_emb, str):
-                    emb = np.array(json.loads(stored_emb))
-                else:
-                    emb = np.array(stored_emb)
-                    
-                dist = np.linalg.norm(emb - target)
-                if best_distance is None or dist < best_distance:
-                    best_distance = float(dist)
-                    best_id = r.get('client_id')
-            except Exception as e:
-                print(f"Error processing embedding for {r.get('client_id')}: {e}")
-                continue
+    best_id, best_distance = face_gallery.search(embedding_list)
 
-    print(f"Face Match Debug: Checked {count} embeddings. Best ID: {best_id}, Best Dist: {best_distance}, Threshold: {threshold}")
+    print(f"Face Match Debug: Checked {len(face_gallery)} embeddings. Best ID: {best_id}, Best Dist: {best_distance}, Threshold: {threshold}")
 
     if best_distance is not None and best_distance <= threshold:
         return best_id, best_distance
     return None, None
 
+def find_best_matches(embeddings, threshold=0.7):
+    """
+    find_best_match for every face found in one frame, scored against the
+    gallery in one batched pass. Returns one (client_id, distance) per
+    embedding, or (None, None) where nothing is within threshold. A client
+    matched by several faces keeps only the closest one.
+    """
+    ranked = face_gallery.search_many(embeddings)
+    closest = {}
+    for i, (client_id, distance) in enumerate(ranked):
+        if distance is not None and distance <= threshold:
+            if client_id not in closest or distance < ranked[closest[client_id]][1]:
+                closest[client_id] = i
+    keep = set(closest.values())
+    return [ranked[i] if i in keep else (None, None) for i in range(len(ranked))]
+
+def find_top_k(embedding_list, k=1, threshold=0.7):
+    """
+    Rank the k nearest clients for one probe embedding, one entry per client
+    (its closest angle). Returns (matches, margin): matches is a list of
+    (client_id, distance) within threshold, nearest first; margin is the
+    second-best client's distance minus the best one's, or None when the
+    gallery holds fewer than two clients. A small margin means a near-tie.
+    """
+    ranked = face_gallery.search_top_k(embedding_list, k=max(k, 2))
+    margin = ranked[1][1] - ranked[0][1] if len(ranked) > 1 else None
+    matches = [(cid, dist) for cid, dist in ranked[:k] if dist <= threshold]
+    return matches, margin
+
+def verify_client_face(client_id, embedding_list, threshold=VERIFY_THRESHOLD):
+    """
+    1:1 check of a probe embedding against one client's stored embeddings
+    (one indexed SELECT by client_id; the gallery is not scanned). Returns
+    (matched, distance to the client's closest angle); distance is None when
+    the client has no stored embeddings.
+    """
+    vectors = [doc['embedding_json'] for doc in get_embeddings_by_client_id(client_id)
+               if doc.get('embedding_json') is not None]
+    if not vectors:
+        return False, None
+    distance = float(np.min(np.linalg.norm(np.asarray(vectors, dtype=np.float64)
+                                           - np.asarray(embedding_list, dtype=np.float64), axis=1)))
+    return distance <= threshold, distance
+
 def get_embeddings_by_client_id(client_id):
     with get_db_cursor() as cursor:
         cursor.execute("SELECT * FROM face_embeddings WHERE client_id = %s", (client_id,))
         rows = cursor.fetchall()
         for row in rows:
-            emb_data = row.get('embedding_json')
-            if isinstance(emb_data, (bytes, bytearray)):
-                 row['embedding_json'] = json.loads(emb_data.decode('utf-8'))
-            elif isinstance(emb_data, str):
-                 row['embedding_json'] = json.loads(emb_data)
+            _decode_row(row)
         return rows
 
-def improve_client_embedding(client_id, new_embedding, match_threshold=0.5, merge_threshold=0.25, max_embeddings=3):
-    existing_docs = get_embeddings_by_client_id(client_id)
-    
-    if not existing_docs:
-        add_face_embedding(client_id, new_embedding)
-        return "added_initial"
-
-    target = np.array(new_embedding)
-    closest_doc = None
-    closest_dist = float('inf')
-    
-    for doc in existing_docs:
-        emb = np.array(doc.get('embedding_json'))
-        dist = np.linalg.norm(emb - target)
-        if dist < closest_dist:
-            closest_dist = dist
-            closest_doc = doc
-            closest_emb = emb
+def _plan_improvement(existing, target, match_threshold, merge_threshold, max_embeddings):
+    """
+    Decide how one new sample refines a client's embeddings.
+
+    `existing` is a list of [row_id, vector] (row_id None for rows not yet
+    inserted). Returns (result, index into existing or None, new vector).
+    """
+    if not existing:
+        return "added_initial", None, target
+
+    dists = [np.linalg.norm(vec - target) for _, vec in existing]
+    closest = int(np.argmin(dists))
+    closest_dist = dists[closest]
+    closest_emb = existing[closest][1]
 
     if closest_dist > match_threshold:
         if closest_dist > 0.75: 
-             return "rejected_outlier"
+             return "rejected_outlier", None, None
 
-    # For update/insert we'll use a new cursor context
-    
     if closest_dist < merge_threshold:
-        with get_db_cursor(commit=True) as cursor:
-            new_vec = (closest_emb * 0.8) + (target * 0.2)
-            cursor.execute("UPDATE face_embeddings SET embedding_json = %s, updated_at = %s WHERE id = %s",
-                           (json.dumps(new_vec.tolist()), datetime.now(), closest_doc['id']))
-            return "merged_existing"
-
-    if len(existing_docs) < max_embeddings:
-        with get_db_cursor(commit=True) as cursor:
-            query = "INSERT INTO face_embeddings (client_id, embedding_json) VALUES (%s, %s)"
-            cursor.execute(query, (client_id.upper(), json.dumps(new_embedding)))
-            return "added_new_variant"
-
-    if closest_doc:
-        with get_db_cursor(commit=True) as cursor:
-            new_vec = (closest_emb * 0.7) + (target * 0.3)
-            cursor.execute("UPDATE face_embeddings SET embedding_json = %s, updated_at = %s WHERE id = %s",
-                           (json.dumps(new_vec.tolist()), datetime.now(), closest_doc['id']))
-            return "merged_limit_reached"
-
-    return "no_action"
+        return "merged_existing", closest, (closest_emb * 0.8) + (target * 0.2)
+
+    if len(existing) < max_embeddings:
+        return "added_new_variant", None, target
+
+    return "merged_limit_reached", closest, (closest_emb * 0.7) + (target * 0.3)
+
+def improve_client_embeddings(samples, match_threshold=0.5, merge_threshold=0.25, max_embeddings=3):
+    """
+    Apply a batch of learning samples, [(client_id, embedding), ...], in one
+    transaction. The clients' embedding rows are read with SELECT ... FOR
+    UPDATE so two workers (or processes) learning the same client serialize
+    instead of overwriting each other. Samples for the same client are
+    applied in order to an in-memory copy, so each touched row is written
+    once per batch.
+
+    Samples of clients that no longer exist (deleted since the scan) get
+    "unknown_client" and are dropped, so their foreign key cannot fail and
+    roll back everyone else's samples.
+
+    Returns one result string per sample, in order.
+    """
+    by_client = {_normalize_client_id(client_id): [] for client_id, _ in samples}
+    results = []
+    with get_db_cursor(commit=True) as cursor:
+        placeholders = ", ".join(["%s"] * len(by_client))
+        # a shared lock is enough to stop the client being deleted before its
+        # rows are written, without blocking check-ins that update the client
+        cursor.execute(f"SELECT client_id FROM clients WHERE client_id IN ({placeholders}) LOCK IN SHARE MODE",
+                       list(by_client))
+        known = {_normalize_client_id(row['client_id']) for row in cursor.fetchall()}
+        cursor.execute(f"SELECT id, client_id, embedding_blob, embedding_json FROM face_embeddings "
+                       f"WHERE client_id IN ({placeholders}) ORDER BY id FOR UPDATE", list(by_client))
+        for row in cursor.fetchall():
+            try:
+                vectors = read_stored_embeddings(row.get('embedding_blob'), row.get('embedding_json'))
+            except ValueError as e:
+                print(f"Error processing embedding for {row.get('client_id')}: {e}")
+                continue
+            if vectors is not None:
+                by_client[_normalize_client_id(row['client_id'])].append([row['id'], vectors[0].astype(np.float64)])
+
+        # rows changed by this batch, keyed by identity: (client_id, [row_id, vector])
+        dirty = {}
+        for client_id, embedding in samples:
+            client_id = _normalize_client_id(client_id)
+            if client_id not in known:
+                results.append("unknown_client")
+                continue
+            existing = by_client[client_id]
+            target = np.asarray(embedding, dtype=np.float64)
+            result, idx, new_vec = _plan_improvement(existing, target, match_threshold, merge_threshold, max_embeddings)
+            if idx is not None:
+                existing[idx][1] = new_vec
+                dirty[id(existing[idx])] = (client_id, existing[idx])
+            elif new_vec is not None:
+                entry = [None, new_vec]
+                existing.append(entry)
+                dirty[id(entry)] = (client_id, entry)
+            results.append(result)
+
+        changed = list(dirty.values())
+        updated = [(row_id, vec) for _, (row_id, vec) in changed if row_id is not None]
+        if updated:
+            now = datetime.now()
+            cursor.executemany("UPDATE face_embeddings SET embedding_blob = %s, embedding_json = NULL, updated_at = %s WHERE id = %s",
+                               [(encode_embeddings(vec), now, row_id) for row_id, vec in updated])
+        inserted = []
+        for client_id, entry in changed:
+            if entry[0] is None:
+                cursor.execute("INSERT INTO face_embeddings (client_id, embedding_blob) VALUES (%s, %s)",
+                               (client_id, encode_embeddings(entry[1])))
+                entry[0] = cursor.lastrowid
+                inserted.append((client_id, entry))
+
+    # only after commit, so the gallery never holds rows that were rolled back
+    for row_id, vec in updated:
+        face_gallery.update(row_id, vec)
+    for client_id, (row_id, vec) in inserted:
+        face_gallery.add(row_id, client_id, vec)
+    for client_id in {client_id for client_id, _ in changed}:
+        notify_embeddings_changed(client_id)
+    return results
+
+def improve_client_embedding(client_id, new_embedding, match_threshold=0.5, merge_threshold=0.25, max_embeddings=3):
+    return improve_client_embeddings([(client_id, new_embedding)], match_threshold, merge_threshold, max_embeddings)[0]
@@ -0,0 +1,340 @@
+import os
+import time
+import threading
+import numpy as np
+from models.face_ivf import IVFIndex
+
+EMBEDDING_DIM = 128
+
+# Seconds before the gallery is re-read from MySQL. 0 disables the refresh,
+# which is right for a single waitress process; set it when several worker
+# processes write embeddings so each one eventually sees the others' changes.
+GALLERY_TTL = float(os.getenv("FACE_GALLERY_TTL", "0"))
+
+# Search backend for large galleries: "exact" (brute force, default) or "ivf"
+# (approximate, see models/face_ivf.py). Pick FACE_IVF_NPROBE with
+# scripts/benchmark_face_index.py so recall stays at the level you need.
+FACE_INDEX = os.getenv("FACE_INDEX", "exact").lower()
+FACE_IVF_NLIST = int(os.getenv("FACE_IVF_NLIST", "0"))
+FACE_IVF_NPROBE = int(os.getenv("FACE_IVF_NPROBE", "8"))
+FACE_IVF_MIN_ROWS = int(os.getenv("FACE_IVF_MIN_ROWS", "20000"))
+
+
+def index_from_env():
+    """Return the configured approximate index, or None for exact search."""
+    if FACE_INDEX == "ivf":
+        return IVFIndex(nlist=FACE_IVF_NLIST, nprobe=FACE_IVF_NPROBE, min_rows=FACE_IVF_MIN_ROWS)
+    return None
+
+
+class FaceGallery:
+    """
+    Process-wide in-memory copy of stored face embeddings.
+
+    All vectors live in one contiguous float32 matrix with parallel arrays of
+    database row ids and owner ids (client_id / admin id), so a query is one
+    vectorized distance computation instead of a SELECT plus a Python loop.
+
+    `loader` is a callable returning an iterable of (row_id, owner_id, embedding)
+    tuples; it is called lazily on the first query and again after invalidate().
+
+    With an `index` (IVFIndex) the index is retrained on every load and queries
+    only score rows in the probed cells; rows added later are assigned to the
+    existing cells.
+    """
+
+    def __init__(self, loader, dim=EMBEDDING_DIM, ttl=GALLERY_TTL, index=None):
+        self._loader = loader
+        self._dim = dim
+        self._ttl = ttl
+        self.index = index
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._listeners = []
+        self._clear()
+
+    def _clear(self):
+        self._matrix = np.empty((0, self._dim), dtype=np.float32)
+        self._sq_norms = np.empty(0, dtype=np.float32)
+        self._row_ids = np.empty(0, dtype=np.int64)
+        self._owners = np.empty(0, dtype=object)
+        # Dense integer code per owner, so per-owner reductions stay vectorized.
+        self._codes = np.empty(0, dtype=np.int64)
+        self._owner_codes = {}
+        # IVF cell per row; only meaningful while self.index is trained
+        self._cells = np.empty(0, dtype=np.int32)
+        self._size = 0
+
+    def __len__(self):
+        self.ensure_loaded()
+        return self._size
+
+    def subscribe(self, listener):
+        """
+        Call listener(owner) whenever an owner's embeddings change in the
+        gallery, or listener(None) when the whole gallery is reloaded or
+        dropped. Used to drop cached results that depend on them.
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, owner):
+        for listener in self._listeners:
+            try:
+                listener(owner)
+            except Exception as e:
+                print(f"Face Gallery: change listener failed: {e}")
+
+    # ── loading ──────────────────────────────────────────────────────────────
+
+    def ensure_loaded(self):
+        with self._lock:
+            stale = (self._ttl > 0 and self._loaded_at is not None
+                     and time.monotonic() - self._loaded_at > self._ttl)
+            if self._loaded_at is None or stale:
+                self._load()
+
+    def _load(self):
+        rows = list(self._loader())
+        self._clear()
+        if self.index is not None:
+            # Start from an untrained copy so rows are not assigned one by one
+            # to stale cells, and a search that already took a snapshot keeps
+            # the centroids its cell ids refer to.
+            self.index = self.index.clone()
+        vectors, row_ids, owners = [], [], []
+        for row_id, owner, embedding in rows:
+            try:
+                vectors.append(self._as_vector(embedding))
+            except (ValueError, TypeError) as e:
+                print(f"Face Gallery: skipping embedding {row_id} for {owner}: {e}")
+                continue
+            row_ids.append(row_id)
+            owners.append(owner)
+        n = len(vectors)
+        self._reserve(n)
+        if n:
+            self._matrix[:n] = np.stack(vectors)
+            self._sq_norms[:n] = np.einsum('ij,ij->i', self._matrix[:n], self._matrix[:n])
+            self._row_ids[:n] = row_ids
+            self._owners[:n] = owners
+            self._codes[:n] = [self._owner_codes.setdefault(o, len(self._owner_codes)) for o in owners]
+            self._cells[:n] = 0
+        self._size = n
+        if self.index is not None:
+            self._train_index()
+        self._loaded_at = time.monotonic()
+        print(f"Face Gallery: loaded {self._size} embeddings.")
+        self._notify(None)
+
+    def _train_index(self):
+        n = self._size
+        started = time.perf_counter()
+        if self.index.train(self._matrix[:n]):
+            self._cells[:n] = self.index.assign(self._matrix[:n])
+            print(f"Face Gallery: trained IVF index with {self.index.centroids.shape[0]} cells "
+                  f"in {time.perf_counter() - started:.2f}s")
+
+    def invalidate(self):
+        """Drop the in-memory copy; the next query reloads it from the loader."""
+        with self._lock:
+            self._loaded_at = None
+            self._clear()
+        self._notify(None)
+
+    # ── in-place updates ─────────────────────────────────────────────────────
+
+    def _reserve(self, capacity):
+        if capacity <= self._matrix.shape[0]:
+            return
+        capacity = max(capacity, 2 * self._matrix.shape[0], 64)
+        matrix = np.empty((capacity, self._dim), dtype=np.float32)
+        sq_norms = np.empty(capacity, dtype=np.float32)
+        row_ids = np.empty(capacity, dtype=np.int64)
+        owners = np.empty(capacity, dtype=object)
+        codes = np.empty(capacity, dtype=np.int64)
+        cells = np.zeros(capacity, dtype=np.int32)
+        n = self._size
+        matrix[:n] = self._matrix[:n]
+        sq_norms[:n] = self._sq_norms[:n]
+        row_ids[:n] = self._row_ids[:n]
+        owners[:n] = self._owners[:n]
+        codes[:n] = self._codes[:n]
+        cells[:n] = self._cells[:n]
+        self._matrix, self._sq_norms, self._row_ids, self._owners = matrix, sq_norms, row_ids, owners
+        self._codes, self._cells = codes, cells
+
+    def _as_vector(self, embedding):
+        vec = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        if vec.shape[0] != self._dim:
+            raise ValueError(f"expected {self._dim}-d embedding, got {vec.shape[0]}")
+        return vec
+
+    def _assign_cell(self, vec):
+        if self.index is not None and self.index.is_trained:
+            return self.index.assign(vec)[0]
+        return 0
+
+    def _append(self, row_id, owner, embedding):
+        vec = self._as_vector(embedding)
+        self._reserve(self._size + 1)
+        i = self._size
+        self._matrix[i] = vec
+        self._sq_norms[i] = np.dot(vec, vec)
+        self._row_ids[i] = row_id
+        self._owners[i] = owner
+        self._codes[i] = self._owner_codes.setdefault(owner, len(self._owner_codes))
+        self._cells[i] = self._assign_cell(vec)
+        self._size += 1
+
+    def add(self, row_id, owner, embedding):
+        with self._lock:
+            if self._loaded_at is None:
+                # Not loaded yet: the row will come in with the first load.
+                return
+            self._append(row_id, owner, embedding)
+        self._notify(owner)
+
+    def update(self, row_id, embedding):
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            hits = np.flatnonzero(self._row_ids[:self._size] == row_id)
+            if not hits.size:
+                return
+            vec = self._as_vector(embedding)
+            self._matrix[hits[0]] = vec
+            self._sq_norms[hits[0]] = np.dot(vec, vec)
+            self._cells[hits[0]] = self._assign_cell(vec)
+            owner = self._owners[hits[0]]
+        self._notify(owner)
+
+    def _drop_owner(self, owner):
+        """Remove an owner's rows; the caller holds the lock. True if any were removed."""
+        n = self._size
+        keep = self._owners[:n] != owner
+        if keep.all():
+            return False
+        # Build fresh arrays rather than compacting in place so a search
+        # holding a snapshot of the old arrays stays consistent.
+        self._matrix = self._matrix[:n][keep]
+        self._sq_norms = self._sq_norms[:n][keep]
+        self._row_ids = self._row_ids[:n][keep]
+        self._owners = self._owners[:n][keep]
+        self._codes = self._codes[:n][keep]
+        self._cells = self._cells[:n][keep]
+        self._size = self._matrix.shape[0]
+        return True
+
+    def remove_owner(self, owner):
+        with self._lock:
+            if self._loaded_at is None or not self._drop_owner(owner):
+                return
+        self._notify(owner)
+
+    def replace_owner(self, owner, row_ids, embeddings):
+        """Swap all of an owner's rows for new ones as one step for concurrent searches."""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            self._drop_owner(owner)
+            for row_id, embedding in zip(row_ids, embeddings):
+                self._append(row_id, owner, embedding)
+        self._notify(owner)
+
+    # ── queries ──────────────────────────────────────────────────────────────
+
+    def _candidates(self, query):
+        """
+        Snapshot the rows a query has to score: the whole gallery for exact
+        search, or only the rows in the probed IVF cells.
+        """
+        self.ensure_loaded()
+        with self._lock:
+            n = self._size
+            matrix, sq_norms = self._matrix[:n], self._sq_norms[:n]
+            owners, codes, cells = self._owners[:n], self._codes[:n], self._cells[:n]
+            index = self.index
+        if index is None or not index.is_trained or not n:
+            return matrix, sq_norms, owners, codes
+        probed = np.zeros(index.centroids.shape[0], dtype=bool)
+        probed[index.probe(query)] = True
+        rows = np.flatnonzero(probed[cells])
+        return matrix[rows], sq_norms[rows], owners[rows], codes[rows]
+
+    def _sq_distances(self, matrix, sq_norms, query):
+        # ||a - q||^2 = ||a||^2 - 2 a.q + ||q||^2, with ||a||^2 precomputed.
+        return sq_norms - 2.0 * (matrix @ query) + np.dot(query, query)
+
+    @staticmethod
+    def _exact_distances(matrix, rows, embedding):
+        # Recompute the few winners in float64 so exact matches report ~0
+        # rather than float32 cancellation noise.
+        target = np.asarray(embedding, dtype=np.float64).reshape(-1)
+        return np.linalg.norm(matrix[rows].astype(np.float64) - target, axis=1)
+
+    def search(self, embedding):
+        """Return (owner, distance) of the nearest stored embedding, or (None, None)."""
+        query = self._as_vector(embedding)
+        matrix, sq_norms, owners, _ = self._candidates(query)
+        if not len(owners):
+            return None, None
+        sq_dist = self._sq_distances(matrix, sq_norms, query)
+        best = int(np.argmin(sq_dist))
+        distance = float(self._exact_distances(matrix, [best], embedding)[0])
+        return owners[best], distance
+
+    def search_many(self, embeddings):
+        """
+        Return the nearest (owner, distance) for each of several probes, e.g.
+        every face in one group photo, from a single matrix-matrix product
+        instead of one scan per face. (None, None) where the gallery is empty.
+        With an IVF index each probe has its own cells, so probes are searched
+        one by one.
+        """
+        if not len(embeddings):
+            return []
+        if self.index is not None:
+            return [self.search(e) for e in embeddings]
+        queries = np.stack([self._as_vector(e) for e in embeddings])
+        matrix, sq_norms, owners, _ = self._candidates(queries[0])
+        if not len(owners):
+            return [(None, None)] * len(queries)
+        sq_dist = (sq_norms[None, :] - 2.0 * (queries @ matrix.T)
+                   + np.einsum('ij,ij->i', queries, queries)[:, None])
+        best = np.argmin(sq_dist, axis=1)
+        return [(owners[b], float(self._exact_distances(matrix, [b], e)[0]))
+                for b, e in zip(best, embeddings)]
+
+    def search_top_k(self, embedding, k=1):
+        """
+        Return up to k (owner, distance) pairs, one per owner, nearest first.
+
+        Each owner may hold several embeddings (one per angle); its distance is
+        the minimum over them. All distances come from a single matrix-vector
+        product; the per-owner reduction only looks at the nearest rows,
+        widening the window until k distinct owners are found.
+        """
+        query = self._as_vector(embedding)
+        matrix, sq_norms, owners, codes = self._candidates(query)
+        n = len(owners)
+        if not n or k < 1:
+            return []
+        sq_dist = self._sq_distances(matrix, sq_norms, query)
+
+        window = min(n, 4 * k)
+        while True:
+            if window < n:
+                rows = np.argpartition(sq_dist, window - 1)[:window]
+            else:
+                rows = np.arange(n)
+            rows = rows[np.argsort(sq_dist[rows], kind='stable')]
+            # first occurrence of each owner in distance order = its minimum
+            _, first = np.unique(codes[rows], return_index=True)
+            if len(first) >= k or window >= n:
+                break
+            window = min(n, window * 4)
+
+        picked = rows[np.sort(first)[:k]]
+        distances = self._exact_distances(matrix, picked, embedding)
+        order = np.argsort(distances, kind='stable')
+        return [(owners[picked[i]], float(distances[i])) for i in order]
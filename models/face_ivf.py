@@ -0,0 +1,98 @@
+import numpy as np
+
+# Rows per block when computing row-to-centroid distances, to bound the size
+# of the temporary (block, nlist) matrix during training and assignment.
+_BLOCK = 8192
+
+
+class IVFIndex:
+    """
+    Inverted-file coarse quantizer for FaceGallery, in plain NumPy.
+
+    k-means centroids split the embedding space into `nlist` cells. Every
+    gallery row is tagged with the cell of its nearest centroid; a query only
+    scores rows in its `nprobe` nearest cells, trading a little recall for
+    touching roughly nprobe / nlist of the gallery.
+
+    With nlist=0 the cell count is picked at train time as ~sqrt(rows).
+    Galleries smaller than `min_rows` are not worth indexing and are searched
+    exactly (is_trained stays False).
+    """
+
+    def __init__(self, nlist=0, nprobe=8, min_rows=20000, iters=10, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_rows = min_rows
+        self.iters = iters
+        self.seed = seed
+        self.centroids = None
+        self._centroid_sq = None
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def clone(self):
+        """Untrained copy with the same settings."""
+        return IVFIndex(self.nlist, self.nprobe, self.min_rows, self.iters, self.seed)
+
+    def reset(self):
+        self.centroids = None
+        self._centroid_sq = None
+
+    def _set_centroids(self, centroids):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self._centroid_sq = np.einsum('ij,ij->i', self.centroids, self.centroids)
+
+    def train(self, matrix):
+        """Fit centroids on (a sample of) matrix. No-op below min_rows."""
+        n = matrix.shape[0]
+        if n < max(self.min_rows, 1):
+            self.reset()
+            return False
+        nlist = self.nlist or max(1, int(np.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(self.seed)
+        # 64 points per centroid is plenty for a coarse quantizer
+        sample_size = min(n, 64 * nlist)
+        sample = matrix[rng.choice(n, sample_size, replace=False)] if sample_size < n else matrix
+
+        self._set_centroids(sample[rng.choice(sample.shape[0], nlist, replace=False)])
+        for _ in range(self.iters):
+            labels = self.assign(sample)
+            counts = np.bincount(labels, minlength=nlist)
+            # per-cell sums via one sort + reduceat instead of a Python loop
+            order = np.argsort(labels, kind='stable')
+            sorted_labels = labels[order]
+            starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+            sums = np.add.reduceat(sample[order].astype(np.float64), starts, axis=0)
+            cells = sorted_labels[starts]
+            centroids = self.centroids.copy()
+            centroids[cells] = (sums / counts[cells][:, None]).astype(np.float32)
+            # re-seed empty cells from random sample points
+            empty = counts == 0
+            if empty.any():
+                centroids[empty] = sample[rng.choice(sample.shape[0], int(empty.sum()), replace=False)]
+            self._set_centroids(centroids)
+        return True
+
+    def assign(self, vectors):
+        """Return the nearest-centroid cell id for every row of vectors."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        labels = np.empty(vectors.shape[0], dtype=np.int32)
+        for start in range(0, vectors.shape[0], _BLOCK):
+            block = vectors[start:start + _BLOCK]
+            # ||c||^2 - 2 v.c ; ||v||^2 is constant per row and irrelevant to argmin
+            scores = self._centroid_sq - 2.0 * (block @ self.centroids.T)
+            labels[start:start + _BLOCK] = np.argmin(scores, axis=1)
+        return labels
+
+    def probe(self, query, nprobe=None):
+        """Return the ids of the nprobe cells nearest to a single query vector."""
+        nprobe = min(nprobe or self.nprobe, self.centroids.shape[0])
+        scores = self._centroid_sq - 2.0 * (self.centroids @ query)
+        if nprobe >= scores.shape[0]:
+            return np.arange(scores.shape[0])
+        return np.argpartition(scores, nprobe - 1)[:nprobe]
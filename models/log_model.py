@@ -1,4 +1,4 @@
-from db import get_db, get_db_cursor
+from db import get_db, get_db_cursor, iter_db_rows
 from datetime import datetime, timedelta
 import mysql.connector
 
@@ -28,43 +28,69 @@ def add_time_out(client_id, purpose=None):
         if log:
             cursor.execute("UPDATE logs SET time_out = %s WHERE id = %s", (now, log['id']))
 
-def get_logs(purpose=None, department=None, start_date=None, end_date=None, limit=None):
-    with get_db_cursor() as cursor:
-        sql = """SELECT l.*, c.full_name, c.department, c.gender, c.age 
-                 FROM logs l 
-                 LEFT JOIN clients c ON l.client_id = c.client_id"""
+def add_time_in_many(client_ids, purpose=None, additional_info=None):
+    """Time in several clients (e.g. a group scanned together) in one transaction."""
+    with get_db_cursor(commit=True) as cursor:
+        now = datetime.now()
+        purpose = purpose.upper() if isinstance(purpose, str) else purpose
+        info = (additional_info or "").upper() if isinstance(additional_info, str) else (additional_info or "")
+        query = """INSERT INTO logs (client_id, time_in, time_out, purpose, additional_info)
+                   VALUES (%s, %s, %s, %s, %s)"""
+        cursor.executemany(query, [
+            (client_id.upper() if isinstance(client_id, str) else client_id, now, None, purpose, info)
+            for client_id in client_ids
+        ])
+
+def add_time_out_many(client_ids):
+    """Time out the latest active log of each client in one transaction."""
+    with get_db_cursor(commit=True) as cursor:
+        now = datetime.now()
+        for client_id in client_ids:
+            cursor.execute("SELECT id FROM logs WHERE client_id = %s AND time_out IS NULL ORDER BY time_in DESC LIMIT 1",
+                           (client_id,))
+            log = cursor.fetchone()
+            if log:
+                cursor.execute("UPDATE logs SET time_out = %s WHERE id = %s", (now, log['id']))
+
+def _logs_query(purpose=None, department=None, start_date=None, end_date=None, limit=None):
+    sql = """SELECT l.*, c.full_name, c.department, c.gender, c.age 
+             FROM logs l 
+             LEFT JOIN clients c ON l.client_id = c.client_id"""
+    
+    where_clauses = []
+    params = []
+    
+    if purpose:
+        where_clauses.append("l.purpose LIKE %s")
+        params.append(f"%{purpose}%")
+    
+    if start_date:
+        sd = datetime.strptime(start_date, "%Y-%m-%d")
+        where_clauses.append("l.time_in >= %s")
+        params.append(sd)
         
-        where_clauses = []
-        params = []
+    if end_date:
+        ed = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
+        where_clauses.append("l.time_in < %s")
+        params.append(ed)
         
-        if purpose:
-            where_clauses.append("l.purpose LIKE %s")
-            params.append(f"%{purpose}%")
+    if department:
+        where_clauses.append("c.department = %s")
+        params.append(department)
         
-        if start_date:
-            sd = datetime.strptime(start_date, "%Y-%m-%d")
-            where_clauses.append("l.time_in >= %s")
-            params.append(sd)
-            
-        if end_date:
-            ed = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
-            where_clauses.append("l.time_in < %s")
-            params.append(ed)
-            
-        if department:
-            where_clauses.append("c.department = %s")
-            params.append(department)
-            
-        if where_clauses:
-            sql += " WHERE " + " AND ".join(where_clauses)
-            
-        sql += " ORDER BY l.time_in DESC"
+    if where_clauses:
+        sql += " WHERE " + " AND ".join(where_clauses)
         
-        if limit and limit != 'all':
-            sql += " LIMIT %s"
-            params.append(int(limit))
+    sql += " ORDER BY l.time_in DESC"
+    
+    if limit and limit != 'all':
+        sql += " LIMIT %s"
+        params.append(int(limit))
+    return sql, params
 
-        cursor.execute(sql, params)
+def get_logs(purpose=None, department=None, start_date=None, end_date=None, limit=None):
+    with get_db_cursor(read_only=True) as cursor:
+        cursor.execute(*_logs_query(purpose, department, start_date, end_date, limit))
         rows = cursor.fetchall()
         
         results = []
@@ -74,8 +100,14 @@ def get_logs(purpose=None, department=None, start_date=None, end_date=None, limi
             
         return results
 
+def iter_logs(purpose=None, department=None, start_date=None, end_date=None, limit=None):
+    """Like get_logs, but yields rows from a streaming cursor (for large reports)."""
+    for row in iter_db_rows(*_logs_query(purpose, department, start_date, end_date, limit), read_only=True):
+        row['id'] = str(row['id'])
+        yield row
+
 def get_logs_by_day(days=14):
-    with get_db_cursor() as cursor:
+    with get_db_cursor(read_only=True) as cursor:
         start_date = datetime.now() - timedelta(days=days)
         
         sql = """SELECT DATE_FORMAT(time_in, '%Y-%m-%d') as day_key, 
@@ -90,7 +122,7 @@ def get_logs_by_day(days=14):
         return cursor.fetchall()
 
 def get_department_counts():
-    with get_db_cursor() as cursor:
+    with get_db_cursor(read_only=True) as cursor:
         sql = """SELECT IFNULL(c.department, 'Unspecified') as department, COUNT(*) as cnt 
                  FROM logs l 
                  LEFT JOIN clients c ON l.client_id = c.client_id 
@@ -101,7 +133,7 @@ def get_department_counts():
         return cursor.fetchall()
 
 def get_purpose_counts():
-    with get_db_cursor() as cursor:
+    with get_db_cursor(read_only=True) as cursor:
         # Select all purposes (ignoring NULL/empty)
         sql = "SELECT purpose FROM logs WHERE purpose IS NOT NULL AND purpose != ''"
         cursor.execute(sql)
@@ -126,7 +158,7 @@ def get_purpose_counts():
         return rows_reformatted
 
 def get_total_logs():
-    with get_db_cursor() as cursor:
+    with get_db_cursor(read_only=True) as cursor:
         cursor.execute("SELECT COUNT(*) as cnt FROM logs")
         result = cursor.fetchone()
         return result['cnt']
@@ -2,7 +2,7 @@
 import sys
 import threading
 import time
-from db import get_db, get_db_cursor
+from db import get_db, get_db_cursor, pool_stats
 
 def worker(idx):
     try:
@@ -32,4 +32,5 @@ for t in threads:
     t.join()
 
 print("\nTest complete.")
+print(f"Pool stats: {pool_stats()}")
 print("If all 15 workers reported 'Got connection' and 'Encountered error', the pool is working and connections are being released correctly.")
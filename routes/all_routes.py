@@ -1,21 +1,29 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session, get_flashed_messages
-from db import get_db
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session, get_flashed_messages, current_app
+from flask import Response, stream_template, stream_with_context
+from db import get_db, pool_stats, read_your_writes
 from functools import wraps
 from models.admin_model import add_admin, get_admin_by_email, verify_admin_credentials, get_admin_by_id, update_admin_password, verify_admin_pin
 from models.client_model import *
 from models.client_model import search_clients
-from models.face_embedding_model import add_face_embedding, find_best_match, update_face_embedding, improve_client_embedding, delete_embeddings_by_client_id
+from models.face_embedding_model import add_face_embedding, find_best_match, update_face_embedding, delete_embeddings_by_client_id, replace_client_embeddings, on_embeddings_changed, face_gallery
 from models.admin_model import find_best_admin_match
-from models.log_model import add_time_in, add_time_out, get_logs
-from models.csm_form_model import insert_csm_form, get_csm_forms_filtered
+from models.log_model import add_time_in, add_time_out, add_time_in_many, add_time_out_many, get_logs, iter_logs
+from models.csm_form_model import insert_csm_form, get_csm_forms_filtered, iter_csm_forms_filtered, get_csm_filter_options, get_latest_control_no
 from models.client_model import get_departments
 from models.log_model import get_logs_by_day, get_department_counts, get_purpose_counts, get_total_logs
 from models.client_model import get_client_count
+from services.face_encoder import EncoderBusy
+from services.face_service import face_service
+from services.face_detect import quality_issues
+from services.embedding_tokens import embedding_tokens
+from services.learning_queue import learning_queue
+from services.frame_cache import identify_cache, frame_hash
+from services.warmup import ready as warmup_ready, state as warmup_state
+from services.photo_decode import decode_photo_data, accept_photo_bytes, PhotoTooLarge, PHOTO_MAX_BYTES, stats as photo_decode_stats
 import os
-import base64
 import re
-import io
-import face_recognition
+import csv
+from io import StringIO
 import numpy as np
 from datetime import datetime
 import subprocess
@@ -23,6 +31,118 @@ import sys
 
 client_bp = Blueprint("client", __name__)
 
+# Upper bound for the optional `k` parameter of /identify
+MAX_IDENTIFY_K = 10
+# Most clients /log_action accepts in one group check-in
+MAX_GROUP_SIZE = 20
+
+# Cached /identify results depend on the matched client's embeddings.
+face_gallery.subscribe(identify_cache.invalidate_owner)
+on_embeddings_changed(identify_cache.invalidate_owner)
+# A shared face server keeps its own gallery; tell it what this process wrote.
+if face_service.remote:
+    on_embeddings_changed(face_service.client_changed)
+
+
+def encoder_busy_response(err):
+    # Fast 503 for kiosk endpoints when the face encoder queue is full
+    message = str(err)
+    resp = jsonify({'ok': False, 'error': message, 'message': message})
+    resp.status_code = 503
+    resp.headers['Retry-After'] = str(err.retry_after)
+    return resp
+
+
+PHOTO_MIMETYPES = ('image/jpeg', 'image/png')
+
+
+def request_photo_bytes(field='photo_data'):
+    """
+    Encoded image bytes of the frame posted to a kiosk endpoint, or None.
+
+    Accepted, cheapest first: a raw image/jpeg (or image/png) request body, a
+    multipart file part named `field` (canvas.toBlob on the kiosk pages), or
+    the older base64 data URL in a form/JSON field of the same name.
+    """
+    if request.mimetype in PHOTO_MIMETYPES:
+        if request.content_length and request.content_length > PHOTO_MAX_BYTES:
+            raise PhotoTooLarge(request.content_length)
+        return accept_photo_bytes(request.get_data(cache=False)) or None
+
+    upload = request.files.get(field)
+    if upload:
+        # read one byte past the limit so oversized parts are caught without
+        # buffering them whole
+        return accept_photo_bytes(upload.read(PHOTO_MAX_BYTES + 1)) or None
+
+    data = request.get_json(silent=True) if request.is_json else None
+    photo_data = (data or {}).get(field) or request.form.get(field)
+    return decode_photo_data(photo_data) if photo_data else None
+
+
+def encode_face_angles(photos, label):
+    """
+    Decode the captured angle photos (center, left, right) and encode them in
+    parallel on the encoder pool. Returns (image bytes per photo, embeddings
+    of the photos where a face was found).
+    """
+    images = []
+    for p_data in photos:
+        try:
+            images.append(decode_photo_data(p_data) if p_data else None)
+        except Exception as e:
+            print(f"Error decoding face image for {label}: {e}")
+            images.append(None)
+
+    try:
+        # registration waits for free encoder slots rather than failing fast
+        results = face_service.encode_many(images, block=True)
+    except Exception as e:
+        # one bad angle fails the whole batch: encode the angles one by one
+        # so the others still count
+        print(f"Error processing face images for {label}, retrying each angle: {e}")
+        results = []
+        for image_bytes in images:
+            try:
+                results.append(face_service.encode(image_bytes, block=True) if image_bytes else None)
+            except Exception as e:
+                print(f"Error processing face image for {label}: {e}")
+                results.append(None)
+
+    embeddings = []
+    for encodings in results:
+        if encodings:
+            embeddings.append(list(encodings[0]))
+        elif encodings is not None:
+            print(f"Warning: No face detected in one of the captured angles for {label}")
+    return images, embeddings
+
+
+def save_profile_photo(folder, name, image_bytes):
+    target_dir = os.path.join(os.getcwd(), folder)
+    os.makedirs(target_dir, exist_ok=True)
+    with open(os.path.join(target_dir, f"{name}.jpg"), "wb") as f:
+        f.write(image_bytes)
+
+
+def stream_csv(header, rows, filename, chunk_size=64 * 1024):
+    # CSV written through a small buffer that is flushed every ~64 KB, so an
+    # export of any size is never held in memory whole.
+    def generate():
+        buffer = StringIO()
+        writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() >= chunk_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    return Response(stream_with_context(generate()), mimetype='text/csv; charset=utf-8',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
 
 def admin_required(f):
     @wraps(f)
@@ -38,6 +158,10 @@ def admin_required(f):
 def client_data():
     search = request.args.get('search', '')
     limit = request.args.get('limit', '25')
+    if limit == 'all':
+        # every client: render rows as they come off a streaming cursor
+        return stream_template("clients/client_data.html", clients=iter_clients_filtered(search=search, limit=limit),
+                               search=search, limit=limit)
     clients = get_clients_filtered(search=search, limit=limit)
     return render_template("clients/client_data.html", clients=clients, search=search, limit=limit)
 
@@ -55,6 +179,13 @@ def client_data_ajax():
 def home():
     return render_template("index.html", year=datetime.now().year)
 
+@client_bp.route("/healthz/ready")
+def healthz_ready():
+    # 503 until the face engine and galleries are loaded (see services/warmup.py)
+    if warmup_ready():
+        return jsonify({'ready': True}), 200
+    return jsonify(warmup_state()), 503
+
 @client_bp.route("/api/check-db")
 def check_db_route():
     try:
@@ -156,64 +287,20 @@ def add():
         if not photo_center:
             photo_center = request.form.get("photo_data")
 
-        processed_count = 0
-
-        # Helper to process an image: save optional file, add embedding
-        def process_face_image(p_data, cid, save_as_main=False):
-            if not p_data: return False
-            try:
-                # extract base64 payload
-                m = re.match(r"data:(image/\w+);base64,(.*)", p_data)
-                if m:
-                    img_b64 = m.group(2)
-                else:
-                    img_b64 = p_data.split(",", 1)[1] if "," in p_data else p_data
-
-                image_bytes = base64.b64decode(img_b64)
-
-                # Save file if it's the main (center) image
-                file_path = None
-                if save_as_main:
-                    clients_dir = os.path.join(os.getcwd(), "Clients")
-                    os.makedirs(clients_dir, exist_ok=True)
-                    file_path = os.path.join(clients_dir, f"{cid}.jpg")
-                    with open(file_path, "wb") as f:
-                        f.write(image_bytes)
-                else:
-                    # For side images, we might not save them permanently to disk unless needed for debug.
-                    # But face_recognition needs a file or loaded image file object.
-                    # We can use BytesIO.
-                    pass
-
-                # compute face encoding
-                # Load from bytes
-                img = face_recognition.load_image_file(io.BytesIO(image_bytes))
-                encodings = face_recognition.face_encodings(img)
-                if encodings:
-                    embedding = list(encodings[0])
-                    add_face_embedding(cid, embedding)
-                    return True
-                else:
-                    print(f"Warning: No face detected in one of the captured angles for {cid}")
-                    return False
-            except Exception as e:
-                print(f"Error processing face image for {cid}: {e}")
-                return False
-
         if client_id:
-            # Process Center (Main)
-            if process_face_image(photo_center, client_id, save_as_main=True):
-                processed_count += 1
-            
-            # Process Left
-            if process_face_image(photo_left, client_id):
-                processed_count += 1
-                
-            # Process Right
-            if process_face_image(photo_right, client_id):
-                processed_count += 1
+            # Encode all angles in parallel, then store them in one transaction
+            images, embeddings = encode_face_angles([photo_center, photo_left, photo_right], client_id)
 
-            if processed_count == 0:
+            # Save the center (main) image
+            if images[0]:
+                try:
+                    save_profile_photo("Clients", client_id, images[0])
+                except Exception as e:
+                    print(f"Error saving face image for {client_id}: {e}")
+
+            if embeddings:
+                replace_client_embeddings(client_id, embeddings)
+            else:
                  flash("Warning: No faces were successfully detected and saved. You may need to update the photo later.")
 
         # If an admin performed the registration, keep the admin workflow.
@@ -268,60 +355,20 @@ def edit(id):
                 if not actual_client_id:
                      flash("Error: Could not determine Client ID for photo update.")
                 else:
-                    # 1. Clear ALL existing embeddings for this client to avoid mixing old/new or duplicates
-                    delete_embeddings_by_client_id(actual_client_id)
-
-                    processed_count = 0
-                    
-                    # Helper to process and save
-                    def process_and_add(p_data, cid, save_file=False):
-                        if not p_data: return False
-                        try:
-                            m = re.match(r"data:(image/\w+);base64,(.*)", p_data)
-                            if m:
-                                img_b64 = m.group(2)
-                            else:
-                                img_b64 = p_data.split(",", 1)[1] if "," in p_data else p_data
-                            image_bytes = base64.b64decode(img_b64)
-
-                            # Save file if Main/Center
-                            if save_file:
-                                clients_dir = os.path.join(os.getcwd(), "Clients")
-                                os.makedirs(clients_dir, exist_ok=True)
-                                file_path = os.path.join(clients_dir, f"{cid}.jpg")
-                                with open(file_path, "wb") as f:
-                                    f.write(image_bytes)
-                                # Load from file for embedding (safer/consistent with add)
-                                img = face_recognition.load_image_file(file_path)
-                            else:
-                                # Load from bytes
-                                img = face_recognition.load_image_file(io.BytesIO(image_bytes))
-
-                            encodings = face_recognition.face_encodings(img)
-                            if encodings:
-                                embedding = list(encodings[0])
-                                add_face_embedding(cid, embedding)
-                                return True
-                        except Exception as e:
-                            print(f"Error processing angle for {cid}: {e}")
-                        return False
-
-                    # Process Center (Main)
-                    if process_and_add(photo_center, actual_client_id, save_file=True):
-                        processed_count += 1
-                    
-                    # Process Left
-                    if process_and_add(photo_left, actual_client_id):
-                        processed_count += 1
-                        
-                    # Process Right
-                    if process_and_add(photo_right, actual_client_id):
-                        processed_count += 1
-
-                    if processed_count == 0:
+                    # Encode all angles in parallel; the old embeddings are only
+                    # replaced (atomically) once the new ones are ready, so the
+                    # client is never left without embeddings mid-update.
+                    images, embeddings = encode_face_angles([photo_center, photo_left, photo_right], actual_client_id)
+
+                    # Save file if Main/Center
+                    if images[0]:
+                        save_profile_photo("Clients", actual_client_id, images[0])
+
+                    if not embeddings:
                         flash("No face detected in the uploaded photo(s); embeddings not updated.")
                     else:
-                        flash(f"Photos updated. {processed_count} angle(s) processed.")
+                        replace_client_embeddings(actual_client_id, embeddings)
+                        flash(f"Photos updated. {len(embeddings)} angle(s) processed.")
 
             except Exception as e:
                 flash(f"Failed to process photo: {e}")
@@ -439,7 +486,9 @@ def today_logs():
     # return only logs for the current day where clients are still logged in (time_out IS NULL)
     try:
         today = datetime.now().strftime('%Y-%m-%d')
-        rows = get_logs(start_date=today, end_date=today)
+        # the kiosk shows this right after a check-in: it must see that write
+        with read_your_writes():
+            rows = get_logs(start_date=today, end_date=today)
         # keep only needed fields and filter out logged-out clients
         results = []
         for r in rows:
@@ -471,6 +520,21 @@ def client_log_report():
     end_date = request.args.get('end_date')
     limit = request.args.get('limit', '25')
     print_mode = request.args.get('print') == '1'
+    filters = {'purpose': purpose, 'department': department, 'start_date': start_date, 'end_date': end_date, 'limit': limit}
+
+    # CSV of the filtered logs, streamed row by row from the database
+    if request.args.get('export') == 'csv':
+        rows = ([l['id'], l['client_id'], l.get('full_name') or '', l.get('gender') or '', l.get('age') or '',
+                 l.get('department') or '', l.get('purpose') or '', l.get('additional_info') or '',
+                 l['time_in'], l.get('time_out') or '']
+                for l in iter_logs(purpose=purpose, department=department, start_date=start_date, end_date=end_date, limit=limit))
+        header = ['ID', 'Client ID', 'Full Name', 'Gender', 'Age', 'Department', 'Purpose', 'Additional Info', 'Time In', 'Time Out']
+        return stream_csv(header, rows, f"client_logs_{datetime.now():%Y-%m-%d}.csv")
+
+    # The print view only loops over the rows once, so it is streamed too
+    if print_mode:
+        return stream_template('client_log_report_print.html', filters=filters,
+                               logs=iter_logs(purpose=purpose, department=department, start_date=start_date, end_date=end_date, limit=limit))
 
     logs = get_logs(purpose=purpose, department=department, start_date=start_date, end_date=end_date, limit=limit)
 
@@ -500,13 +564,9 @@ def client_log_report():
         ''', logs=logs)
         return jsonify({'html': html})
 
-    # If print mode, render the print template
-    if print_mode:
-        return render_template('client_log_report_print.html', logs=logs, filters={'purpose': purpose, 'department': department, 'start_date': start_date, 'end_date': end_date, 'limit': limit})
-
     departments = get_departments()
     purposes = ["Receive Document/s Requested", "Submit Document/s", "Request Form/s", "Process Appointment", "Inquire", "OTHERS"]
-    return render_template('client_log_report.html', logs=logs, filters={'purpose': purpose, 'department': department, 'start_date': start_date, 'end_date': end_date, 'limit': limit}, departments=departments, purposes=purposes)
+    return render_template('client_log_report.html', logs=logs, filters=filters, departments=departments, purposes=purposes)
 
 
 @client_bp.route('/csm-report', methods=['GET', 'POST'])
@@ -561,64 +621,21 @@ def csm_report():
 
     # Handle CSV export
     if request.args.get('export') == 'csv':
-        import csv
-        from io import StringIO
-        from flask import Response
-
-        # Get all CSM forms (no filters for export)
-        all_forms = get_csm_forms_filtered()
-
-        # Generate CSV with all columns
-        output = StringIO()
-        writer = csv.writer(output, quoting=csv.QUOTE_ALL)
-
-        # Write header
+        # All CSM forms (no filters for export), streamed from the database
         header = [
             'ID', 'Control #', 'Date', 'Agency Visited', 'Client Type', 'Sex', 'Age',
             'Region of Residence', 'Email', 'Service Availed', 'Awareness of CC',
             'CC of This Office Was', 'CC Help You', 'SDQ0', 'SDQ1', 'SDQ2', 'SDQ3',
             'SDQ4', 'SDQ5', 'SDQ6', 'SDQ7', 'SDQ8', 'Suggestion', 'Created At'
         ]
-        writer.writerow(header)
-
-        # Write data rows
-        for form in all_forms:
-            row = [
-                form.get('id', ''),
-                form.get('control_no', ''),
-                form.get('date', ''),
-                form.get('agency_visited', ''),
-                form.get('client_type', ''),
-                form.get('sex', ''),
-                form.get('age', ''),
-                form.get('region_of_residence', ''),
-                form.get('email', ''),
-                form.get('service_availed', ''),
-                form.get('awareness_of_cc', ''),
-                form.get('cc_of_this_office_was', ''),
-                form.get('cc_help_you', ''),
-                form.get('sdq0', ''),
-                form.get('sdq1', ''),
-                form.get('sdq2', ''),
-                form.get('sdq3', ''),
-                form.get('sdq4', ''),
-                form.get('sdq5', ''),
-                form.get('sdq6', ''),
-                form.get('sdq7', ''),
-                form.get('sdq8', ''),
-                form.get('suggestion', ''),
-                form.get('created_at', '')
-            ]
-            writer.writerow(row)
-
-        csv_content = output.getvalue()
-        output.close()
-
-        return Response(
-            csv_content,
-            mimetype='text/csv; charset=utf-8',
-            headers={'Content-Disposition': 'attachment; filename=csm_report_all.csv'}
-        )
+        fields = [
+            'id', 'control_no', 'date', 'agency_visited', 'client_type', 'sex', 'age',
+            'region_of_residence', 'email', 'service_availed', 'awareness_of_cc',
+            'cc_of_this_office_was', 'cc_help_you', 'sdq0', 'sdq1', 'sdq2', 'sdq3',
+            'sdq4', 'sdq5', 'sdq6', 'sdq7', 'sdq8', 'suggestion', 'created_at'
+        ]
+        rows = ([form.get(f, '') for f in fields] for form in iter_csm_forms_filtered())
+        return stream_csv(header, rows, 'csm_report_all.csv')
 
     # Handle CSM form filtering and reporting
     limit = request.args.get('limit', '25')
@@ -661,29 +678,8 @@ def csm_report():
         'limit': limit
     }
 
-    # Get list of unique services for dropdown (parse from all records)
-    all_forms = get_csm_forms_filtered()
-    services_set = set()
-    for form in all_forms:
-        if form.get('service_availed'):
-            # service_availed is comma-separated; split and add each
-            for svc in form['service_availed'].split(','):
-                services_set.add(svc.strip())
-    services_list = sorted(list(services_set))
-
-    # Get list of unique regions for dropdown
-    regions_set = set()
-    for form in all_forms:
-        if form.get('region_of_residence'):
-            regions_set.add(form['region_of_residence'])
-    regions_list = sorted(list(regions_set))
-
-    # Get list of unique genders for dropdown
-    genders_set = set()
-    for form in all_forms:
-        if form.get('sex'):
-            genders_set.add(form['sex'])
-    genders_list = sorted(list(genders_set))
+    # Unique services, regions and genders for the dropdowns
+    services_list, regions_list, genders_list = get_csm_filter_options()
 
     return render_template('csm_report.html', csm_forms=csm_forms, filters=filters, services=services_list, regions=regions_list, genders=genders_list)
 
@@ -715,6 +711,28 @@ def admin_chart_data():
     return jsonify({'by_day': by_day, 'department': dept, 'purpose': purpose})
 
 
+@client_bp.route('/admin/face_encoder_stats')
+@admin_required
+def face_encoder_stats():
+    # Queue depth, rejections, queue wait and encode time of the encoder pool
+    stats = face_service.stats()
+    stats['photo_decode'] = photo_decode_stats()
+    stats['learn_tokens'] = embedding_tokens.stats()
+    stats['learning_queue'] = learning_queue.stats()
+    stats['identify_cache'] = identify_cache.stats()
+    return jsonify(stats)
+
+
+@client_bp.route('/admin/db_pool_stats')
+@admin_required
+def db_pool_stats():
+    # Connections in use, checkout waits (histogram), timeouts and connection age
+    stats = pool_stats()
+    if stats is None:
+        return jsonify({'ok': False, 'error': 'Database unavailable'}), 503
+    return jsonify(stats)
+
+
 @client_bp.route('/admin/signup', methods=['GET', 'POST'])
 def admin_signup():
     if request.method == 'POST':
@@ -743,43 +761,19 @@ def admin_signup():
             flash('An account with that email already exists')
             return redirect(url_for('client.admin_signup'))
 
-        # Process photos to get embeddings
-        embeddings = []
-        
         # Photos
         photo_center = request.form.get("photo_data_center")
         photo_left = request.form.get("photo_data_left")
         photo_right = request.form.get("photo_data_right")
-        
-        def get_embedding(p_data):
-            if not p_data: return None
-            try:
-                m = re.match(r"data:(image/\w+);base64,(.*)", p_data)
-                if m:
-                    img_b64 = m.group(2)
-                else:
-                    img_b64 = p_data.split(",", 1)[1] if "," in p_data else p_data
-                image_bytes = base64.b64decode(img_b64)
-                img = face_recognition.load_image_file(io.BytesIO(image_bytes))
-                encs = face_recognition.face_encodings(img)
-                if encs:
-                    return list(encs[0])
-            except Exception as e:
-                print(f"Error processing admin photo: {e}")
-            return None
-
-        # Collect valid embeddings
-        for p in [photo_center, photo_left, photo_right]:
-            emb = get_embedding(p)
-            if emb:
-                embeddings.append(emb)
+
+        # Encode all angles in parallel and collect valid embeddings
+        images, embeddings = encode_face_angles([photo_center, photo_left, photo_right], email)
+        profile_image = images[0]
         
         # Fallback to single photo if new fields missing
         if not embeddings:
-             p_single = request.form.get("photo_data")
-             emb = get_embedding(p_single)
-             if emb:
-                 embeddings.append(emb)
+             images, embeddings = encode_face_angles([request.form.get("photo_data")], email)
+             profile_image = profile_image or images[0]
 
         if not embeddings:
             flash("No face detected in any photo. Please try again.")
@@ -789,21 +783,9 @@ def admin_signup():
 
         if new_id:
              # Save center image as profile pic
-            if photo_center or request.form.get("photo_data"):
+            if profile_image:
                 try:
-                    p_to_save = photo_center or request.form.get("photo_data")
-                    m = re.match(r"data:(image/\w+);base64,(.*)", p_to_save)
-                    if m:
-                        img_b64 = m.group(2)
-                    else:
-                        img_b64 = p_to_save.split(",", 1)[1] if "," in p_to_save else p_to_save
-                    image_bytes = base64.b64decode(img_b64)
-                    
-                    admins_dir = os.path.join(os.getcwd(), "Admins")
-                    os.makedirs(admins_dir, exist_ok=True)
-                    file_path = os.path.join(admins_dir, f"{new_id}.jpg")
-                    with open(file_path, "wb") as f:
-                        f.write(image_bytes)
+                    save_profile_photo("Admins", new_id, profile_image)
                 except Exception as e:
                     print(f"Failed to save admin profile image: {e}")
 
@@ -842,22 +824,12 @@ def admin_login():
 
 @client_bp.route('/admin/face_login', methods=['POST'])
 def admin_face_login():
-    photo_data = request.form.get('photo_data')
-    if not photo_data:
-        return jsonify({'ok': False, 'error': 'No photo_data provided'}), 400
-
     try:
-        # Extract base64
-        m = re.match(r"data:(image/\w+);base64,(.*)", photo_data)
-        if m:
-            img_b64 = m.group(2)
-        else:
-            img_b64 = photo_data.split(',', 1)[1] if ',' in photo_data else photo_data
-        image_bytes = base64.b64decode(img_b64)
+        image_bytes = request_photo_bytes()
+        if not image_bytes:
+            return jsonify({'ok': False, 'error': 'No photo_data provided'}), 400
 
-        # Load image into face_recognition
-        img = face_recognition.load_image_file(io.BytesIO(image_bytes))
-        encodings = face_recognition.face_encodings(img)
+        encodings = face_service.encode(image_bytes)
         if not encodings:
             return jsonify({'ok': False, 'error': 'No face detected'}), 200
 
@@ -869,6 +841,10 @@ def admin_face_login():
             return jsonify({'ok': True, 'status': 'pin_required'}), 200
             
         return jsonify({'ok': False, 'error': 'Face not recognized'}), 200
+    except PhotoTooLarge as e:
+        return jsonify({'ok': False, 'error': str(e)}), 413
+    except EncoderBusy as e:
+        return encoder_busy_response(e)
     except Exception as e:
         return jsonify({'ok': False, 'error': str(e)}), 500
 
@@ -948,106 +924,178 @@ def change_password():
 
 @client_bp.route('/identify', methods=['POST'])
 def identify():
-    # Expects form field 'photo_data' (data URL)
-    photo_data = request.form.get('photo_data')
-    if not photo_data:
-        print("Identify Debug: No photo_data provided")
-        return jsonify({'ok': False, 'error': 'No photo_data provided'}), 400
+    # Expects the frame as an image/jpeg body, a 'photo_data' file part or a
+    # 'photo_data' data URL field; optional 'k' (form or query) asks for the
+    # k nearest clients as 'candidates' in the response; 'kiosk_id' (a stable
+    # id per kiosk) enables the short-lived result cache. With 'multi=1' every
+    # face in the frame is matched and returned under 'faces' (group arrivals).
+    k = max(1, min(request.values.get('k', 1, type=int) or 1, MAX_IDENTIFY_K))
+    multi = request.values.get('multi') in ('1', 'true')
 
     try:
-        # Extract base64
-        import base64, re, io
-        m = re.match(r"data:(image/\w+);base64,(.*)", photo_data)
-        if m:
-            img_b64 = m.group(2)
-        else:
-            img_b64 = photo_data.split(',', 1)[1] if ',' in photo_data else photo_data
-        image_bytes = base64.b64decode(img_b64)
-
-        # Load image into face_recognition
-        from PIL import Image
-        img = face_recognition.load_image_file(io.BytesIO(image_bytes))
-        encodings = face_recognition.face_encodings(img)
-        
-        print(f"Identify Debug: Found {len(encodings)} face(encodings)")
-
-        if not encodings:
+        image_bytes = request_photo_bytes()
+        if not image_bytes:
+            print("Identify Debug: No photo_data provided")
+            return jsonify({'ok': False, 'error': 'No photo_data provided'}), 400
+
+        if multi:
+            return identify_group(image_bytes)
+
+        # Repeated taps / retries of the same frame from this kiosk reuse the
+        # last match instead of decoding, detecting and encoding again. The
+        # scope is the kiosk's own id: behind the proxy every kiosk has the
+        # same remote_addr. Callers without one are not cached.
+        frame = None
+        scope = (request.values.get('kiosk_id') or '')[:64]
+        if identify_cache.enabled and scope:
+            frame = frame_hash(image_bytes)
+            cached = identify_cache.get(scope, frame, k)
+            if cached is not None:
+                result = dict(cached['result'], cached=True)
+                result['learn_token'] = embedding_tokens.issue(result['client_id'], cached['embedding'], current_app.secret_key)
+                return jsonify(result), 200
+
+        encoding, matches, margin = face_service.identify(image_bytes, k=k)
+
+        if encoding is None:
+            print("Identify Debug: No face detected")
             return jsonify({'ok': False, 'error': 'No face detected'}), 200
 
-        encoding = list(encodings[0])
-        client_id, distance = find_best_match(encoding)
-        if client_id:
+        if matches:
+            client_id, distance = matches[0]
             cli = get_client_by_client_id(client_id)
-            print(f"Identify Debug: Best match: {client_id} ({cli.get('full_name') if cli else 'Unknown'}) with distance {distance}")
-            return jsonify({'ok': True, 'client_id': client_id, 'full_name': cli.get('full_name') if cli else None, 'gender': cli.get('gender') if cli else None, 'age': cli.get('age') if cli else None, 'distance': distance}), 200
+            print(f"Identify Debug: Best match: {client_id} ({cli.get('full_name') if cli else 'Unknown'}) with distance {distance}, margin {margin}")
+            result = {'ok': True, 'client_id': client_id, 'full_name': cli.get('full_name') if cli else None, 'gender': cli.get('gender') if cli else None, 'age': cli.get('age') if cli else None, 'distance': distance, 'margin': margin}
+            if k > 1:
+                candidates = []
+                for cid, dist in matches:
+                    c = cli if cid == client_id else get_client_by_client_id(cid)
+                    candidates.append({'client_id': cid, 'full_name': c.get('full_name') if c else None, 'distance': dist})
+                result['candidates'] = candidates
+            if frame is not None:
+                identify_cache.put(scope, frame, k, client_id, {'result': result, 'embedding': encoding})
+            # lets /learn_face reuse this embedding instead of re-encoding the frame
+            result = dict(result, learn_token=embedding_tokens.issue(client_id, encoding, current_app.secret_key))
+            return jsonify(result), 200
         else:
             print("Identify Debug: No matching client found below threshold")
             return jsonify({'ok': False, 'error': 'No matching client found'}), 200
+    except PhotoTooLarge as e:
+        return jsonify({'ok': False, 'error': str(e)}), 413
+    except EncoderBusy as e:
+        print("Identify Debug: encoder busy, rejecting scan")
+        return encoder_busy_response(e)
     except Exception as e:
         print(f"Identify Debug Error: {e}")
         return jsonify({'ok': False, 'error': str(e)}), 500
 
 
+def identify_group(image_bytes):
+    # All faces of the frame are encoded in one worker call and matched in
+    # one batched gallery pass; each matched face gets its own learn_token.
+    faces = face_service.identify_all(image_bytes)
+    if not faces:
+        print("Identify Debug: No face detected")
+        return jsonify({'ok': False, 'error': 'No face detected'}), 200
+
+    results = []
+    for box, encoding, client_id, distance in faces:
+        face = {'box': box, 'client_id': client_id, 'distance': distance}
+        if client_id is not None:
+            cli = get_client_by_client_id(client_id)
+            face.update(full_name=cli.get('full_name') if cli else None,
+                        gender=cli.get('gender') if cli else None,
+                        age=cli.get('age') if cli else None,
+                        learn_token=embedding_tokens.issue(client_id, encoding, current_app.secret_key))
+        results.append(face)
+    matched = sum(1 for f in results if f['client_id'] is not None)
+    print(f"Identify Debug: {len(results)} face(s) in frame, {matched} matched")
+    if not matched:
+        return jsonify({'ok': False, 'error': 'No matching client found', 'faces': results}), 200
+    return jsonify({'ok': True, 'faces': results, 'matched': matched}), 200
+
+
 @client_bp.route('/verify_face', methods=['POST'])
 def verify_face():
-    # Expects form field 'photo_data' (data URL)
-    photo_data = request.form.get('photo_data')
-    if not photo_data:
-        return jsonify({'ok': False, 'message': 'No photo_data provided'}), 400
-
+    # Expects an image/jpeg body, a 'photo_data' file part or data URL field
     try:
-        # Extract base64
-        import base64, re, io
-        m = re.match(r"data:(image/\w+);base64,(.*)", photo_data)
-        if m:
-            img_b64 = m.group(2)
-        else:
-            img_b64 = photo_data.split(',', 1)[1] if ',' in photo_data else photo_data
-        image_bytes = base64.b64decode(img_b64)
+        image_bytes = request_photo_bytes()
+        if not image_bytes:
+            return jsonify({'ok': False, 'message': 'No photo_data provided'}), 400
+
+        # Detection only (no landmarks / 128-d encoding): fast enough for
+        # live feedback on the registration pages.
+        detection = face_service.detect(image_bytes)
+        if not detection['faces']:
+            return jsonify({'ok': False, 'message': 'No identifiable face detected. Please ensure your face is clear and well-lit.',
+                            'frame': detection['frame'], 'faces': 0}), 200
+
+        face = detection['faces'][0]
+        issues = quality_issues(face)
+        message = issues[0] if issues else 'Face detected successfully.'
+        return jsonify({'ok': True, 'message': message, 'usable': not issues, 'issues': issues,
+                        'frame': detection['frame'], 'faces': len(detection['faces']), **face}), 200
+    except PhotoTooLarge as e:
+        return jsonify({'ok': False, 'message': str(e)}), 413
+    except EncoderBusy as e:
+        return encoder_busy_response(e)
+    except Exception as e:
+        return jsonify({'ok': False, 'message': f'Error verifying face: {str(e)}'}), 500
 
-        # Load image into face_recognition
-        from PIL import Image
-        img = face_recognition.load_image_file(io.BytesIO(image_bytes))
-        encodings = face_recognition.face_encodings(img)
-        if not encodings:
-            return jsonify({'ok': False, 'message': 'No identifiable face detected. Please ensure your face is clear and well-lit.'}), 200
 
-        # Check if face is clear (we can add more checks here if needed, e.g., face size, quality)
-        # For now, just check if at least one face is detected
-        return jsonify({'ok': True, 'message': 'Face detected successfully.'}), 200
+@client_bp.route('/verify_identity', methods=['POST'])
+def verify_identity():
+    # 1:1 check of a frame against one claimed client_id (time-out, or a
+    # client picked through /search_client). Only that client's embeddings are
+    # compared, so the cost does not grow with the gallery.
+    data = request.get_json(silent=True) if request.is_json else None
+    client_id = (data or request.values).get('client_id')
+
+    try:
+        image_bytes = request_photo_bytes()
+        if not client_id or not image_bytes:
+            return jsonify({'ok': False, 'error': 'Missing client_id or photo_data'}), 400
+
+        encoding, matched, distance = face_service.verify(client_id, image_bytes)
+        if encoding is None:
+            return jsonify({'ok': False, 'error': 'No face detected'}), 200
+        if distance is None:
+            return jsonify({'ok': False, 'error': 'No enrolled face for this client'}), 200
+        print(f"Verify Identity Debug: {client_id} distance {distance:.4f}, matched {matched}")
+        return jsonify({'ok': True, 'client_id': client_id, 'match': matched, 'distance': distance}), 200
+    except PhotoTooLarge as e:
+        return jsonify({'ok': False, 'error': str(e)}), 413
+    except EncoderBusy as e:
+        return encoder_busy_response(e)
     except Exception as e:
-        return jsonify({'ok': False, 'message': f'Error verifying face: {str(e)}'}), 500
+        print(f"Verify Identity Error: {e}")
+        return jsonify({'ok': False, 'error': str(e)}), 500
 
 
 @client_bp.route('/generate_control_no')
 def generate_control_no():
     """Generate a new control number in the format HR-S<YY>-<NextID>"""
     try:
-        with get_db_cursor() as cursor:
-            # Find the latest control_no to increment
-            # Format: HR-S<YY>-<NNN>
-            year = datetime.now().year
-            yy = str(year)[-2:]
-            prefix = f"HR-S{yy}-"
-            
-            # Find the latest one using MySQL pattern matching
-            query = "SELECT control_no FROM csm_form WHERE control_no LIKE %s ORDER BY control_no DESC LIMIT 1"
-            cursor.execute(query, (f"{prefix}%",))
-            row = cursor.fetchone()
-            
-            next_id = 1
-            if row:
-                last_no = row['control_no']
-                # extract last 3 digits
-                parts = last_no.split('-')
-                if len(parts) >= 3:
-                    try:
-                        next_id = int(parts[-1]) + 1
-                    except (ValueError, IndexError):
-                        next_id = 1
-            
-            control_no = f"{prefix}{next_id:03d}"
-            return jsonify({'control_no': control_no}), 200
+        # Format: HR-S<YY>-<NNN>
+        year = datetime.now().year
+        yy = str(year)[-2:]
+        prefix = f"HR-S{yy}-"
+
+        # Find the latest one to increment
+        last_no = get_latest_control_no(prefix)
+
+        next_id = 1
+        if last_no:
+            # extract last 3 digits
+            parts = last_no.split('-')
+            if len(parts) >= 3:
+                try:
+                    next_id = int(parts[-1]) + 1
+                except (ValueError, IndexError):
+                    next_id = 1
+
+        control_no = f"{prefix}{next_id:03d}"
+        return jsonify({'control_no': control_no}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1056,21 +1104,37 @@ def generate_control_no():
 def log_action():
     data = request.json or {}
     client_id = data.get('client_id')
+    # a group scanned together (/identify with multi=1) sends 'client_ids'
+    client_ids = data.get('client_ids')
     action = data.get('action')  # 'time_in' or 'time_out'
     purposes = data.get('purposes', [])
     additional_info = data.get('additional_info')
-    if not client_id or action not in ('time_in', 'time_out'):
+    if client_ids is not None:
+        if not isinstance(client_ids, list) or not all(isinstance(c, str) and c for c in client_ids):
+            return jsonify({'ok': False, 'error': 'client_ids must be a list of client ids'}), 400
+        client_ids = list(dict.fromkeys(client_ids))
+        if len(client_ids) > MAX_GROUP_SIZE:
+            return jsonify({'ok': False, 'error': f'At most {MAX_GROUP_SIZE} clients per group'}), 400
+    if not (client_id or client_ids) or action not in ('time_in', 'time_out'):
         return jsonify({'ok': False, 'error': 'Missing or invalid parameters'}), 400
 
     try:
         if action == 'time_in':
             # Convert list of purposes to comma-separated string
             purpose_str = ', '.join(purposes) if purposes else None
-            add_time_in(client_id, purpose_str, additional_info)
+            if client_ids:
+                add_time_in_many(client_ids, purpose_str, additional_info)
+            else:
+                add_time_in(client_id, purpose_str, additional_info)
 
         else:
             # Do not update purpose on time_out; purpose should come from the original time_in
-            add_time_out(client_id)
+            if client_ids:
+                add_time_out_many(client_ids)
+            else:
+                add_time_out(client_id)
+        if client_ids:
+            return jsonify({'ok': True, 'count': len(client_ids)}), 200
         return jsonify({'ok': True}), 200
     except Exception as e:
         return jsonify({'ok': False, 'error': str(e)}), 500
@@ -1078,38 +1142,46 @@ def log_action():
 
 @client_bp.route('/learn_face', methods=['POST'])
 def learn_face():
-    data = request.json or {}
-    client_id = data.get('client_id')
-    photo_data = data.get('photo_data')
-
-    if not client_id or not photo_data:
-        return jsonify({'ok': False, 'error': 'Missing client_id or photo_data'}), 400
+    # client_id comes from the JSON body, the form or (for a raw image/jpeg
+    # body) the query string. Either a learn_token from /identify or the
+    # frame itself (as in /identify) is required.
+    data = request.get_json(silent=True) if request.is_json else None
+    client_id = (data or request.values).get('client_id')
+    learn_token = (data or request.values).get('learn_token')
 
     try:
-        # Extract base64
-        m = re.match(r"data:(image/\w+);base64,(.*)", photo_data)
-        if m:
-            img_b64 = m.group(2)
-        else:
-            img_b64 = photo_data.split(',', 1)[1] if ',' in photo_data else photo_data
-        
-        image_bytes = base64.b64decode(img_b64)
-        
-        # Load and encode
-        img = face_recognition.load_image_file(io.BytesIO(image_bytes))
-        encodings = face_recognition.face_encodings(img)
-        
-        if encodings:
-            new_embedding = list(encodings[0])
-            # Attempt to improve the embedding
-            # We use a loose match_threshold (0.6) to ensure it's at least SOMEWHAT close to the user 
-            # before we consider adding/merging it.
-            result = improve_client_embedding(client_id, new_embedding)
-            print(f"Embedding update for {client_id}: {result}")
-            return jsonify({'ok': True, 'result': result}), 200
+        # Prefer the embedding /identify already computed for this client
+        new_embedding = None
+        if client_id and learn_token:
+            new_embedding = embedding_tokens.redeem(learn_token, client_id, current_app.secret_key)
+
+        if new_embedding is None:
+            image_bytes = request_photo_bytes()
+            if not client_id or not image_bytes:
+                if learn_token:
+                    return jsonify({'ok': False, 'error': 'Invalid or expired learn_token'}), 400
+                return jsonify({'ok': False, 'error': 'Missing client_id or photo_data'}), 400
+
+            # Load and encode
+            encodings = face_service.encode(image_bytes)
+            if encodings:
+                new_embedding = list(encodings[0])
+
+        if new_embedding is not None:
+            # Improving the stored embedding is written behind by the learning
+            # queue (merged/added in batches, see improve_client_embeddings),
+            # so the kiosk does not wait on the database here.
+            if not learning_queue.enqueue(client_id, new_embedding):
+                print(f"Learning queue full, dropped sample for {client_id}")
+                return jsonify({'ok': False, 'error': 'Learning queue full'}), 200
+            return jsonify({'ok': True, 'result': 'queued', 'queue_depth': learning_queue.depth()}), 202
         else:
             return jsonify({'ok': False, 'error': 'No face detected'}), 200
 
+    except PhotoTooLarge as e:
+        return jsonify({'ok': False, 'error': str(e)}), 413
+    except EncoderBusy as e:
+        return encoder_busy_response(e)
     except Exception as e:
         print(f"Failed to update embedding for {client_id}: {e}")
         return jsonify({'ok': False, 'error': str(e)}), 500
@@ -5,6 +5,8 @@ import json
 from datetime import datetime, date
 from flask import Blueprint, send_file, flash, redirect, url_for, current_app, session, request
 from db import get_db, get_db_cursor
+from models.face_embedding_model import face_gallery, notify_embeddings_changed
+from models.admin_model import admin_gallery
 from functools import wraps
 import mysql.connector
 
@@ -37,6 +39,10 @@ backup_bp = Blueprint('backup', __name__)
 
 TABLES = ['admins', 'clients', 'csm_form', 'face_embeddings', 'logs']
 
+# Binary columns (see models/embedding_codec.py) never decode as utf-8, so the
+# backup always holds them base64-encoded.
+BLOB_COLUMNS = {'embedding_blob', 'face_embedding_blob'}
+
 @backup_bp.route('/admin/backup/download')
 @admin_required
 def download_backup():
@@ -163,6 +169,10 @@ def restore_backup():
                                         # Convert ISO strings back to datetime if necessary?
                                         # mysql-connector usually handles ISO strings for DATETIME if format is correct,
                                         # but let's see. 
+                                        # Binary embedding columns were dumped as base64 by DateTimeEncoder
+                                        if col in BLOB_COLUMNS and isinstance(val, str):
+                                            import base64
+                                            val = base64.b64decode(val)
                                         values.append(val)
                                     rows_to_insert.append(tuple(values))
                                     
@@ -189,7 +199,11 @@ def restore_backup():
 
                 # Cleanup
                 shutil.rmtree(temp_dir)
-            
+
+            # Embeddings were replaced wholesale; reload them on the next identify
+            face_gallery.invalidate()
+            notify_embeddings_changed(None)
+            admin_gallery.invalidate()
             flash('System restored successfully')
             
         except Exception as e:
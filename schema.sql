@@ -1,3 +1,5 @@
+-- Baseline schema. Indexes and later changes are numbered migrations in
+-- scripts/migrations/, applied by scripts/migrate.py (and by init_mysql.py).
 CREATE DATABASE IF NOT EXISTS hrmo_elog_db;
 USE hrmo_elog_db;
 
@@ -10,6 +12,7 @@ CREATE TABLE IF NOT EXISTS admins (
     password_hash VARCHAR(255) NOT NULL,
     pin_hash VARCHAR(255) NULL,
     face_embedding JSON,
+    face_embedding_blob BLOB NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 );
@@ -54,7 +57,8 @@ CREATE TABLE IF NOT EXISTS csm_form (
 CREATE TABLE IF NOT EXISTS face_embeddings (
     id INT AUTO_INCREMENT PRIMARY KEY,
     client_id VARCHAR(50) NOT NULL,
-    embedding_json JSON NOT NULL,
+    embedding_json JSON NULL,
+    embedding_blob BLOB NULL,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (client_id) REFERENCES clients(client_id) ON DELETE CASCADE
 );
@@ -0,0 +1,117 @@
+"""
+benchmark_face_detect.py
+========================
+Latency and match-distance drift of reduced-resolution face detection
+(services/face_detect.py) against plain face_recognition.face_encodings on
+the full frame.
+
+Runs on the enrolled photos in Clients/ (the images test_face_match.py uses)
+or on any images given with --images. For each downscale factor it reports
+p50/p99 time per image, the share of images where a face was still found,
+and the distance between the reduced-resolution encoding and the baseline
+one; keep the maximum drift well under the 0.6 match threshold.
+
+  python benchmark_face_detect.py
+  python benchmark_face_detect.py --downscale 1 2 4 --repeat 5
+  python benchmark_face_detect.py --images ../Clients/1.jpg --json detect_results.json
+"""
+
+import sys
+import os
+import io
+import glob
+import time
+import json
+import argparse
+import numpy as np
+
+# ── locate project root so we can import services ───────────────────────────
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+sys.path.insert(0, PROJECT_ROOT)
+
+import face_recognition  # noqa: E402
+from services.face_detect import encode_faces, DETECT_MIN_FACE, DETECT_UPSAMPLE  # noqa: E402
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000.0)
+
+
+def baseline_encode(image_bytes):
+    img = face_recognition.load_image_file(io.BytesIO(image_bytes))
+    return face_recognition.face_encodings(img)
+
+
+def time_encoder(fn, images, repeat):
+    latencies, encodings = [], []
+    for image_bytes in images:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            found = fn(image_bytes)
+            latencies.append(time.perf_counter() - started)
+        encodings.append(found[0] if found else None)
+    return encodings, latencies
+
+
+def run(paths, downscales, repeat, min_face, upsample):
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append(f.read())
+    print(f"\n{len(images)} image(s), {repeat} run(s) each, min face {min_face}px, upsample {upsample}\n")
+
+    base_enc, base_lat = time_encoder(baseline_encode, images, repeat)
+    results = {
+        "images": len(images), "repeat": repeat, "min_face": min_face, "upsample": upsample,
+        "baseline": {"p50_ms": percentile_ms(base_lat, 50), "p99_ms": percentile_ms(base_lat, 99),
+                     "found": sum(e is not None for e in base_enc)},
+        "reduced": [],
+    }
+
+    header = f"{'detection':<14}{'found':>8}{'p50 ms':>10}{'p99 ms':>10}{'speedup':>10}{'drift avg':>11}{'drift max':>11}"
+    print(header)
+    print("-" * len(header))
+    print(f"{'full frame':<14}{results['baseline']['found']:>8}{results['baseline']['p50_ms']:>10.1f}"
+          f"{results['baseline']['p99_ms']:>10.1f}{'1.0x':>10}{'-':>11}{'-':>11}")
+
+    for downscale in downscales:
+        encs, lat = time_encoder(
+            lambda b: encode_faces(b, downscale=downscale, min_face=min_face, upsample=upsample), images, repeat)
+        drift = [float(np.linalg.norm(a - b)) for a, b in zip(encs, base_enc) if a is not None and b is not None]
+        p50 = percentile_ms(lat, 50)
+        row = {
+            "downscale": downscale, "found": sum(e is not None for e in encs),
+            "p50_ms": p50, "p99_ms": percentile_ms(lat, 99),
+            "drift_avg": float(np.mean(drift)) if drift else None,
+            "drift_max": float(np.max(drift)) if drift else None,
+        }
+        results["reduced"].append(row)
+        avg = f"{row['drift_avg']:.4f}" if drift else "-"
+        mx = f"{row['drift_max']:.4f}" if drift else "-"
+        print(f"{'1/' + str(downscale):<14}{row['found']:>8}{p50:>10.1f}{row['p99_ms']:>10.1f}"
+              f"{results['baseline']['p50_ms'] / p50:>9.1f}x{avg:>11}{mx:>11}")
+    print()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reduced-resolution face detection benchmark.")
+    parser.add_argument("--images", nargs="+", help="image files (default: Clients/*.jpg)")
+    parser.add_argument("--downscale", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per image")
+    parser.add_argument("--min-face", type=int, default=DETECT_MIN_FACE, help="smallest face in full-res px")
+    parser.add_argument("--upsample", type=int, default=DETECT_UPSAMPLE)
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    paths = args.images or sorted(glob.glob(os.path.join(PROJECT_ROOT, "Clients", "*.jpg")))
+    if not paths:
+        print("No images found; pass --images.")
+        sys.exit(1)
+
+    res = run(paths, args.downscale, args.repeat, args.min_face, args.upsample)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(res, f, indent=2)
+        print(f"Results written to {args.json}")
@@ -0,0 +1,132 @@
+"""
+benchmark_face_index.py
+=======================
+Recall-versus-latency benchmark of the IVF face index (models/face_ivf.py)
+against exact search, on a synthetic gallery shaped like ours: several angle
+embeddings per client clustered around a per-client centre.
+
+Recall is the share of queries whose best client under IVF equals the best
+client under exact search. Use the output to choose FACE_IVF_NLIST and
+FACE_IVF_NPROBE; keep recall at or above the target (default 99.5%).
+
+  python benchmark_face_index.py
+  python benchmark_face_index.py --rows 500000 --queries 1000 --nprobe 4 8 16 32
+  python benchmark_face_index.py --json ivf_results.json
+"""
+
+import sys
+import os
+import time
+import json
+import argparse
+import numpy as np
+
+# ── locate project root so we can import models ─────────────────────────────
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+sys.path.insert(0, PROJECT_ROOT)
+
+from models.face_gallery import FaceGallery, EMBEDDING_DIM  # noqa: E402
+from models.face_ivf import IVFIndex  # noqa: E402
+
+# Spread of synthetic embeddings, tuned so same-client distances land around
+# 0.3 and different-client distances around 0.9, like dlib encodings.
+CENTRE_SIGMA = 0.06
+ANGLE_SIGMA = 0.02
+QUERY_SIGMA = 0.02
+
+
+def synthetic_gallery(rows, angles, seed):
+    rng = np.random.default_rng(seed)
+    clients = max(1, rows // angles)
+    centres = rng.normal(0, CENTRE_SIGMA, (clients, EMBEDDING_DIM))
+    owner_idx = np.repeat(np.arange(clients), angles)[:rows]
+    vectors = centres[owner_idx] + rng.normal(0, ANGLE_SIGMA, (len(owner_idx), EMBEDDING_DIM))
+    data = [(i + 1, f"C{o}", vectors[i]) for i, o in enumerate(owner_idx)]
+    return data, centres
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000.0)
+
+
+def time_queries(gallery, queries):
+    owners, latencies = [], []
+    for q in queries:
+        started = time.perf_counter()
+        owner, _ = gallery.search(q)
+        latencies.append(time.perf_counter() - started)
+        owners.append(owner)
+    return owners, latencies
+
+
+def run(rows, angles, queries, nlist, nprobes, target, seed):
+    print(f"\nBuilding synthetic gallery: {rows} rows, {angles} angles per client…")
+    data, centres = synthetic_gallery(rows, angles, seed)
+    rng = np.random.default_rng(seed + 1)
+    picks = rng.integers(0, len(centres), queries)
+    probes = centres[picks] + rng.normal(0, QUERY_SIGMA, (queries, EMBEDDING_DIM))
+
+    exact = FaceGallery(lambda: data)
+    exact.ensure_loaded()
+    exact_owners, exact_lat = time_queries(exact, probes)
+
+    started = time.perf_counter()
+    ivf = FaceGallery(lambda: data, index=IVFIndex(nlist=nlist, min_rows=0))
+    ivf.ensure_loaded()
+    build_s = time.perf_counter() - started
+    cells = ivf.index.centroids.shape[0]
+
+    results = {
+        "rows": rows, "angles": angles, "queries": queries, "cells": cells,
+        "ivf_build_s": round(build_s, 3),
+        "exact": {"p50_ms": percentile_ms(exact_lat, 50), "p99_ms": percentile_ms(exact_lat, 99)},
+        "ivf": [],
+    }
+
+    print(f"IVF build (train + assign): {build_s:.2f}s, {cells} cells\n")
+    header = f"{'search':<14}{'recall':>10}{'p50 ms':>10}{'p99 ms':>10}{'speedup':>10}"
+    print(header)
+    print("-" * len(header))
+    print(f"{'exact':<14}{'100.00%':>10}{results['exact']['p50_ms']:>10.3f}{results['exact']['p99_ms']:>10.3f}{'1.0x':>10}")
+
+    for nprobe in nprobes:
+        ivf.index.nprobe = nprobe
+        owners, lat = time_queries(ivf, probes)
+        recall = float(np.mean([a == b for a, b in zip(owners, exact_owners)]))
+        p50 = percentile_ms(lat, 50)
+        row = {"nprobe": nprobe, "recall": recall, "p50_ms": p50, "p99_ms": percentile_ms(lat, 99)}
+        results["ivf"].append(row)
+        flag = "" if recall >= target else "  < target"
+        print(f"{'ivf nprobe=' + str(nprobe):<14}{recall:>10.2%}{p50:>10.3f}{row['p99_ms']:>10.3f}"
+              f"{results['exact']['p50_ms'] / p50:>9.1f}x{flag}")
+
+    ok = [r for r in results["ivf"] if r["recall"] >= target]
+    if ok:
+        best = min(ok, key=lambda r: r["p50_ms"])
+        results["recommended_nprobe"] = best["nprobe"]
+        print(f"\nFastest setting with recall >= {target:.1%}: FACE_IVF_NPROBE={best['nprobe']}"
+              f" (FACE_IVF_NLIST={cells})\n")
+    else:
+        results["recommended_nprobe"] = None
+        print(f"\nNo tested nprobe reached {target:.1%} recall; try larger values.\n")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IVF vs exact face search benchmark.")
+    parser.add_argument("--rows", type=int, default=100000, help="gallery rows (embeddings)")
+    parser.add_argument("--angles", type=int, default=3, help="embeddings per client")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--nlist", type=int, default=0, help="IVF cells (0 = ~sqrt(rows))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--target", type=float, default=0.995, help="minimum acceptable recall")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    res = run(args.rows, args.angles, args.queries, args.nlist, args.nprobe, args.target, args.seed)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(res, f, indent=2)
+        print(f"Results written to {args.json}")
@@ -0,0 +1,427 @@
+"""
+benchmark_face_match.py
+=======================
+Gallery-scale benchmark of the face matching paths, for comparing commits:
+
+  find_best_match             1:N client search (face_gallery)
+  find_best_admin_match       1:N admin search (admin_gallery)
+  improve_client_embedding    one check-in learning sample, one transaction
+  improve_client_embeddings   a learning-queue batch in one transaction
+
+For each gallery size it seeds synthetic embeddings (clients with 3 angle
+embeddings clustered around a per-client centre, like real enrollments),
+then reports p50/p99 latency, rows (or samples) per second and peak Python
+memory (tracemalloc) of the cold gallery load and of the searches.
+
+By default the models run against a SQLite stand-in for MySQL in a temp
+directory, so nothing touches the real database. --mysql uses the MYSQL_*
+settings instead; point MYSQL_DATABASE at a scratch database. Only rows
+with BENCH client ids / bench admin emails are written and removed.
+
+  python benchmark_face_match.py
+  python benchmark_face_match.py --sizes 1000 10000 --queries 200
+  python benchmark_face_match.py --json match_after.json --compare match_before.json
+"""
+
+import sys
+import os
+import json
+import time
+import sqlite3
+import tempfile
+import argparse
+import subprocess
+import tracemalloc
+from datetime import datetime
+from contextlib import contextmanager, redirect_stdout
+import numpy as np
+
+# ── locate project root so we can import models ─────────────────────────────
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+sys.path.insert(0, PROJECT_ROOT)
+
+import models.face_embedding_model as face_model  # noqa: E402
+import models.admin_model as admin_model  # noqa: E402
+from models.embedding_codec import encode_embeddings  # noqa: E402
+from models.face_gallery import EMBEDDING_DIM  # noqa: E402
+from benchmark_face_index import CENTRE_SIGMA, ANGLE_SIGMA, QUERY_SIGMA, percentile_ms  # noqa: E402
+
+DEFAULT_SIZES = [1000, 10000, 100000, 500000]
+BENCH_PREFIX = "BENCH"
+# Share of probes taken from enrolled clients; the rest are strangers.
+GENUINE_SHARE = 0.8
+
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(" "))
+
+
+# ── SQLite stand-in ──────────────────────────────────────────────────────────
+
+class _SQLiteCursor:
+    """The slice of a mysql.connector dictionary cursor the models use."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    @staticmethod
+    def _sql(query):
+        return query.replace("%s", "?").replace(" FOR UPDATE", "").replace(" LOCK IN SHARE MODE", "")
+
+    def execute(self, query, params=()):
+        self._cursor.execute(self._sql(query), tuple(params))
+
+    def executemany(self, query, seq):
+        self._cursor.executemany(self._sql(query), seq)
+
+    def fetchall(self):
+        return [dict(r) for r in self._cursor.fetchall()]
+
+    def fetchone(self):
+        r = self._cursor.fetchone()
+        return dict(r) if r is not None else None
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteStandIn:
+    SCHEMA = """
+        CREATE TABLE clients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            client_id TEXT UNIQUE NOT NULL
+        );
+        CREATE TABLE face_embeddings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            client_id TEXT NOT NULL,
+            embedding_json TEXT NULL,
+            embedding_blob BLOB NULL,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX idx_face_embeddings_client ON face_embeddings (client_id);
+        CREATE TABLE admins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE NOT NULL,
+            face_embedding TEXT NULL,
+            face_embedding_blob BLOB NULL
+        );
+    """
+
+    name = "sqlite"
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.conn = None
+
+    def reset(self):
+        if self.conn is not None:
+            self.conn.close()
+        path = os.path.join(self.directory, "bench.sqlite3")
+        if os.path.exists(path):
+            os.remove(path)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(self.SCHEMA)
+
+    @contextmanager
+    def cursor(self, commit=False):
+        cursor = _SQLiteCursor(self.conn.cursor())
+        try:
+            yield cursor
+            if commit:
+                self.conn.commit()
+        except Exception:
+            if commit:
+                self.conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def install(self):
+        # the models look get_db_cursor up in their own module namespace
+        face_model.get_db_cursor = self.cursor
+        admin_model.get_db_cursor = self.cursor
+
+    def seed_clients(self, client_ids):
+        with self.cursor(commit=True) as cursor:
+            cursor.executemany("INSERT INTO clients (client_id) VALUES (%s)", [(cid,) for cid in client_ids])
+
+    def cleanup(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class MySQLScratch:
+    """Runs against the configured MySQL database, touching BENCH rows only."""
+
+    name = "mysql"
+
+    def __init__(self):
+        from db import get_db_cursor
+        self.cursor = get_db_cursor
+
+    def reset(self):
+        self.cleanup()
+
+    def install(self):
+        pass
+
+    def seed_clients(self, client_ids):
+        with self.cursor(commit=True) as cursor:
+            cursor.executemany(
+                "INSERT INTO clients (client_id, full_name, department, gender, age, client_type) "
+                "VALUES (%s, %s, 'Benchmark', 'Other', 0, 'Visitor')",
+                [(cid, f"Benchmark {cid}") for cid in client_ids])
+
+    def cleanup(self):
+        with self.cursor(commit=True) as cursor:
+            cursor.execute("DELETE FROM face_embeddings WHERE client_id LIKE %s", (BENCH_PREFIX + "%",))
+            cursor.execute("DELETE FROM clients WHERE client_id LIKE %s", (BENCH_PREFIX + "%",))
+            cursor.execute("DELETE FROM admins WHERE email LIKE %s", ("bench%@example.invalid",))
+
+
+# ── seeding ──────────────────────────────────────────────────────────────────
+
+def synthetic_clients(rows, angles, rng):
+    clients = max(1, rows // angles)
+    centres = rng.normal(0, CENTRE_SIGMA, (clients, EMBEDDING_DIM))
+    owner_idx = np.repeat(np.arange(clients), angles)[:rows]
+    vectors = centres[owner_idx] + rng.normal(0, ANGLE_SIGMA, (len(owner_idx), EMBEDDING_DIM))
+    return centres, owner_idx, vectors
+
+
+def client_id(i):
+    return f"{BENCH_PREFIX}{i:07d}"
+
+
+def seed(backend, rows, angles, rng, chunk=10000):
+    """Write `rows` client embeddings and as many admin angle embeddings."""
+    centres, owner_idx, vectors = synthetic_clients(rows, angles, rng)
+    admin_centres, _, admin_vectors = synthetic_clients(rows, angles, rng)
+
+    started = time.perf_counter()
+    backend.seed_clients([client_id(i) for i in range(len(centres))])
+    with backend.cursor(commit=True) as cursor:
+        for start in range(0, rows, chunk):
+            cursor.executemany("INSERT INTO face_embeddings (client_id, embedding_blob) VALUES (%s, %s)",
+                               [(client_id(o), encode_embeddings(v))
+                                for o, v in zip(owner_idx[start:start + chunk], vectors[start:start + chunk])])
+        # one admin row holds all of that admin's angles, as /admin/signup stores them
+        admin_rows = []
+        for a in range(len(admin_centres)):
+            blob = encode_embeddings(admin_vectors[a * angles:(a + 1) * angles])
+            admin_rows.append((f"bench{a}@example.invalid", blob))
+        insert_admin = ("INSERT INTO admins (email, face_embedding_blob) VALUES (%s, %s)" if backend.name == "sqlite" else
+                        "INSERT INTO admins (first_name, last_name, email, password_hash, face_embedding_blob) "
+                        "VALUES ('Bench', 'Admin', %s, '!', %s)")
+        for start in range(0, len(admin_rows), chunk):
+            cursor.executemany(insert_admin, admin_rows[start:start + chunk])
+    elapsed = time.perf_counter() - started
+    return centres, admin_centres, {"s": round(elapsed, 3), "rows_per_s": round(2 * rows / elapsed)}
+
+
+# ── measurement ──────────────────────────────────────────────────────────────
+
+def probes_for(centres, count, rng):
+    genuine = int(count * GENUINE_SHARE)
+    picks = rng.integers(0, len(centres), genuine)
+    near = centres[picks] + rng.normal(0, QUERY_SIGMA, (genuine, EMBEDDING_DIM))
+    strangers = rng.normal(0, CENTRE_SIGMA, (count - genuine, EMBEDDING_DIM))
+    probes = np.vstack([near, strangers])
+    rng.shuffle(probes)
+    return probes, picks
+
+
+def latency_summary(latencies, work_per_call, unit):
+    mean = float(np.mean(latencies))
+    return {
+        "p50_ms": round(percentile_ms(latencies, 50), 4),
+        "p99_ms": round(percentile_ms(latencies, 99), 4),
+        f"{unit}_per_s": round(work_per_call / mean) if mean else None,
+    }
+
+
+@contextmanager
+def quiet():
+    """Silence the models' per-call debug prints inside timed loops."""
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        yield
+
+
+def peak_mb(fn):
+    """Peak Python allocation (numpy included) while running fn, in MB."""
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / (1024 * 1024), 2)
+
+
+def bench_load(gallery, rows):
+    gallery.invalidate()
+    started = time.perf_counter()
+    gallery.ensure_loaded()
+    elapsed = time.perf_counter() - started
+
+    def reload():
+        gallery.invalidate()
+        gallery.ensure_loaded()
+    result = {"s": round(elapsed, 3), "rows_per_s": round(rows / elapsed) if elapsed else None}
+    result["peak_mb"] = peak_mb(reload)
+    return result
+
+
+def bench_search(search, probes, rows):
+    latencies, hits = [], 0
+    for q in probes:
+        query = q.tolist()  # the routes pass plain lists
+        started = time.perf_counter()
+        owner, _ = search(query)
+        latencies.append(time.perf_counter() - started)
+        hits += owner is not None
+    result = latency_summary(latencies, rows, "rows")
+    result["match_rate"] = round(hits / len(probes), 4)
+    result["peak_mb"] = peak_mb(lambda: [search(q.tolist()) for q in probes[:20]])
+    return result
+
+
+def bench_learning(centres, count, batch, rng):
+    picks = rng.integers(0, len(centres), count)
+    samples = centres[picks] + rng.normal(0, QUERY_SIGMA, (count, EMBEDDING_DIM))
+
+    latencies = []
+    for i, s in zip(picks, samples):
+        started = time.perf_counter()
+        face_model.improve_client_embedding(client_id(i), s.tolist())
+        latencies.append(time.perf_counter() - started)
+    single = latency_summary(latencies, 1, "samples")
+
+    latencies = []
+    for start in range(0, count, batch):
+        chunk = [(client_id(i), s.tolist()) for i, s in zip(picks[start:start + batch], samples[start:start + batch])]
+        started = time.perf_counter()
+        face_model.improve_client_embeddings(chunk)
+        latencies.append(time.perf_counter() - started)
+    batched = latency_summary(latencies, batch, "samples")
+    batched["batch"] = batch
+    return single, batched
+
+
+def run_size(backend, rows, angles, queries, learn, batch, seed_value):
+    rng = np.random.default_rng(seed_value)
+    print(f"\n── {rows} rows ({angles} angles per client) ──")
+    backend.reset()
+    centres, admin_centres, seeded = seed(backend, rows, angles, rng)
+    print(f"seeded in {seeded['s']:.1f}s")
+
+    result = {"rows": rows, "clients": len(centres), "seed": seeded}
+    with quiet():
+        result["face_gallery_load"] = bench_load(face_model.face_gallery, rows)
+        result["admin_gallery_load"] = bench_load(admin_model.admin_gallery, rows)
+
+        probes, _ = probes_for(centres, queries, rng)
+        result["find_best_match"] = bench_search(face_model.find_best_match, probes, rows)
+        admin_probes, _ = probes_for(admin_centres, queries, rng)
+        result["find_best_admin_match"] = bench_search(admin_model.find_best_admin_match, admin_probes, rows)
+
+        single, batched = bench_learning(centres, learn, batch, rng)
+    result["improve_client_embedding"] = single
+    result["improve_client_embeddings"] = batched
+
+    for path in ("find_best_match", "find_best_admin_match", "improve_client_embedding", "improve_client_embeddings"):
+        r = result[path]
+        rate = r.get("rows_per_s") or r.get("samples_per_s")
+        extra = f"{r['peak_mb']:>9.1f} MB" if "peak_mb" in r else ""
+        print(f"{path:<28}{r['p50_ms']:>10.3f} ms p50{r['p99_ms']:>10.3f} ms p99{rate:>14,}/s{extra}")
+    load = result["face_gallery_load"]
+    print(f"{'face_gallery load':<28}{load['s'] * 1000:>10.1f} ms{'':>18}{load['rows_per_s']:>14,}/s{load['peak_mb']:>9.1f} MB")
+    return result
+
+
+# ── reporting ────────────────────────────────────────────────────────────────
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Print p50 changes against a previous run; return the regressed metrics."""
+    old_by_rows = {r["rows"]: r for r in baseline.get("sizes", [])}
+    regressions = []
+    print(f"\nAgainst {baseline.get('commit') or 'baseline'} (tolerance {tolerance:.0%}):")
+    for new in results["sizes"]:
+        old = old_by_rows.get(new["rows"])
+        if old is None:
+            continue
+        for path, metrics in new.items():
+            if not isinstance(metrics, dict) or "p50_ms" not in metrics or path not in old:
+                continue
+            before, after = old[path]["p50_ms"], metrics["p50_ms"]
+            change = (after - before) / before if before else 0.0
+            flag = "  REGRESSION" if change > tolerance else ""
+            print(f"  {new['rows']:>7} {path:<28}{before:>10.3f} -> {after:>8.3f} ms  {change:+.1%}{flag}")
+            if flag:
+                regressions.append((new["rows"], path, change))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Face matching benchmark at gallery scale.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="gallery rows to test")
+    parser.add_argument("--angles", type=int, default=3, help="embeddings per client")
+    parser.add_argument("--queries", type=int, default=500, help="searches per path and size")
+    parser.add_argument("--learn", type=int, default=200, help="learning samples per size")
+    parser.add_argument("--batch", type=int, default=50, help="samples per improve_client_embeddings call")
+    parser.add_argument("--mysql", action="store_true", help="use the MYSQL_* database instead of SQLite")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="previous --json output to compare p50 latencies against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="p50 slowdown counted as a regression")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    backend = MySQLScratch() if args.mysql else SQLiteStandIn(tmpdir.name)
+    backend.install()
+
+    results = {
+        "commit": git_commit(),
+        "backend": backend.name,
+        "index": type(face_model.face_gallery.index).__name__ if face_model.face_gallery.index else "exact",
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "queries": args.queries,
+        "sizes": [],
+    }
+    try:
+        for rows in args.sizes:
+            results["sizes"].append(run_size(backend, rows, args.angles, args.queries,
+                                             args.learn, args.batch, args.seed))
+    finally:
+        backend.cleanup()
+        tmpdir.cleanup()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            sys.exit(1)
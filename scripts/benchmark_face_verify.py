@@ -0,0 +1,84 @@
+"""
+benchmark_face_verify.py
+========================
+Latency of the detection-only /verify_face path (services/face_detect.py
+detect_faces: HOG boxes + quality metrics) against the full encoding path it
+replaced (landmarks + 128-d encoding), on the photos in Clients/ or --images.
+
+  python benchmark_face_verify.py
+  python benchmark_face_verify.py --repeat 10 --json verify_results.json
+"""
+
+import sys
+import os
+import glob
+import time
+import json
+import argparse
+import numpy as np
+
+# ── locate project root so we can import services ───────────────────────────
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+sys.path.insert(0, PROJECT_ROOT)
+
+from services.face_detect import detect_faces, encode_faces  # noqa: E402
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000.0)
+
+
+def time_path(fn, images, repeat):
+    latencies, found = [], 0
+    for image_bytes in images:
+        for i in range(repeat):
+            started = time.perf_counter()
+            result = fn(image_bytes)
+            latencies.append(time.perf_counter() - started)
+        found += bool(result)
+    return latencies, found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detection-only vs full encoding benchmark.")
+    parser.add_argument("--images", nargs="+", help="image files (default: Clients/*.jpg)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per image")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    paths = args.images or sorted(glob.glob(os.path.join(PROJECT_ROOT, "Clients", "*.jpg")))
+    if not paths:
+        print("No images found; pass --images.")
+        sys.exit(1)
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append(f.read())
+
+    # warm up dlib models so the first call does not skew the numbers
+    encode_faces(images[0])
+
+    paths_to_time = [
+        ("full encoding", encode_faces),
+        ("detect only", lambda b: detect_faces(b)["faces"]),
+    ]
+    print(f"\n{len(images)} image(s), {args.repeat} run(s) each\n")
+    header = f"{'path':<16}{'found':>8}{'p50 ms':>10}{'p99 ms':>10}{'share':>10}"
+    print(header)
+    print("-" * len(header))
+    results = {"images": len(images), "repeat": args.repeat, "paths": []}
+    base_p50 = None
+    for name, fn in paths_to_time:
+        lat, found = time_path(fn, images, args.repeat)
+        p50 = percentile_ms(lat, 50)
+        base_p50 = base_p50 or p50
+        row = {"path": name, "found": found, "p50_ms": p50, "p99_ms": percentile_ms(lat, 99)}
+        results["paths"].append(row)
+        print(f"{name:<16}{found:>8}{p50:>10.1f}{row['p99_ms']:>10.1f}{p50 / base_p50:>10.0%}")
+    print()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
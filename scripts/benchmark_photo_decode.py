@@ -0,0 +1,92 @@
+"""
+benchmark_photo_decode.py
+=========================
+Micro-benchmark of services/photo_decode.py against the regex + b64decode
+code the face routes used before, on a data URL like the kiosk posts.
+
+The photo is a JPEG from Clients/ (or --image), upscaled to --width so the
+payload matches real camera frames. Reports microseconds per call for the
+base64 step and for decoding the image to an RGB array.
+
+  python benchmark_photo_decode.py
+  python benchmark_photo_decode.py --width 1280 --runs 500
+"""
+
+import sys
+import os
+import io
+import re
+import glob
+import time
+import base64
+import argparse
+import numpy as np
+from PIL import Image
+
+# ── locate project root so we can import services ───────────────────────────
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+sys.path.insert(0, PROJECT_ROOT)
+
+from services.photo_decode import decode_photo_data, decode_rgb  # noqa: E402
+
+
+def legacy_decode(photo_data):
+    m = re.match(r"data:(image/\w+);base64,(.*)", photo_data)
+    if m:
+        img_b64 = m.group(2)
+    else:
+        img_b64 = photo_data.split(',', 1)[1] if ',' in photo_data else photo_data
+    return base64.b64decode(img_b64)
+
+
+def legacy_rgb(image_bytes):
+    return np.array(Image.open(io.BytesIO(image_bytes)).convert('RGB'))
+
+
+def make_data_url(path, width):
+    img = Image.open(path).convert('RGB')
+    height = int(img.height * width / img.width)
+    buf = io.BytesIO()
+    img.resize((width, height)).save(buf, format='JPEG', quality=92)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buf.getvalue()).decode('ascii')
+
+
+def per_call_us(fn, arg, runs):
+    fn(arg)
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn(arg)
+        samples.append(time.perf_counter() - started)
+    return float(np.median(samples) * 1e6)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Photo decode micro-benchmark.")
+    parser.add_argument("--image", help="source image (default: first Clients/*.jpg)")
+    parser.add_argument("--width", type=int, default=800, help="frame width to simulate")
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    path = args.image or next(iter(sorted(glob.glob(os.path.join(PROJECT_ROOT, "Clients", "*.jpg")))), None)
+    if not path:
+        print("No image found; pass --image.")
+        sys.exit(1)
+
+    data_url = make_data_url(path, args.width)
+    image_bytes = decode_photo_data(data_url)
+    assert legacy_decode(data_url) == image_bytes
+
+    print(f"\nPayload: {len(data_url) / 1024:.0f} KB data URL -> {len(image_bytes) / 1024:.0f} KB JPEG, "
+          f"{args.width}px wide, {args.runs} runs\n")
+    rows = [
+        ("base64", per_call_us(legacy_decode, data_url, args.runs), per_call_us(decode_photo_data, data_url, args.runs)),
+        ("to RGB array", per_call_us(legacy_rgb, image_bytes, args.runs), per_call_us(decode_rgb, image_bytes, args.runs)),
+    ]
+    header = f"{'step':<14}{'legacy us':>12}{'new us':>12}{'speedup':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, old, new in rows:
+        print(f"{name:<14}{old:>12.1f}{new:>12.1f}{old / new:>9.1f}x")
+    print()
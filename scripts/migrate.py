@@ -0,0 +1,177 @@
+"""
+migrate.py
+==========
+Brings the database schema up to date by applying the numbered migrations
+in scripts/migrations/ in order. Each applied migration is recorded in the
+schema_version table, so running this again only applies what is new.
+
+Migration files are named <version>_<description>.sql (e.g.
+001_hot_query_indexes.sql) and contain ';'-separated statements; lines
+starting with "--" are comments. schema.sql is the baseline they build on.
+
+MySQL commits DDL statements immediately, so a migration that fails half-way
+cannot be rolled back. Re-running it skips statements whose column or index
+already exists and carries on with the rest.
+
+Run modes
+---------
+  python migrate.py                    # dry-run: lists applied and pending migrations
+  python migrate.py --apply            # applies every pending migration
+  python migrate.py --apply --to 3     # applies pending migrations up to version 3
+"""
+
+import sys
+import os
+import re
+import hashlib
+import argparse
+from collections import namedtuple
+
+# ── locate project root so we can import db.py ──────────────────────────────
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+sys.path.insert(0, PROJECT_ROOT)
+
+import mysql.connector  # noqa: E402
+
+MIGRATIONS_DIR = os.path.join(SCRIPT_DIR, "migrations")
+
+Migration = namedtuple("Migration", "version name sql checksum")
+
+_FILENAME = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+# Errors meaning the statement's change is already in place
+# (ER_DUP_FIELDNAME, ER_DUP_KEYNAME): from a half-applied earlier run, or
+# added by hand before the migration existed.
+_ALREADY_APPLIED = {1060, 1061}
+
+VERSION_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    checksum CHAR(64) NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)"""
+
+
+# ── migration files ───────────────────────────────────────────────────────────
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    """Every migration file in directory, sorted by version."""
+    migrations = {}
+    for filename in sorted(os.listdir(directory)):
+        match = _FILENAME.match(filename)
+        if not match:
+            continue
+        version = int(match.group(1))
+        if version in migrations:
+            raise ValueError(f"two migrations with version {version}: "
+                             f"{migrations[version].name} and {match.group(2)}")
+        with open(os.path.join(directory, filename), "rb") as f:
+            raw = f.read()
+        migrations[version] = Migration(version, match.group(2), raw.decode("utf-8"),
+                                        hashlib.sha256(raw).hexdigest())
+    return [migrations[v] for v in sorted(migrations)]
+
+
+def split_statements(sql):
+    """Statements of a migration file, without comments."""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    return [stmt.strip() for stmt in "\n".join(lines).split(";") if stmt.strip()]
+
+
+# ── schema_version ────────────────────────────────────────────────────────────
+
+def applied_migrations(cursor):
+    """{version: row} of schema_version; empty before the first migration."""
+    try:
+        cursor.execute("SELECT version, name, checksum, applied_at FROM schema_version ORDER BY version")
+    except mysql.connector.Error as err:
+        if err.errno == 1146:  # ER_NO_SUCH_TABLE
+            return {}
+        raise
+    return {row["version"]: row for row in cursor.fetchall()}
+
+
+def pending_migrations(cursor, migrations=None, target=None):
+    """Migrations not yet in schema_version (up to target, if given)."""
+    if migrations is None:
+        migrations = load_migrations()
+    applied = applied_migrations(cursor)
+    for m in migrations:
+        row = applied.get(m.version)
+        if row and row["checksum"] != m.checksum:
+            print(f"      WARNING: {m.version:03d}_{m.name}.sql changed after it was applied")
+    return [m for m in migrations
+            if m.version not in applied and (target is None or m.version <= target)]
+
+
+def apply_migration(cursor, migration):
+    """Run one migration's statements and record it. The caller commits."""
+    cursor.execute(VERSION_TABLE_SQL)
+    for stmt in split_statements(migration.sql):
+        try:
+            cursor.execute(stmt)
+        except mysql.connector.Error as err:
+            if err.errno not in _ALREADY_APPLIED:
+                raise
+            print(f"      already present, skipped: {err.msg}")
+    cursor.execute("INSERT INTO schema_version (version, name, checksum) VALUES (%s, %s, %s)",
+                   (migration.version, migration.name, migration.checksum))
+
+
+# ── main logic ────────────────────────────────────────────────────────────────
+
+def run(apply, target=None):
+    from db import get_db_cursor
+
+    mode_label = "APPLY" if apply else "DRY-RUN"
+    print(f"\n{'='*60}")
+    print(f"  migrate.py  [{mode_label}]")
+    print(f"{'='*60}\n")
+
+    migrations = load_migrations()
+    try:
+        with get_db_cursor() as cur:
+            applied = applied_migrations(cur)
+            pending = pending_migrations(cur, migrations, target)
+    except Exception as exc:
+        print(f"      ERROR reading schema_version: {exc}\n")
+        sys.exit(1)
+
+    for m in migrations:
+        if m.version in applied:
+            print(f"      applied  {m.version:03d}_{m.name}  ({applied[m.version]['applied_at']})")
+    for m in pending:
+        print(f"      pending  {m.version:03d}_{m.name}")
+    print()
+
+    if not pending:
+        print("Schema is up to date.\n")
+        return
+    if not apply:
+        print("No changes written. Re-run with --apply to migrate.\n")
+        return
+
+    for m in pending:
+        print(f"Applying {m.version:03d}_{m.name}…")
+        try:
+            # MySQL commits DDL as it runs, so this is not atomic; the
+            # schema_version row is written last, after the statements it
+            # records, so a failed migration is never marked applied
+            with get_db_cursor(commit=True) as cur:
+                apply_migration(cur, m)
+        except Exception as exc:
+            print(f"      ERROR: {exc}\n")
+            sys.exit(1)
+    print(f"\nMigration complete! {len(pending)} migration(s) applied.\n")
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply numbered schema migrations.")
+    parser.add_argument("--apply", action="store_true", help="apply pending migrations (default is a dry-run)")
+    parser.add_argument("--to", type=int, default=None, metavar="VERSION", help="stop after this version")
+    args = parser.parse_args()
+    run(apply=args.apply, target=args.to)
@@ -0,0 +1,165 @@
+"""
+migrate_embedding_blob.py
+=========================
+Moves face embeddings from JSON text to the compact binary format described
+in models/embedding_codec.py:
+
+  - face_embeddings.embedding_json  →  face_embeddings.embedding_blob
+  - admins.face_embedding           →  admins.face_embedding_blob
+
+Rows are converted in batches (one transaction per batch) so the tables stay
+usable while the migration runs. The application reads both formats, so rows
+can be converted while it is serving traffic; it writes only the binary
+columns, so they must exist (step 1 below) before the new code is deployed.
+
+Run modes
+---------
+  python migrate_embedding_blob.py                   # dry-run: counts rows to convert
+  python migrate_embedding_blob.py --apply           # adds columns and converts rows
+  python migrate_embedding_blob.py --apply --keep-json
+                                                     # also keep the JSON copy
+  python migrate_embedding_blob.py --apply --batch-size 1000
+"""
+
+import sys
+import os
+import argparse
+
+# ── locate project root so we can import db.py ──────────────────────────────
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+sys.path.insert(0, PROJECT_ROOT)
+
+from db import get_db_cursor  # noqa: E402  (project import after sys.path tweak)
+from models.embedding_codec import encode_embeddings, read_stored_embeddings  # noqa: E402
+
+
+# ── SQL helpers ───────────────────────────────────────────────────────────────
+
+# The JSON column has to accept NULL before new code writes binary-only rows.
+SCHEMA_SQL = """
+ALTER TABLE face_embeddings
+    ADD COLUMN IF NOT EXISTS embedding_blob BLOB NULL AFTER embedding_json,
+    MODIFY COLUMN embedding_json JSON NULL;
+ALTER TABLE admins
+    ADD COLUMN IF NOT EXISTS face_embedding_blob BLOB NULL AFTER face_embedding;
+"""
+
+# (table, id column, json column, blob column)
+TARGETS = [
+    ("face_embeddings", "id", "embedding_json", "embedding_blob"),
+    ("admins", "id", "face_embedding", "face_embedding_blob"),
+]
+
+
+def count_pending(table, json_col, blob_col):
+    with get_db_cursor() as cur:
+        cur.execute(f"SELECT COUNT(*) AS cnt FROM {table} "
+                    f"WHERE {blob_col} IS NULL AND {json_col} IS NOT NULL")
+        return cur.fetchone()["cnt"]
+
+
+def convert_table(table, id_col, json_col, blob_col, batch_size, keep_json):
+    """Convert one table in id order; returns (converted, skipped)."""
+    converted = 0
+    skipped = 0
+    last_id = 0
+    if keep_json:
+        update_sql = f"UPDATE {table} SET {blob_col} = %s WHERE {id_col} = %s"
+    else:
+        update_sql = f"UPDATE {table} SET {blob_col} = %s, {json_col} = NULL WHERE {id_col} = %s"
+
+    while True:
+        with get_db_cursor(commit=True) as cur:
+            cur.execute(
+                f"SELECT {id_col} AS id, {json_col} AS emb FROM {table} "
+                f"WHERE {blob_col} IS NULL AND {json_col} IS NOT NULL AND {id_col} > %s "
+                f"ORDER BY {id_col} LIMIT %s",
+                (last_id, batch_size),
+            )
+            rows = cur.fetchall()
+            if not rows:
+                break
+
+            updates = []
+            for row in rows:
+                last_id = row["id"]
+                try:
+                    vectors = read_stored_embeddings(None, row["emb"])
+                except ValueError as exc:
+                    print(f"      {table} id={row['id']}: unreadable JSON ({exc}), skipped")
+                    skipped += 1
+                    continue
+                if vectors is None:
+                    skipped += 1
+                    continue
+                updates.append((encode_embeddings(vectors), row["id"]))
+
+            if updates:
+                cur.executemany(update_sql, updates)
+            converted += len(updates)
+        print(f"      {table}: {converted} converted so far (last id {last_id})")
+
+    return converted, skipped
+
+
+# ── main logic ────────────────────────────────────────────────────────────────
+
+def run(apply, batch_size, keep_json):
+    mode_label = "APPLY" if apply else "DRY-RUN"
+    print(f"\n{'='*60}")
+    print(f"  migrate_embedding_blob.py  [{mode_label}]")
+    print(f"{'='*60}\n")
+
+    # ── Step 1: Add binary columns ────────────────────────────────────────
+    if apply:
+        print("[1/2] Adding binary columns (embedding_blob, face_embedding_blob)…")
+        try:
+            with get_db_cursor(commit=True) as cur:
+                for stmt in SCHEMA_SQL.strip().split(";"):
+                    stmt = stmt.strip()
+                    if stmt:
+                        cur.execute(stmt)
+            print("      Columns added (or already existed).\n")
+        except Exception as exc:
+            print(f"      ERROR altering tables: {exc}\n")
+            sys.exit(1)
+    else:
+        print("[1/2] [DRY-RUN] Would add columns: face_embeddings.embedding_blob, admins.face_embedding_blob\n")
+
+    # ── Step 2: Convert rows in batches ───────────────────────────────────
+    print(f"[2/2] Converting rows (batch size {batch_size})…")
+    for table, id_col, json_col, blob_col in TARGETS:
+        if not apply:
+            try:
+                pending = count_pending(table, json_col, blob_col)
+            except Exception:
+                # binary column does not exist yet: every JSON row is pending
+                with get_db_cursor() as cur:
+                    cur.execute(f"SELECT COUNT(*) AS cnt FROM {table} WHERE {json_col} IS NOT NULL")
+                    pending = cur.fetchone()["cnt"]
+            print(f"      [DRY-RUN] {table}: {pending} row(s) would be converted")
+            continue
+        try:
+            converted, skipped = convert_table(table, id_col, json_col, blob_col, batch_size, keep_json)
+        except Exception as exc:
+            print(f"      ERROR converting {table}: {exc}\n")
+            sys.exit(1)
+        print(f"      {table}: {converted} row(s) converted, {skipped} skipped.")
+
+    print()
+    if not apply:
+        print("No changes written. Re-run with --apply to commit.\n")
+        return
+    print("Migration complete!\n")
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert JSON face embeddings to binary BLOBs.")
+    parser.add_argument("--apply", action="store_true", help="write changes (default is a dry-run)")
+    parser.add_argument("--batch-size", type=int, default=500, help="rows per transaction")
+    parser.add_argument("--keep-json", action="store_true", help="leave the JSON copy in place")
+    args = parser.parse_args()
+    run(apply=args.apply, batch_size=args.batch_size, keep_json=args.keep_json)
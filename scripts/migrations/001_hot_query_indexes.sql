@@ -0,0 +1,20 @@
+-- Secondary indexes for the report, dashboard and check-in queries.
+-- Built online (INPLACE, LOCK=NONE) so kiosks keep logging while they run.
+
+-- get_logs / iter_logs / get_logs_by_day / today_logs: range on time_in,
+-- ORDER BY time_in DESC
+CREATE INDEX idx_logs_time_in ON logs (time_in) ALGORITHM=INPLACE LOCK=NONE;
+
+-- add_time_out: WHERE client_id = ? AND time_out IS NULL ORDER BY time_in DESC.
+-- Also serves the client_id foreign key.
+CREATE INDEX idx_logs_client_open ON logs (client_id, time_out, time_in) ALGORITHM=INPLACE LOCK=NONE;
+
+-- CSM report: range on date, ORDER BY date DESC, id DESC
+CREATE INDEX idx_csm_form_date ON csm_form (date, id) ALGORITHM=INPLACE LOCK=NONE;
+
+-- client search: prefix matches on client_id (UNIQUE), full_name and lname
+CREATE INDEX idx_clients_full_name ON clients (full_name) ALGORITHM=INPLACE LOCK=NONE;
+CREATE INDEX idx_clients_lname ON clients (lname) ALGORITHM=INPLACE LOCK=NONE;
+
+-- csm_form.control_no prefix lookups (/generate_control_no) already use its
+-- UNIQUE index.
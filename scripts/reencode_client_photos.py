@@ -0,0 +1,290 @@
+"""
+reencode_client_photos.py
+=========================
+Re-encodes the stored centre photos (Clients/<client_id>.jpg) of every
+client and writes the new embeddings back to face_embeddings, e.g. after
+changing the FACE_DETECT_* settings or to rebuild a damaged table without
+re-registering everyone through /edit.
+
+Photos are encoded by a multiprocessing pool; results are written in
+batches, one transaction per batch. After each committed batch the client
+ids are recorded in a checkpoint file, so an interrupted run picks up where
+it stopped (use --restart to start over).
+
+Only the centre angle is stored on disk, so by default the new encoding
+replaces the client's stored embedding closest to it and the left/right
+angles are kept. --replace-all drops every stored embedding of the client
+and keeps only the new one (for rebuilding a corrupted table).
+
+Run modes
+---------
+  python reencode_client_photos.py                      # dry-run: old vs new distance report
+  python reencode_client_photos.py --report diff.csv    # dry-run, per-client CSV as well
+  python reencode_client_photos.py --apply              # write (resumes from the checkpoint)
+  python reencode_client_photos.py --apply --replace-all --workers 8 --batch-size 200
+"""
+
+import sys
+import os
+import csv
+import json
+import time
+import argparse
+import multiprocessing
+import numpy as np
+
+# ── locate project root so we can import services/models ────────────────────
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+sys.path.insert(0, PROJECT_ROOT)
+
+from services import face_detect  # noqa: E402  (project import after sys.path tweak)
+from models.embedding_codec import encode_embeddings, read_stored_embeddings  # noqa: E402
+
+DEFAULT_PHOTO_DIR = os.path.join(PROJECT_ROOT, "Clients")
+DEFAULT_CHECKPOINT = os.path.join(PROJECT_ROOT, "reencode_checkpoint.json")
+# New-vs-old distances above this are listed in the dry-run report: the
+# photo may show someone else, or the stored embedding was damaged.
+SUSPICIOUS_DISTANCE = 0.6
+
+
+# ── worker ───────────────────────────────────────────────────────────────────
+
+def encode_photo(item):
+    """(client_id, path) -> (client_id, encoding list or None, error or None)."""
+    client_id, path = item
+    try:
+        with open(path, "rb") as f:
+            encodings = face_detect.encode_faces(f.read())
+    except Exception as exc:
+        return client_id, None, str(exc)
+    if not encodings:
+        return client_id, None, "no face detected"
+    return client_id, [float(x) for x in encodings[0]], None
+
+
+# ── checkpoint ───────────────────────────────────────────────────────────────
+
+def detector_settings():
+    return {
+        "downscale": face_detect.DETECT_DOWNSCALE,
+        "min_face": face_detect.DETECT_MIN_FACE,
+        "upsample": face_detect.DETECT_UPSAMPLE,
+    }
+
+
+def load_checkpoint(path, settings):
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("settings") != settings:
+        print(f"      Checkpoint was written with detector settings {data.get('settings')}; "
+              f"now {settings}. Use --restart to re-encode everything.")
+    return set(data.get("done", []))
+
+
+def save_checkpoint(path, settings, done):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"settings": settings, "done": sorted(done), "updated": time.strftime("%Y-%m-%d %H:%M:%S")}, f)
+    os.replace(tmp, path)
+
+
+# ── SQL helpers ──────────────────────────────────────────────────────────────
+# db is imported inside the helpers: pool workers started with "spawn"
+# (Windows) re-import this module and must not open MySQL pools of their own.
+
+def known_clients():
+    from db import get_db_cursor
+    with get_db_cursor() as cur:
+        cur.execute("SELECT client_id FROM clients")
+        return {r["client_id"].upper() for r in cur.fetchall()}
+
+
+def stored_embeddings(cur, client_ids, lock=False):
+    """client_id -> [(row id, vector), ...] for a batch of clients."""
+    placeholders = ", ".join(["%s"] * len(client_ids))
+    cur.execute(f"SELECT id, client_id, embedding_blob, embedding_json FROM face_embeddings "
+                f"WHERE client_id IN ({placeholders}) ORDER BY id{' FOR UPDATE' if lock else ''}", list(client_ids))
+    stored = {cid: [] for cid in client_ids}
+    for row in cur.fetchall():
+        try:
+            vectors = read_stored_embeddings(row.get("embedding_blob"), row.get("embedding_json"))
+        except ValueError:
+            continue  # unreadable rows count as missing; --replace-all removes them
+        if vectors is not None:
+            stored[row["client_id"].upper()].append((row["id"], vectors[0].astype(np.float64)))
+    return stored
+
+
+def nearest(stored, encoding):
+    """(row id, distance) of the stored embedding closest to encoding, or (None, None)."""
+    if not stored:
+        return None, None
+    dists = np.linalg.norm(np.stack([v for _, v in stored]) - np.asarray(encoding), axis=1)
+    i = int(np.argmin(dists))
+    return stored[i][0], float(dists[i])
+
+
+def write_batch(results, replace_all):
+    """Write one batch of (client_id, encoding) in one transaction."""
+    from db import get_db_cursor
+    client_ids = [cid for cid, _ in results]
+    with get_db_cursor(commit=True) as cur:
+        if replace_all:
+            placeholders = ", ".join(["%s"] * len(client_ids))
+            cur.execute(f"DELETE FROM face_embeddings WHERE client_id IN ({placeholders})", client_ids)
+            cur.executemany("INSERT INTO face_embeddings (client_id, embedding_blob) VALUES (%s, %s)",
+                            [(cid, encode_embeddings(enc)) for cid, enc in results])
+            return
+        stored = stored_embeddings(cur, client_ids, lock=True)
+        updates, inserts = [], []
+        for cid, enc in results:
+            row_id, _ = nearest(stored[cid], enc)
+            if row_id is None:
+                inserts.append((cid, encode_embeddings(enc)))
+            else:
+                updates.append((encode_embeddings(enc), row_id))
+        if updates:
+            cur.executemany("UPDATE face_embeddings SET embedding_blob = %s, embedding_json = NULL WHERE id = %s", updates)
+        if inserts:
+            cur.executemany("INSERT INTO face_embeddings (client_id, embedding_blob) VALUES (%s, %s)", inserts)
+
+
+def diff_batch(results):
+    """Dry-run: distance from each new encoding to the client's nearest stored one."""
+    from db import get_db_cursor
+    with get_db_cursor() as cur:
+        stored = stored_embeddings(cur, [cid for cid, _ in results])
+    return [(cid, len(stored[cid]), nearest(stored[cid], enc)[1]) for cid, enc in results]
+
+
+# ── main logic ───────────────────────────────────────────────────────────────
+
+def find_photos(photo_dir, clients):
+    photos, orphans = [], 0
+    for name in sorted(os.listdir(photo_dir)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() not in (".jpg", ".jpeg", ".png"):
+            continue
+        if stem.upper() not in clients:
+            orphans += 1
+            continue
+        photos.append((stem.upper(), os.path.join(photo_dir, name)))
+    return photos, orphans
+
+
+def summarize_diff(rows, report_path):
+    dists = np.array([d for _, _, d in rows if d is not None])
+    missing = sum(1 for _, n, _ in rows if n == 0)
+    print(f"\n      Old vs new distance over {len(dists)} client(s) with stored embeddings "
+          f"({missing} without any):")
+    if len(dists):
+        print(f"        mean {dists.mean():.3f}  p50 {np.percentile(dists, 50):.3f}  "
+              f"p95 {np.percentile(dists, 95):.3f}  max {dists.max():.3f}")
+        suspicious = sorted((r for r in rows if r[2] is not None and r[2] > SUSPICIOUS_DISTANCE),
+                            key=lambda r: r[2], reverse=True)
+        print(f"        {len(suspicious)} above {SUSPICIOUS_DISTANCE} (photo may not match the stored face):")
+        for cid, _, dist in suspicious[:20]:
+            print(f"          {cid}: {dist:.3f}")
+    if report_path:
+        with open(report_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["client_id", "stored_embeddings", "distance_to_nearest"])
+            for cid, n, dist in rows:
+                writer.writerow([cid, n, "" if dist is None else f"{dist:.4f}"])
+        print(f"      Per-client report written to {report_path}")
+
+
+def run(apply, photo_dir, workers, batch_size, replace_all, checkpoint, restart, report):
+    mode_label = "APPLY" if apply else "DRY-RUN"
+    print(f"\n{'='*60}")
+    print(f"  reencode_client_photos.py  [{mode_label}{' / REPLACE-ALL' if replace_all else ''}]")
+    print(f"{'='*60}\n")
+
+    settings = detector_settings()
+    print(f"[1/3] Collecting photos in {photo_dir} (detector settings {settings})…")
+    photos, orphans = find_photos(photo_dir, known_clients())
+    done = set()
+    if apply and not restart:
+        done = load_checkpoint(checkpoint, settings)
+    pending = [p for p in photos if p[0] not in done]
+    print(f"      {len(photos)} photo(s) of registered clients, {orphans} without a client record, "
+          f"{len(photos) - len(pending)} already done per checkpoint.\n")
+    if not pending:
+        print("Nothing to do.\n")
+        return
+
+    print(f"[2/3] Encoding with {workers} worker(s), {batch_size} client(s) per transaction…")
+    started = time.monotonic()
+    encoded = failed = 0
+    batch, diff_rows, failures = [], [], []
+
+    def flush():
+        if not batch:
+            return
+        if apply:
+            write_batch(batch, replace_all)
+            done.update(cid for cid, _ in batch)
+            save_checkpoint(checkpoint, settings, done)
+        else:
+            diff_rows.extend(diff_batch(batch))
+        batch.clear()
+
+    with multiprocessing.Pool(workers) as pool:
+        for processed, (cid, enc, error) in enumerate(pool.imap_unordered(encode_photo, pending, chunksize=4), 1):
+            if enc is None:
+                failed += 1
+                failures.append((cid, error))
+            else:
+                encoded += 1
+                batch.append((cid, enc))
+            if len(batch) >= batch_size:
+                flush()
+            if processed % batch_size == 0 or processed == len(pending):
+                elapsed = time.monotonic() - started
+                rate = processed / elapsed if elapsed else 0.0
+                eta = (len(pending) - processed) / rate if rate else 0.0
+                print(f"      {processed}/{len(pending)} photos  {rate:.1f} photos/s  ETA {eta:.0f}s")
+        flush()
+
+    elapsed = time.monotonic() - started
+    print(f"\n      {encoded} encoded, {failed} failed in {elapsed:.1f}s "
+          f"({len(pending) / elapsed if elapsed else 0:.1f} photos/s).")
+    for cid, error in failures[:20]:
+        print(f"        {cid}: {error}")
+    if len(failures) > 20:
+        print(f"        … and {len(failures) - 20} more")
+
+    print("\n[3/3] " + ("Done." if apply else "Diff of stored vs new embeddings:"))
+    if not apply:
+        summarize_diff(diff_rows, report)
+        print("\nNo changes written. Re-run with --apply to commit.\n")
+        return
+
+    # a shared face server keeps its own gallery; other app processes pick the
+    # change up on restart or after FACE_GALLERY_TTL
+    from services.face_service import face_service
+    if face_service.remote:
+        face_service.client_changed(None)
+        print("      Face server told to reload its gallery.")
+    print(f"      Checkpoint: {checkpoint} (delete it, or use --restart, to re-encode everything next time)\n")
+
+
+# ── entry point ──────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-encode stored client photos into face_embeddings.")
+    parser.add_argument("--apply", action="store_true", help="write changes (default is a dry-run diff)")
+    parser.add_argument("--photos", default=DEFAULT_PHOTO_DIR, help="folder of <client_id>.jpg photos")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--batch-size", type=int, default=100, help="clients per transaction")
+    parser.add_argument("--replace-all", action="store_true",
+                        help="replace all of a client's embeddings instead of the nearest one")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint")
+    parser.add_argument("--report", help="dry-run: also write a per-client CSV here")
+    args = parser.parse_args()
+    run(apply=args.apply, photo_dir=args.photos, workers=args.workers, batch_size=args.batch_size,
+        replace_all=args.replace_all, checkpoint=args.checkpoint, restart=args.restart, report=args.report)
@@ -0,0 +1,81 @@
+import os
+import hmac
+import time
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+
+# Seconds an embedding token from /identify stays redeemable by /learn_face.
+LEARN_TOKEN_TTL = float(os.getenv("LEARN_TOKEN_TTL", "120"))
+# Outstanding tokens kept at most; the oldest are dropped first.
+LEARN_TOKEN_MAX = int(os.getenv("LEARN_TOKEN_MAX", "1000"))
+
+
+class EmbeddingTokens:
+    """
+    Short-lived, single-use handles on embeddings computed by /identify.
+
+    The embedding itself stays in this process; the client only gets an
+    opaque token "<nonce>.<signature>", where the signature is an HMAC of the
+    nonce and the matched client_id under the app secret. redeem() gives the
+    embedding back only for the same client_id, before the TTL, once.
+    """
+
+    def __init__(self, ttl=LEARN_TOKEN_TTL, max_entries=LEARN_TOKEN_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'issued': 0, 'redeemed': 0, 'expired': 0, 'invalid': 0}
+
+    @staticmethod
+    def _sign(secret, nonce, client_id):
+        key = secret.encode() if isinstance(secret, str) else secret
+        msg = f"{nonce}:{client_id}".encode()
+        return hmac.new(key, msg, hashlib.sha256).hexdigest()[:32]
+
+    def _purge(self, now):
+        while self._entries:
+            _, (_, _, expires) = next(iter(self._entries.items()))
+            if expires > now and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
+
+    def issue(self, client_id, embedding, secret):
+        """Store embedding for client_id and return its token."""
+        nonce = secrets.token_urlsafe(16)
+        now = time.monotonic()
+        with self._lock:
+            self._entries[nonce] = (str(client_id), list(embedding), now + self.ttl)
+            self._purge(now)
+            self._stats['issued'] += 1
+        return f"{nonce}.{self._sign(secret, nonce, client_id)}"
+
+    def redeem(self, token, client_id, secret):
+        """Return the embedding behind token if it is valid for client_id, else None."""
+        nonce, _, signature = (token or "").partition(".")
+        if not nonce or not hmac.compare_digest(signature, self._sign(secret, nonce, client_id)):
+            with self._lock:
+                self._stats['invalid'] += 1
+            return None
+        with self._lock:
+            entry = self._entries.pop(nonce, None)
+            if entry is None or entry[0] != str(client_id):
+                self._stats['invalid'] += 1
+                return None
+            if entry[2] <= time.monotonic():
+                self._stats['expired'] += 1
+                return None
+            self._stats['redeemed'] += 1
+        return entry[1]
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._stats)
+            result['outstanding'] = len(self._entries)
+        return result
+
+
+# Shared by every request thread in this process.
+embedding_tokens = EmbeddingTokens()
@@ -0,0 +1,192 @@
+import io
+import os
+import time
+import numpy as np
+from PIL import Image
+from services.photo_decode import decode_rgb
+
+# Face detection (HOG) runs on a copy of the frame shrunk by this factor; the
+# boxes found are scaled back up and landmarks/encodings are computed on the
+# full-resolution image. JPEGs are shrunk while decoding (PIL draft mode),
+# which is far cheaper than decoding at full size and resizing. 1 disables it.
+DETECT_DOWNSCALE = int(os.getenv("FACE_DETECT_DOWNSCALE", "2"))
+# Smallest face, in full-resolution pixels, that must still be detected. The
+# downscale factor is capped so such a face stays above the detector's floor.
+# The default, 40, is what full-resolution detection with one upsample finds,
+# and it leaves the frame at full size; raise it to 80 (kiosks where people
+# stand close) to let DETECT_DOWNSCALE=2 take effect.
+DETECT_MIN_FACE = int(os.getenv("FACE_DETECT_MIN_FACE", "40"))
+# Times the (small) image is upsampled by the HOG detector, as in
+# face_recognition.face_locations; each upsample halves the detectable size.
+DETECT_UPSAMPLE = int(os.getenv("FACE_DETECT_UPSAMPLE", "1"))
+
+# Capture feedback thresholds for detect_faces() metrics (see quality_issues).
+QUALITY_MIN_BRIGHTNESS = float(os.getenv("FACE_QUALITY_MIN_BRIGHTNESS", "60"))
+QUALITY_MAX_BRIGHTNESS = float(os.getenv("FACE_QUALITY_MAX_BRIGHTNESS", "210"))
+QUALITY_MIN_SHARPNESS = float(os.getenv("FACE_QUALITY_MIN_SHARPNESS", "40"))
+QUALITY_MIN_FRACTION = float(os.getenv("FACE_QUALITY_MIN_FRACTION", "0.04"))
+
+# dlib's HOG detector finds faces down to about 80 px before upsampling.
+_HOG_MIN_FACE = 80
+
+
+_engine = None
+
+
+def face_engine():
+    """
+    The face_recognition module (dlib and its model files), imported on first
+    use. Only encoder worker processes call this, so the web process and
+    report-only traffic never pay for loading it.
+    """
+    global _engine
+    if _engine is None:
+        import face_recognition
+        _engine = face_recognition
+    return _engine
+
+
+def warm_up():
+    """
+    Load the engine and run one dummy detection and encoding so the models
+    are paged in before the first real scan. Returns the seconds it took.
+    """
+    started = time.perf_counter()
+    engine = face_engine()
+    dummy = np.zeros((160, 160, 3), dtype=np.uint8)
+    engine.face_locations(dummy)
+    engine.face_encodings(dummy, known_face_locations=[(16, 144, 144, 16)])
+    return time.perf_counter() - started
+
+
+def effective_downscale(downscale=DETECT_DOWNSCALE, min_face=DETECT_MIN_FACE, upsample=DETECT_UPSAMPLE):
+    """Largest factor <= downscale that keeps a min_face face detectable."""
+    floor = _HOG_MIN_FACE / (2 ** upsample)
+    return max(1, min(downscale, int(min_face // floor)))
+
+
+def decode_for_detection(image_bytes, downscale=None):
+    """
+    Decode an encoded image into (full RGB array, small RGB array, scale),
+    where scale is full width / small width. With scale 1 both arrays are
+    the same object.
+    """
+    downscale = effective_downscale() if downscale is None else downscale
+    full = decode_rgb(image_bytes)
+    if downscale <= 1:
+        return full, full, 1.0
+
+    small_img = Image.open(io.BytesIO(image_bytes))
+    width, height = small_img.size
+    target = (max(1, width // downscale), max(1, height // downscale))
+    # draft() only applies to JPEG and picks the nearest DCT scale >= target
+    small_img.draft('RGB', target)
+    small_img = small_img.convert('RGB')
+    if small_img.size[0] > target[0] * 1.5:
+        small_img = small_img.reduce(max(1, small_img.size[0] // target[0]))
+    small = np.asarray(small_img)
+    return full, small, full.shape[1] / small.shape[1]
+
+
+def scale_boxes(boxes, scale, shape):
+    """Map (top, right, bottom, left) boxes from the small image to the full one."""
+    height, width = shape[:2]
+    mapped = []
+    for top, right, bottom, left in boxes:
+        mapped.append((
+            max(0, int(round(top * scale))),
+            min(width, int(round(right * scale))),
+            min(height, int(round(bottom * scale))),
+            max(0, int(round(left * scale))),
+        ))
+    return mapped
+
+
+def _locate(image_bytes, downscale, min_face, upsample):
+    if downscale is None:
+        downscale = effective_downscale(DETECT_DOWNSCALE, min_face, upsample)
+    full, small, scale = decode_for_detection(image_bytes, downscale)
+    boxes = face_engine().face_locations(small, number_of_times_to_upsample=upsample)
+    boxes = [b for b in scale_boxes(boxes, scale, full.shape)
+             if min(b[2] - b[0], b[1] - b[3]) >= min_face]
+    return full, boxes
+
+
+def encode_faces(image_bytes, downscale=None, min_face=DETECT_MIN_FACE, upsample=DETECT_UPSAMPLE):
+    """
+    Face encodings of an encoded image, like face_recognition.face_encodings
+    but with detection on a reduced-resolution copy. Faces smaller than
+    min_face (full-resolution pixels) are ignored.
+    """
+    full, boxes = _locate(image_bytes, downscale, min_face, upsample)
+    if not boxes:
+        return []
+    return face_engine().face_encodings(full, known_face_locations=boxes)
+
+
+def encode_faces_with_boxes(image_bytes, downscale=None, min_face=DETECT_MIN_FACE, upsample=DETECT_UPSAMPLE):
+    """
+    Every face in an encoded image as (box, encoding) pairs, largest face
+    first; box is {'top', 'right', 'bottom', 'left'} in full-resolution
+    pixels. Used to check in a whole group from one frame.
+    """
+    full, boxes = _locate(image_bytes, downscale, min_face, upsample)
+    if not boxes:
+        return []
+    boxes.sort(key=lambda b: (b[2] - b[0]) * (b[1] - b[3]), reverse=True)
+    encodings = face_engine().face_encodings(full, known_face_locations=boxes)
+    return [({'top': top, 'right': right, 'bottom': bottom, 'left': left}, enc)
+            for (top, right, bottom, left), enc in zip(boxes, encodings)]
+
+
+def face_quality(rgb, box):
+    """
+    Cheap quality metrics of one face box (top, right, bottom, left) in an
+    RGB frame: its size relative to the frame, mean brightness (0-255) and
+    sharpness as the variance of the 4-neighbour Laplacian of the face crop.
+    """
+    top, right, bottom, left = box
+    height, width = rgb.shape[:2]
+    crop = rgb[top:bottom, left:right].astype(np.float32)
+    # ITU-R BT.601 luma
+    gray = crop @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    if gray.shape[0] >= 3 and gray.shape[1] >= 3:
+        lap = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+               - 4.0 * gray[1:-1, 1:-1])
+        sharpness = float(lap.var())
+    else:
+        sharpness = 0.0
+    return {
+        'box': {'top': top, 'right': right, 'bottom': bottom, 'left': left},
+        'face_width': right - left,
+        'face_height': bottom - top,
+        'face_fraction': round((right - left) * (bottom - top) / float(width * height), 4),
+        'brightness': round(float(gray.mean()), 1) if gray.size else 0.0,
+        'sharpness': round(sharpness, 1),
+    }
+
+
+def detect_faces(image_bytes, downscale=None, min_face=DETECT_MIN_FACE, upsample=DETECT_UPSAMPLE):
+    """
+    Detection only, for capture feedback: no landmarks and no 128-d encoding.
+    Returns {'frame': {'width', 'height'}, 'faces': [face_quality(...), ...]}
+    with faces largest first.
+    """
+    full, boxes = _locate(image_bytes, downscale, min_face, upsample)
+    faces = sorted((face_quality(full, b) for b in boxes),
+                   key=lambda f: f['face_width'] * f['face_height'], reverse=True)
+    return {'frame': {'width': int(full.shape[1]), 'height': int(full.shape[0])}, 'faces': faces}
+
+
+def quality_issues(face):
+    """Human-readable problems with one face_quality() result; empty if usable."""
+    issues = []
+    if face['face_fraction'] < QUALITY_MIN_FRACTION:
+        issues.append('Face is too small; move closer to the camera.')
+    if face['brightness'] < QUALITY_MIN_BRIGHTNESS:
+        issues.append('Face is too dark; improve the lighting.')
+    elif face['brightness'] > QUALITY_MAX_BRIGHTNESS:
+        issues.append('Face is overexposed; reduce direct light.')
+    if face['sharpness'] < QUALITY_MIN_SHARPNESS:
+        issues.append('Image is blurry; hold still.')
+    return issues
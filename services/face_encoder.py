@@ -0,0 +1,194 @@
+import os
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from services.face_detect import encode_faces, encode_faces_with_boxes, detect_faces, warm_up
+
+# Worker processes doing dlib face encoding. Defaults to one per core.
+ENCODER_WORKERS = int(os.getenv("FACE_ENCODER_WORKERS", "0")) or os.cpu_count() or 1
+# Requests allowed to wait for a free worker on top of the ones being encoded.
+# Beyond that, kiosk endpoints get an immediate 503 instead of piling up.
+ENCODER_MAX_QUEUE = int(os.getenv("FACE_ENCODER_MAX_QUEUE", str(2 * ENCODER_WORKERS)))
+# Seconds a request waits for its encoding before giving up.
+ENCODER_TIMEOUT = float(os.getenv("FACE_ENCODER_TIMEOUT", "30"))
+# Value of the Retry-After header sent with the 503.
+ENCODER_RETRY_AFTER = int(os.getenv("FACE_ENCODER_RETRY_AFTER", "2"))
+
+
+class EncoderBusy(Exception):
+    """Raised when the encoding queue is full; map it to 503 + Retry-After."""
+
+    def __init__(self, retry_after=ENCODER_RETRY_AFTER):
+        super().__init__("Face encoder is busy, please retry")
+        self.retry_after = retry_after
+
+
+def _encode_in_worker(image_bytes, submitted_at):
+    # Runs in a pool process. face_recognition is imported (by face_engine)
+    # here so the web process never has to load it just to hand work over.
+    # Wall-clock times are returned because monotonic clocks are not
+    # comparable across processes.
+    started_at = time.time()
+    encodings = encode_faces(image_bytes)
+    return encodings, started_at - submitted_at, time.time() - started_at
+
+
+def _encode_boxes_in_worker(image_bytes, submitted_at):
+    # Same as _encode_in_worker, but every face with its box.
+    started_at = time.time()
+    faces = encode_faces_with_boxes(image_bytes)
+    return faces, started_at - submitted_at, time.time() - started_at
+
+
+def _detect_in_worker(image_bytes, submitted_at):
+    # Same as _encode_in_worker, but detection and quality metrics only.
+    started_at = time.time()
+    result = detect_faces(image_bytes)
+    return result, started_at - submitted_at, time.time() - started_at
+
+
+def _warm_up_in_worker(_image_bytes, submitted_at):
+    started_at = time.time()
+    warm_up()
+    return os.getpid(), started_at - submitted_at, time.time() - started_at
+
+
+class FaceEncoder:
+    """
+    Bounded process pool for face encoding.
+
+    At most workers + max_queue encodings are admitted at once; encode()
+    raises EncoderBusy past that unless block=True, in which case it waits up
+    to the timeout for a slot. Queue wait (admission to a worker picking the
+    job up) and encode time are tracked separately in stats().
+    """
+
+    def __init__(self, workers=ENCODER_WORKERS, max_queue=ENCODER_MAX_QUEUE, timeout=ENCODER_TIMEOUT):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._pool = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'in_flight': 0,
+            'queue_wait_total_s': 0.0, 'queue_wait_max_s': 0.0,
+            'encode_total_s': 0.0, 'encode_max_s': 0.0,
+            'detected': 0, 'detect_total_s': 0.0, 'detect_max_s': 0.0,
+        }
+
+    def _get_pool(self):
+        # Created on first use so importing the routes does not fork workers.
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def _record(self, **deltas):
+        with self._lock:
+            for key, value in deltas.items():
+                if key.endswith('_max_s'):
+                    self._stats[key] = max(self._stats[key], value)
+                else:
+                    self._stats[key] += value
+
+    def _submit(self, image_bytes, block, fn=_encode_in_worker):
+        admitted = self._slots.acquire(timeout=self.timeout) if block else self._slots.acquire(blocking=False)
+        if not admitted:
+            self._record(rejected=1)
+            raise EncoderBusy()
+
+        self._record(submitted=1, in_flight=1)
+        try:
+            future = self._get_pool().submit(fn, image_bytes, time.time())
+        except Exception:
+            self._release(None)
+            self._record(failed=1)
+            raise
+        # The slot is held until the worker is actually done, even if this
+        # request times out, so the pool never takes more than its bound.
+        future.add_done_callback(self._release)
+        return future
+
+    def _collect(self, future, kind='encode'):
+        try:
+            result, queue_wait, run_time = future.result(timeout=self.timeout)
+        except BrokenProcessPool:
+            # a worker died (e.g. dlib crashed); start a fresh pool next time
+            with self._lock:
+                self._pool = None
+            self._record(failed=1)
+            raise
+        except Exception:
+            self._record(failed=1)
+            raise
+
+        if kind == 'detect':
+            self._record(detected=1, queue_wait_total_s=queue_wait, queue_wait_max_s=queue_wait,
+                         detect_total_s=run_time, detect_max_s=run_time)
+        elif kind == 'encode':
+            self._record(completed=1, queue_wait_total_s=queue_wait, queue_wait_max_s=queue_wait,
+                         encode_total_s=run_time, encode_max_s=run_time)
+        return result
+
+    def encode(self, image_bytes, block=False):
+        """Return the list of face encodings found in an encoded image (JPEG/PNG bytes)."""
+        return self._collect(self._submit(image_bytes, block))
+
+    def encode_with_boxes(self, image_bytes, block=False):
+        """Every face in an encoded image as (box, encoding) pairs, largest first."""
+        return self._collect(self._submit(image_bytes, block, _encode_boxes_in_worker))
+
+    def detect(self, image_bytes, block=False):
+        """
+        Detection-only check of an encoded image: face boxes plus size,
+        brightness and sharpness (see services.face_detect.detect_faces).
+        Skips landmarks and the 128-d encoding, so it is much cheaper.
+        """
+        return self._collect(self._submit(image_bytes, block, _detect_in_worker), kind='detect')
+
+    def encode_many(self, images, block=True):
+        """
+        Encode several images in parallel, e.g. the center/left/right photos of
+        one enrollment. Returns one encodings list per image, in order; empty
+        inputs give None. Total latency is roughly that of the slowest image.
+        """
+        futures = [self._submit(image_bytes, block) if image_bytes else None for image_bytes in images]
+        return [self._collect(f) if f is not None else None for f in futures]
+
+    def warm_up(self):
+        """
+        Start every worker and have it load the face engine and run a dummy
+        encoding, so the first real scans do not pay for it. Returns the
+        number of distinct worker processes that were warmed.
+        """
+        # one task per worker, submitted together, so the pool spawns them all
+        futures = [self._submit(b"", True, _warm_up_in_worker) for _ in range(self.workers)]
+        pids = {self._collect(f, kind='warm_up') for f in futures}
+        return len(pids)
+
+    def _release(self, _future):
+        self._record(in_flight=-1)
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        done = stats['completed'] or 1
+        stats['queue_wait_avg_s'] = stats['queue_wait_total_s'] / ((stats['completed'] + stats['detected']) or 1)
+        stats['encode_avg_s'] = stats['encode_total_s'] / done
+        stats['detect_avg_s'] = stats['detect_total_s'] / (stats['detected'] or 1)
+        stats['workers'] = self.workers
+        stats['max_queue'] = self.max_queue
+        return stats
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+# Shared by every request thread in this process.
+face_encoder = FaceEncoder()
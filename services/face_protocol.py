@@ -0,0 +1,104 @@
+import os
+import json
+import socket
+import struct
+import numpy as np
+from models.embedding_codec import encode_embeddings, decode_embeddings, FORMAT_F64
+
+# Wire format between the web workers and services/face_server.py. Every
+# request and response is one frame:
+#
+#   byte 0     protocol version (VERSION)
+#   byte 1     op code (request) or status (response)
+#   bytes 2-3  length of the metadata, little-endian uint16
+#   bytes 4-7  length of the body, little-endian uint32
+#   metadata   small UTF-8 JSON object (k, client_id, distances, ...)
+#   body       raw bytes: the encoded image in requests, embeddings in the
+#              binary column format (models/embedding_codec.py) in responses
+#
+# Images and embeddings never go through base64 or JSON.
+VERSION = 1
+_HEADER = struct.Struct("<BBHI")
+
+OP_PING = 1
+OP_ENCODE = 2
+OP_ENCODE_MANY = 3
+OP_DETECT = 4
+OP_IDENTIFY = 5
+OP_VERIFY = 6
+OP_CLIENT_CHANGED = 7
+OP_STATS = 8
+OP_IDENTIFY_ALL = 9
+
+STATUS_OK = 0
+STATUS_BUSY = 1
+STATUS_ERROR = 2
+
+MAX_BODY = 64 * 1024 * 1024
+
+# Where the face server listens: "unix:/path/to.sock" or "tcp:host:port".
+# Unix sockets are used where the platform has them (Linux, macOS); on
+# Windows the server and client fall back to TCP on localhost.
+DEFAULT_SOCKET = os.getenv("FACE_SERVER_SOCKET", "/tmp/hr-logbook-face.sock")
+DEFAULT_PORT = int(os.getenv("FACE_SERVER_PORT", "5055"))
+
+
+def default_address():
+    if hasattr(socket, "AF_UNIX"):
+        return f"unix:{DEFAULT_SOCKET}"
+    return f"tcp:127.0.0.1:{DEFAULT_PORT}"
+
+
+def parse_address(address):
+    """Return (family, sockaddr) for a "unix:..." or "tcp:host:port" address."""
+    kind, _, rest = address.partition(":")
+    if kind == "unix":
+        if not hasattr(socket, "AF_UNIX"):
+            raise ValueError("Unix sockets are not available on this platform; use tcp:127.0.0.1:<port>")
+        return socket.AF_UNIX, rest
+    if kind == "tcp":
+        host, _, port = rest.rpartition(":")
+        return socket.AF_INET, (host or "127.0.0.1", int(port))
+    raise ValueError(f"Bad face server address {address!r}; expected unix:<path> or tcp:<host>:<port>")
+
+
+def _recv_exact(sock, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    got = 0
+    while got < size:
+        n = sock.recv_into(view[got:], size - got)
+        if not n:
+            raise ConnectionError("face server connection closed")
+        got += n
+    return bytes(buf)
+
+
+def send_message(sock, code, meta=None, body=b""):
+    meta_bytes = json.dumps(meta, separators=(",", ":")).encode("utf-8") if meta else b""
+    sock.sendall(_HEADER.pack(VERSION, code, len(meta_bytes), len(body)) + meta_bytes)
+    if body:
+        sock.sendall(body)
+
+
+def recv_message(sock):
+    """Read one frame; returns (code, meta dict, body bytes)."""
+    version, code, meta_len, body_len = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if version != VERSION:
+        raise ConnectionError(f"face server protocol version {version}, expected {VERSION}")
+    if body_len > MAX_BODY:
+        raise ConnectionError(f"face server frame too large ({body_len} bytes)")
+    meta = json.loads(_recv_exact(sock, meta_len)) if meta_len else {}
+    body = _recv_exact(sock, body_len) if body_len else b""
+    return code, meta, body
+
+
+def pack_vectors(vectors):
+    """Embeddings -> body bytes (empty for no vectors)."""
+    vectors = [np.asarray(v, dtype=np.float64) for v in vectors]
+    return encode_embeddings(vectors, FORMAT_F64) if vectors else b""
+
+
+def unpack_vectors(body):
+    """Body bytes -> list of 1-d float64 arrays."""
+    return list(decode_embeddings(body)) if body else []
@@ -0,0 +1,152 @@
+"""
+face_server.py
+==============
+Shared face inference server. One process owns the dlib models (in its
+encoder worker pool) and the client embedding gallery, and serves encode,
+detect, identify and verify requests from the web workers over a Unix
+domain socket (TCP on localhost where Unix sockets are unavailable, i.e.
+Windows). See services/face_protocol.py for the wire format.
+
+Point the web app at it with FACE_SERVER=auto (or the same address):
+
+  python -m services.face_server
+  python -m services.face_server --address unix:/run/hr-logbook/face.sock
+  python -m services.face_server --address tcp:127.0.0.1:5055
+"""
+
+import os
+import sys
+import argparse
+import socket
+import socketserver
+
+# ── allow "python services/face_server.py" as well as "-m" ─────────────────
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from services import face_protocol as proto  # noqa: E402
+from services.face_encoder import EncoderBusy  # noqa: E402
+from services.face_service import LocalFaceService  # noqa: E402
+from services.warmup import start_warmup, ready, state as warmup_state  # noqa: E402
+
+
+class FaceRequestHandler(socketserver.BaseRequestHandler):
+    """Serves frames on one connection until the client closes it."""
+
+    def handle(self):
+        service = self.server.service
+        while True:
+            try:
+                op, meta, body = proto.recv_message(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                reply, payload = self.dispatch(service, op, meta, body)
+                proto.send_message(self.request, proto.STATUS_OK, reply, payload)
+            except EncoderBusy as e:
+                proto.send_message(self.request, proto.STATUS_BUSY, {'retry_after': e.retry_after})
+            except Exception as e:
+                print(f"Face server: op {op} failed: {e}")
+                proto.send_message(self.request, proto.STATUS_ERROR, {'error': str(e)})
+
+    def dispatch(self, service, op, meta, body):
+        if op == proto.OP_ENCODE:
+            return None, proto.pack_vectors(service.encode(body, block=meta.get('block', False)))
+
+        if op == proto.OP_ENCODE_MANY:
+            images, pos = [], 0
+            for size in meta['sizes']:
+                images.append(body[pos:pos + size] if size else None)
+                pos += size
+            results = service.encode_many(images, block=meta.get('block', True))
+            counts = [None if r is None else len(r) for r in results]
+            vectors = [v for r in results if r for v in r]
+            return {'counts': counts}, proto.pack_vectors(vectors)
+
+        if op == proto.OP_DETECT:
+            return service.detect(body, block=meta.get('block', False)), b""
+
+        if op == proto.OP_IDENTIFY:
+            encoding, matches, margin = service.identify(body, k=int(meta.get('k', 1)))
+            reply = {'matches': [[cid, float(dist)] for cid, dist in matches], 'margin': margin}
+            return reply, proto.pack_vectors([encoding] if encoding is not None else [])
+
+        if op == proto.OP_IDENTIFY_ALL:
+            faces = service.identify_all(body)
+            reply = {'faces': [{'box': box, 'client_id': cid, 'distance': dist} for box, _, cid, dist in faces]}
+            return reply, proto.pack_vectors([enc for _, enc, _, _ in faces])
+
+        if op == proto.OP_VERIFY:
+            encoding, matched, distance = service.verify(meta['client_id'], body)
+            reply = {'match': bool(matched), 'distance': distance}
+            return reply, proto.pack_vectors([encoding] if encoding is not None else [])
+
+        if op == proto.OP_CLIENT_CHANGED:
+            from models.face_embedding_model import reload_client_embeddings
+            reload_client_embeddings(meta.get('client_id'))
+            return None, b""
+
+        if op == proto.OP_PING:
+            return {'ready': ready()}, b""
+
+        if op == proto.OP_STATS:
+            stats = service.stats()
+            stats['warm_up'] = warmup_state()
+            return stats, b""
+
+        raise ValueError(f"unknown op {op}")
+
+
+class _ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def make_server(address, service):
+    family, sockaddr = proto.parse_address(address)
+    if family == socket.AF_INET:
+        server = _ThreadingTCPServer(sockaddr, FaceRequestHandler)
+    else:
+        # a stale socket file from a crashed run would make bind() fail
+        if os.path.exists(sockaddr):
+            os.unlink(sockaddr)
+        server = _ThreadingUnixServer(sockaddr, FaceRequestHandler)
+        os.chmod(sockaddr, 0o660)
+    server.service = service
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared face inference server.")
+    parser.add_argument("--address", default=proto.default_address(),
+                        help="unix:<path> or tcp:<host>:<port> (default: %(default)s)")
+    parser.add_argument("--no-warmup", action="store_true", help="skip loading the engine and gallery at start")
+    args = parser.parse_args()
+
+    service = LocalFaceService()
+    server = make_server(args.address, service)
+    if not args.no_warmup:
+        from models.face_embedding_model import face_gallery
+        start_warmup([
+            ("face_engine", service.warm_up),
+            ("face_gallery", lambda: len(face_gallery)),
+        ])
+    print(f"Face server listening on {args.address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        family, sockaddr = proto.parse_address(args.address)
+        if family != socket.AF_INET and os.path.exists(sockaddr):
+            os.unlink(sockaddr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import os
+import socket
+import threading
+from services.face_encoder import face_encoder, EncoderBusy, ENCODER_TIMEOUT
+from services import face_protocol as proto
+
+# Address of a shared face server (services/face_server.py), e.g.
+# "unix:/tmp/hr-logbook-face.sock" or "tcp:127.0.0.1:5055", or "auto" for
+# the platform default. Empty (default): encode and match in this process.
+FACE_SERVER = os.getenv("FACE_SERVER", "").strip()
+
+
+class LocalFaceService:
+    """
+    Face operations in this process: encodings from the local worker pool
+    (services/face_encoder.py), matching against this process's gallery.
+    The face server runs one of these on behalf of all web workers.
+    """
+
+    remote = False
+
+    def encode(self, image_bytes, block=False):
+        """List of face encodings found in an encoded image."""
+        return face_encoder.encode(image_bytes, block=block)
+
+    def encode_many(self, images, block=True):
+        return face_encoder.encode_many(images, block=block)
+
+    def detect(self, image_bytes, block=False):
+        return face_encoder.detect(image_bytes, block=block)
+
+    def identify(self, image_bytes, k=1):
+        """
+        1:N search. Returns (encoding, matches, margin): the probe encoding
+        (None if no face), up to k (client_id, distance) matches within the
+        threshold, nearest first, and the best-vs-second margin.
+        """
+        from models.face_embedding_model import find_top_k
+        encodings = self.encode(image_bytes)
+        if not encodings:
+            return None, [], None
+        encoding = list(encodings[0])
+        matches, margin = find_top_k(encoding, k=k)
+        return encoding, matches, margin
+
+    def identify_all(self, image_bytes):
+        """
+        1:N search for every face in the frame, batched into one gallery
+        pass. Returns [(box, encoding, client_id, distance), ...], largest
+        face first; client_id and distance are None for unmatched faces.
+        """
+        from models.face_embedding_model import find_best_matches
+        faces = face_encoder.encode_with_boxes(image_bytes)
+        if not faces:
+            return []
+        encodings = [list(enc) for _, enc in faces]
+        matches = find_best_matches(encodings)
+        return [(box, enc, client_id, distance)
+                for (box, _), enc, (client_id, distance) in zip(faces, encodings, matches)]
+
+    def verify(self, client_id, image_bytes):
+        """1:1 check against one client. Returns (encoding, matched, distance)."""
+        from models.face_embedding_model import verify_client_face
+        encodings = self.encode(image_bytes)
+        if not encodings:
+            return None, False, None
+        encoding = list(encodings[0])
+        matched, distance = verify_client_face(client_id, encoding)
+        return encoding, matched, distance
+
+    def client_changed(self, client_id):
+        # the write paths already updated this process's gallery
+        pass
+
+    def warm_up(self):
+        return face_encoder.warm_up()
+
+    def stats(self):
+        return face_encoder.stats()
+
+
+class RemoteFaceService:
+    """
+    Thin client for services/face_server.py with the same interface as
+    LocalFaceService. The web process then never loads dlib or the client
+    gallery. Each request thread keeps one persistent connection.
+    """
+
+    remote = True
+
+    def __init__(self, address, timeout=ENCODER_TIMEOUT + 5):
+        self.address = address
+        self.family, self.sockaddr = proto.parse_address(address)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.sockaddr)
+        if self.family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _drop(self):
+        sock = getattr(self._local, 'sock', None)
+        self._local.sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _call(self, op, meta=None, body=b""):
+        # One retry on a fresh connection covers a server restart between
+        # requests; a second failure is raised to the route.
+        for attempt in (1, 2):
+            sock = getattr(self._local, 'sock', None)
+            try:
+                if sock is None:
+                    sock = self._local.sock = self._connect()
+                proto.send_message(sock, op, meta, body)
+                status, reply, payload = proto.recv_message(sock)
+                break
+            except (OSError, ConnectionError):
+                self._drop()
+                if attempt == 2:
+                    raise
+        if status == proto.STATUS_BUSY:
+            raise EncoderBusy(reply.get('retry_after', 1))
+        if status != proto.STATUS_OK:
+            raise RuntimeError(reply.get('error', 'face server error'))
+        return reply, payload
+
+    def encode(self, image_bytes, block=False):
+        _, payload = self._call(proto.OP_ENCODE, {'block': block}, image_bytes)
+        return proto.unpack_vectors(payload)
+
+    def encode_many(self, images, block=True):
+        sizes = [len(b) if b else 0 for b in images]
+        reply, payload = self._call(proto.OP_ENCODE_MANY, {'block': block, 'sizes': sizes},
+                                    b"".join(b for b in images if b))
+        vectors = proto.unpack_vectors(payload)
+        results, pos = [], 0
+        for count in reply['counts']:
+            if count is None:
+                results.append(None)
+            else:
+                results.append(vectors[pos:pos + count])
+                pos += count
+        return results
+
+    def detect(self, image_bytes, block=False):
+        reply, _ = self._call(proto.OP_DETECT, {'block': block}, image_bytes)
+        return reply
+
+    def identify(self, image_bytes, k=1):
+        reply, payload = self._call(proto.OP_IDENTIFY, {'k': k}, image_bytes)
+        vectors = proto.unpack_vectors(payload)
+        if not vectors:
+            return None, [], None
+        return list(vectors[0]), [tuple(m) for m in reply['matches']], reply.get('margin')
+
+    def identify_all(self, image_bytes):
+        reply, payload = self._call(proto.OP_IDENTIFY_ALL, None, image_bytes)
+        vectors = proto.unpack_vectors(payload)
+        return [(face['box'], list(vec), face['client_id'], face['distance'])
+                for face, vec in zip(reply['faces'], vectors)]
+
+    def verify(self, client_id, image_bytes):
+        reply, payload = self._call(proto.OP_VERIFY, {'client_id': client_id}, image_bytes)
+        vectors = proto.unpack_vectors(payload)
+        if not vectors:
+            return None, False, None
+        return list(vectors[0]), reply['match'], reply.get('distance')
+
+    def client_changed(self, client_id):
+        """Tell the server to re-read a client's embeddings (None: all)."""
+        self._call(proto.OP_CLIENT_CHANGED, {'client_id': client_id})
+
+    def warm_up(self):
+        # the server warms its own workers; succeeding here means it is up
+        reply, _ = self._call(proto.OP_PING)
+        if not reply.get('ready'):
+            raise RuntimeError("face server is still warming up")
+        return reply
+
+    def stats(self):
+        reply, _ = self._call(proto.OP_STATS)
+        reply['server'] = self.address
+        return reply
+
+
+def _make_service():
+    if not FACE_SERVER:
+        return LocalFaceService()
+    address = proto.default_address() if FACE_SERVER == "auto" else FACE_SERVER
+    return RemoteFaceService(address)
+
+
+# Used by the routes for every face operation.
+face_service = _make_service()
@@ -0,0 +1,93 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Seconds an /identify result is reused for the same frame from the same
+# kiosk. 0 disables the cache.
+IDENTIFY_CACHE_TTL = float(os.getenv("IDENTIFY_CACHE_TTL", "3"))
+# Cached results kept at most, across all kiosks (least recently used go first).
+IDENTIFY_CACHE_SIZE = int(os.getenv("IDENTIFY_CACHE_SIZE", "256"))
+
+
+def frame_hash(image_bytes):
+    """
+    Cache key of an encoded frame: a 128-bit blake2b digest of its bytes. A
+    kiosk retry or double tap re-sends the very same JPEG; a new capture,
+    however similar it looks, has different bytes and misses.
+    """
+    return hashlib.blake2b(image_bytes, digest_size=16).digest()
+
+
+class FrameCache:
+    """
+    Short-TTL LRU of /identify results keyed by (scope, frame digest, k).
+
+    Only the byte-identical frame within the same scope (kiosk) hits: a retry
+    or double tap re-sends the same frame, while any new capture may show
+    someone else and has to go through the matcher. Entries remember the
+    matched owner; invalidate_owner() drops them when that owner's
+    embeddings change (None drops everything).
+    """
+
+    def __init__(self, ttl=IDENTIFY_CACHE_TTL, max_entries=IDENTIFY_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'invalidated': 0, 'expired': 0}
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    def get(self, scope, frame, k=1):
+        """Cached result for this frame hash, or None."""
+        now = time.monotonic()
+        with self._lock:
+            key = (scope, frame, k)
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] <= now:
+                del self._entries[key]
+                self._stats['expired'] += 1
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[1]
+
+    def put(self, scope, frame, k, owner, result):
+        with self._lock:
+            self._entries[(scope, frame, k)] = (owner, result, time.monotonic() + self.ttl)
+            self._entries.move_to_end((scope, frame, k))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._stats['stores'] += 1
+
+    def invalidate_owner(self, owner):
+        with self._lock:
+            if owner is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+            else:
+                stale = [key for key, entry in self._entries.items() if entry[0] == owner]
+                for key in stale:
+                    del self._entries[key]
+                dropped = len(stale)
+            self._stats['invalidated'] += dropped
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['ttl_s'] = self.ttl
+        return stats
+
+
+# Shared by every request thread in this process.
+identify_cache = FrameCache()
@@ -0,0 +1,156 @@
+import os
+import time
+import queue
+import atexit
+import threading
+
+# Samples waiting to be written; /learn_face drops new ones past this.
+LEARN_QUEUE_MAX = int(os.getenv("LEARN_QUEUE_MAX", "1000"))
+# Most samples applied in one transaction.
+LEARN_BATCH_MAX = int(os.getenv("LEARN_BATCH_MAX", "50"))
+# Seconds the worker keeps collecting after the first sample of a batch, so
+# back-to-back check-ins end up in the same transaction.
+LEARN_FLUSH_INTERVAL = float(os.getenv("LEARN_FLUSH_INTERVAL", "0.5"))
+
+
+class LearningQueue:
+    """
+    In-process write-behind queue for check-in face learning.
+
+    enqueue() only puts (client_id, embedding) on a bounded queue and returns.
+    A daemon thread collects samples for up to `interval` seconds (or
+    `batch_max` samples) and hands the batch to `apply_batch`, which writes
+    it in one transaction and returns one result per sample. Pending samples
+    are flushed at interpreter exit.
+    """
+
+    def __init__(self, apply_batch, maxsize=LEARN_QUEUE_MAX, batch_max=LEARN_BATCH_MAX,
+                 interval=LEARN_FLUSH_INTERVAL):
+        self._apply_batch = apply_batch
+        self.batch_max = batch_max
+        self.interval = interval
+        self._queue = queue.Queue(maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._stats = {
+            'enqueued': 0, 'dropped': 0, 'applied': 0, 'failed': 0, 'batches': 0, 'clients': 0,
+            'flush_total_s': 0.0, 'flush_max_s': 0.0, 'flush_last_s': 0.0,
+            'wait_total_s': 0.0, 'wait_max_s': 0.0, 'results': {},
+        }
+
+    def _ensure_worker(self):
+        # Started on first use so importing the routes does not spawn threads.
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="learning-queue", daemon=True)
+                self._thread.start()
+
+    def enqueue(self, client_id, embedding):
+        """Queue one sample. Returns False (and counts a drop) when the queue is full."""
+        try:
+            self._queue.put_nowait((client_id, list(embedding), time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self._stats['dropped'] += 1
+            return False
+        with self._lock:
+            self._stats['enqueued'] += 1
+        self._ensure_worker()
+        return True
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_max:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            stop = None in batch
+            self.flush([item for item in batch if item is not None])
+            if stop:
+                return
+
+    def flush(self, batch):
+        if not batch:
+            return
+        started = time.monotonic()
+        try:
+            results = self._apply_batch([(client_id, emb) for client_id, emb, _ in batch])
+        except Exception as e:
+            print(f"Learning queue: failed to apply {len(batch)} sample(s): {e}")
+            with self._lock:
+                self._stats['failed'] += len(batch)
+            return
+        finished = time.monotonic()
+        elapsed = finished - started
+        oldest_wait = finished - min(queued_at for _, _, queued_at in batch)
+        with self._lock:
+            s = self._stats
+            s['applied'] += len(batch)
+            s['batches'] += 1
+            s['clients'] += len({client_id for client_id, _, _ in batch})
+            s['flush_total_s'] += elapsed
+            s['flush_max_s'] = max(s['flush_max_s'], elapsed)
+            s['flush_last_s'] = elapsed
+            s['wait_total_s'] += oldest_wait
+            s['wait_max_s'] = max(s['wait_max_s'], oldest_wait)
+            for result in results:
+                s['results'][result] = s['results'].get(result, 0) + 1
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['results'] = dict(self._stats['results'])
+        batches = stats['batches'] or 1
+        stats['depth'] = self.depth()
+        stats['flush_avg_s'] = stats['flush_total_s'] / batches
+        stats['wait_avg_s'] = stats['wait_total_s'] / batches
+        stats['samples_per_batch'] = stats['applied'] / batches
+        return stats
+
+    def stop(self, timeout=10):
+        """Flush what is queued and stop the worker."""
+        with self._lock:
+            if self._stopping:
+                return
+            self._stopping = True
+            thread = self._thread
+        if thread is None or not thread.is_alive():
+            pending = []
+            while True:
+                try:
+                    pending.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.flush(pending)
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
+
+
+def _apply_learning_batch(samples):
+    # imported here so this module does not pull in the DB layer on import
+    from models.face_embedding_model import improve_client_embeddings
+    return improve_client_embeddings(samples)
+
+
+# Shared by every request thread in this process.
+learning_queue = LearningQueue(_apply_learning_batch)
+atexit.register(learning_queue.stop)
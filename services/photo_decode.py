@@ -0,0 +1,118 @@
+import io
+import os
+import time
+import binascii
+import threading
+import numpy as np
+from PIL import Image
+
+# Largest decoded photo accepted from the browser. Checked from the base64
+# length before anything is decoded, so oversized posts cost next to nothing.
+PHOTO_MAX_BYTES = int(os.getenv("PHOTO_MAX_BYTES", str(5 * 1024 * 1024)))
+
+# A data URL header ("data:image/jpeg;base64,") is short; never scan further.
+_HEADER_MAX = 64
+
+
+class PhotoTooLarge(ValueError):
+    """Raised when a photo payload exceeds PHOTO_MAX_BYTES; map it to 413."""
+
+    def __init__(self, size, limit=PHOTO_MAX_BYTES):
+        super().__init__(f"Photo too large ({size} bytes, limit {limit})")
+        self.size = size
+        self.limit = limit
+
+
+_lock = threading.Lock()
+_stats = {'decoded': 0, 'binary': 0, 'rejected': 0, 'failed': 0, 'bytes_total': 0,
+          'decode_total_s': 0.0, 'decode_max_s': 0.0}
+
+
+def _record(**deltas):
+    with _lock:
+        for key, value in deltas.items():
+            if key.endswith('_max_s'):
+                _stats[key] = max(_stats[key], value)
+            else:
+                _stats[key] += value
+
+
+def stats():
+    with _lock:
+        result = dict(_stats)
+    result['decode_avg_s'] = result['decode_total_s'] / (result['decoded'] or 1)
+    result['max_bytes'] = PHOTO_MAX_BYTES
+    return result
+
+
+def payload_offset(raw):
+    """Index in raw (bytes) where the base64 payload starts: after the data URL comma, else 0."""
+    if raw[:5] == b'data:':
+        comma = raw.find(b',', 0, _HEADER_MAX)
+        if comma >= 0:
+            return comma + 1
+    return 0
+
+
+def decoded_size(payload_len, tail=b''):
+    """Exact decoded length of a base64 payload given its length and last bytes."""
+    return payload_len // 4 * 3 - tail[-2:].count(b'=')
+
+
+def decode_photo_data(photo_data, max_bytes=None):
+    """
+    Decode a photo posted as a data URL or bare base64 (str or bytes) into the
+    encoded image bytes (JPEG/PNG). Raises PhotoTooLarge past max_bytes and
+    ValueError on malformed base64.
+
+    Only the header is scanned for the comma; the payload is passed to the
+    base64 decoder as a memoryview of the posted data, so the only copy made
+    is the decoded output itself (plus one ASCII encode for str input).
+    """
+    max_bytes = PHOTO_MAX_BYTES if max_bytes is None else max_bytes
+    started = time.perf_counter()
+    raw = photo_data.encode('ascii') if isinstance(photo_data, str) else photo_data
+    payload = memoryview(raw)[payload_offset(raw):]
+
+    size = decoded_size(len(payload), bytes(payload[-2:]))
+    if max_bytes and size > max_bytes:
+        _record(rejected=1)
+        raise PhotoTooLarge(size, max_bytes)
+
+    try:
+        image_bytes = binascii.a2b_base64(payload)
+    except binascii.Error as e:
+        _record(failed=1)
+        raise ValueError(f"Invalid base64 photo data: {e}")
+    elapsed = time.perf_counter() - started
+    _record(decoded=1, bytes_total=len(image_bytes), decode_total_s=elapsed, decode_max_s=elapsed)
+    return image_bytes
+
+
+def accept_photo_bytes(image_bytes, max_bytes=None):
+    """
+    Size-check a photo that was uploaded as raw bytes (image/jpeg body or a
+    multipart file part) and count it; no base64 decoding is needed.
+    """
+    max_bytes = PHOTO_MAX_BYTES if max_bytes is None else max_bytes
+    if max_bytes and len(image_bytes) > max_bytes:
+        _record(rejected=1)
+        raise PhotoTooLarge(len(image_bytes), max_bytes)
+    _record(binary=1, bytes_total=len(image_bytes))
+    return image_bytes
+
+
+def decode_rgb(image_bytes, draft_size=None):
+    """
+    Decode encoded image bytes straight to an (h, w, 3) uint8 RGB array.
+
+    BytesIO shares the bytes object rather than copying it. With draft_size,
+    JPEGs are decoded at the smallest DCT scale that is still at least that
+    (width, height).
+    """
+    img = Image.open(io.BytesIO(image_bytes))
+    if draft_size is not None:
+        img.draft('RGB', draft_size)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return np.asarray(img)
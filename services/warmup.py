@@ -0,0 +1,62 @@
+import os
+import time
+import threading
+
+# Warm the face engine and galleries in the background at boot (1) or not
+# at all (0). With 0 the node reports ready immediately and the first scans
+# pay for loading instead.
+FACE_WARMUP = os.getenv("FACE_WARMUP", "1") == "1"
+# Seconds between retries of a failed step (e.g. MySQL not up yet).
+FACE_WARMUP_RETRY = float(os.getenv("FACE_WARMUP_RETRY", "10"))
+
+_lock = threading.Lock()
+_state = {'started': False, 'ready': not FACE_WARMUP, 'error': None, 'steps': {}}
+
+
+def _run(steps, retry):
+    started = time.monotonic()
+    for name, step in steps:
+        while True:
+            step_started = time.monotonic()
+            try:
+                detail = step()
+                break
+            except Exception as e:
+                print(f"Warm-up: {name} failed, retrying in {retry:.0f}s: {e}")
+                with _lock:
+                    _state['error'] = f"{name}: {e}"
+                    _state['steps'][name] = {'ok': False, 'error': str(e)}
+            time.sleep(retry)
+        elapsed = time.monotonic() - step_started
+        print(f"Warm-up: {name} done in {elapsed:.2f}s")
+        with _lock:
+            _state['steps'][name] = {'ok': True, 'seconds': round(elapsed, 3), 'detail': detail}
+    with _lock:
+        _state['ready'] = True
+        _state['error'] = None
+        _state['seconds'] = round(time.monotonic() - started, 3)
+
+
+def start_warmup(steps, retry=FACE_WARMUP_RETRY):
+    """
+    Run (name, callable) steps in order on a daemon thread; ready() turns
+    true once all of them succeed. A failing step is reported by state() and
+    retried every `retry` seconds. Calling this again is a no-op.
+    """
+    with _lock:
+        if _state['started'] or not FACE_WARMUP:
+            return
+        _state['started'] = True
+    threading.Thread(target=_run, args=(list(steps), retry), name="warm-up", daemon=True).start()
+
+
+def ready():
+    with _lock:
+        return _state['ready']
+
+
+def state():
+    with _lock:
+        result = dict(_state)
+        result['steps'] = {name: dict(info) for name, info in _state['steps'].items()}
+    return result
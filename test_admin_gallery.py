@@ -0,0 +1,116 @@
+import io
+import json
+import zipfile
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+import numpy as np
+from models import admin_model
+from models.admin_model import add_admin, admin_gallery, find_best_admin_match
+from models.embedding_codec import encode_embeddings
+import routes.backup_routes as backup_routes
+from app import app
+
+
+def _vec(x, i=0):
+    vector = np.zeros(128)
+    vector[i] = x
+    return vector
+
+
+class FakeAdminsCursor:
+    """Serves admins rows to the gallery loader and records INSERTs."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.loads = 0
+        self.lastrowid = None
+
+    def execute(self, sql, params=()):
+        if sql.startswith("INSERT INTO admins"):
+            self.lastrowid = max(r['id'] for r in self.rows) + 1
+            self.rows.append({'id': self.lastrowid, 'face_embedding': None, 'face_embedding_blob': params[5]})
+        elif "FROM admins" in sql:
+            self.loads += 1
+
+    def fetchall(self):
+        return [dict(r) for r in self.rows if r['face_embedding_blob'] or r['face_embedding']]
+
+
+class TestAdminGallery(unittest.TestCase):
+
+    def setUp(self):
+        self.cursor = FakeAdminsCursor([
+            # binary column, two angles
+            {'id': 1, 'face_embedding': None, 'face_embedding_blob': encode_embeddings([_vec(1, 0), _vec(1, 1)])},
+            # not yet migrated: JSON list of angles, and a legacy single vector
+            {'id': 2, 'face_embedding': json.dumps([_vec(1, 2).tolist(), _vec(1, 3).tolist()]), 'face_embedding_blob': None},
+            {'id': 3, 'face_embedding': json.dumps(_vec(1, 4).tolist()), 'face_embedding_blob': None},
+            {'id': 4, 'face_embedding': None, 'face_embedding_blob': None},
+        ])
+
+        @contextmanager
+        def fake_cursor(commit=False, read_only=False):
+            yield self.cursor
+
+        patcher = mock.patch.object(admin_model, 'get_db_cursor', fake_cursor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        admin_gallery.invalidate()
+        self.addCleanup(admin_gallery.invalidate)
+
+    def test_every_angle_is_one_row_owned_by_the_admin(self):
+        self.assertEqual(find_best_admin_match(_vec(1, 1))[0], '1')
+        self.assertEqual(len(admin_gallery), 5)
+        self.assertEqual(find_best_admin_match(_vec(1, 3))[0], '2')
+        self.assertEqual(find_best_admin_match(_vec(1, 4))[0], '3')
+        self.assertEqual(self.cursor.loads, 1)
+
+    def test_threshold(self):
+        near = _vec(1, 0)
+        near[5] = 0.59
+        self.assertEqual(find_best_admin_match(near)[0], '1')
+        near[5] = 0.61
+        self.assertEqual(find_best_admin_match(near), (None, None))
+        self.assertEqual(find_best_admin_match(near, threshold=0.7)[0], '1')
+
+    def test_add_admin_with_a_face_reloads(self):
+        probe = _vec(1, 6)
+        self.assertEqual(find_best_admin_match(probe), (None, None))
+        add_admin("Ana", "Cruz", "ana@example.com", "secret")
+        find_best_admin_match(probe)
+        self.assertEqual(self.cursor.loads, 1)  # no face, nothing to reload
+        admin_id = add_admin("Ben", "Reyes", "ben@example.com", "secret", embedding_list=[probe.tolist()])
+        self.assertEqual(find_best_admin_match(probe)[0], admin_id)
+        self.assertEqual(self.cursor.loads, 2)
+
+    def test_restore_reloads(self):
+        find_best_admin_match(_vec(1, 0))
+        restored = [{'id': 9, 'face_embedding': json.dumps([_vec(1, 7).tolist()]), 'face_embedding_blob': None}]
+        backup = io.BytesIO()
+        with zipfile.ZipFile(backup, 'w') as zf:
+            zf.writestr("database/admins.json", json.dumps(restored))
+        backup.seek(0)
+
+        @contextmanager
+        def restore_cursor(commit=False, read_only=False):
+            cursor = mock.Mock()
+            cursor.executemany.side_effect = lambda sql, rows: setattr(self.cursor, 'rows', restored)
+            yield cursor
+
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['admin_id'] = '1'
+        with mock.patch.object(backup_routes, 'get_db_cursor', restore_cursor), \
+                mock.patch.object(backup_routes, 'notify_embeddings_changed'), \
+                mock.patch.object(backup_routes.face_gallery, 'invalidate'):
+            resp = client.post('/admin/backup/restore', data={'backup_file': (backup, 'backup.zip')},
+                               content_type='multipart/form-data')
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(find_best_admin_match(_vec(1, 7))[0], '9')
+        self.assertEqual(find_best_admin_match(_vec(1, 0)), (None, None))
+        self.assertEqual(self.cursor.loads, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,241 @@
+import time
+import threading
+import unittest
+from unittest import mock
+import mysql.connector
+from flask import Flask
+import db
+from db import ConnectionPool, PoolTimeout, get_db_cursor, iter_db_rows, read_your_writes
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self._pool = pool
+        self._cnx = object()
+
+    def cursor(self, **kwargs):
+        self.cursor_kwargs = kwargs
+        self.last_cursor = FakeCursor()
+        return self.last_cursor
+
+    def consume_results(self):
+        self.last_cursor.rows = []
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self._pool.idle.append(self)
+
+
+class FakeCursor:
+    def __init__(self):
+        self.rows = []
+        self.fetches = 0
+
+    def execute(self, query, params=()):
+        self.rows = [{'id': i} for i in range(10)]
+
+    def fetchmany(self, size):
+        self.fetches += 1
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+    def close(self):
+        pass
+
+
+class FakePool:
+    """Like MySQLConnectionPool: raises PoolError when empty instead of waiting."""
+
+    def __init__(self, size):
+        self.idle = []
+        self.idle.extend(FakeConnection(self) for _ in range(size))
+
+    def get_connection(self):
+        if not self.idle:
+            raise mysql.connector.errors.PoolError("Failed getting connection; pool exhausted")
+        return self.idle.pop()
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def test_waits_for_a_returned_connection(self):
+        pool = ConnectionPool(size=1, overflow=0, timeout=2, pool=FakePool(1))
+        first = pool.get_connection()
+        threading.Timer(0.1, first.close).start()
+        second = pool.get_connection()
+        self.assertIsNotNone(second)
+        stats = pool.stats()
+        self.assertEqual(stats['waited'], 1)
+        self.assertEqual(stats['in_use'], 1)
+        self.assertGreaterEqual(stats['wait_max_s'], 0.05)
+        self.assertEqual(sum(stats['wait_histogram'].values()), 2)
+        second.close()
+        second.close()  # closing twice releases once
+        self.assertEqual(pool.stats()['in_use'], 0)
+
+    def test_times_out_when_exhausted(self):
+        pool = ConnectionPool(size=1, overflow=0, timeout=0.05, pool=FakePool(1))
+        held = pool.get_connection()
+        started = time.monotonic()
+        with self.assertRaises(PoolTimeout):
+            pool.get_connection()
+        self.assertGreaterEqual(time.monotonic() - started, 0.04)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+        held.close()
+        pool.get_connection().close()
+        self.assertEqual(pool.stats()['checkouts'], 2)
+        self.assertEqual(pool.stats()['connections'], 1)
+
+
+class TestRequestScopedConnection(unittest.TestCase):
+
+    def setUp(self):
+        self.saved_pool = db.connection_pool
+        db.connection_pool = self.pool = ConnectionPool(size=2, overflow=0, timeout=0.1, pool=FakePool(2))
+        self.app = Flask(__name__)
+        db.init_app(self.app)
+
+    def tearDown(self):
+        db.connection_pool = self.saved_pool
+
+    def test_one_checkout_per_request(self):
+        with self.app.test_request_context('/'):
+            with get_db_cursor() as cursor:
+                cursor.execute("SELECT 1")
+            with get_db_cursor(commit=True) as cursor:
+                cursor.execute("UPDATE t SET x = 1")
+            self.assertEqual(self.pool.stats()['in_use'], 1)
+        stats = self.pool.stats()
+        self.assertEqual(stats['checkouts'], 1)
+        self.assertEqual(stats['in_use'], 0)
+
+    def test_read_only_without_a_replica_shares_the_connection(self):
+        with self.app.test_request_context('/'):
+            with get_db_cursor(read_only=True) as cursor:
+                cursor.execute("SELECT 1")
+            with get_db_cursor() as cursor:
+                cursor.execute("SELECT 1")
+            self.assertEqual(self.pool.stats()['in_use'], 1)
+        self.assertEqual(self.pool.stats()['checkouts'], 1)
+
+    def test_outside_a_request_each_call_checks_out(self):
+        for _ in range(3):
+            with get_db_cursor() as cursor:
+                cursor.execute("SELECT 1")
+        self.assertEqual(self.pool.stats()['checkouts'], 3)
+        self.assertEqual(self.pool.stats()['in_use'], 0)
+
+
+class TestIterDbRows(unittest.TestCase):
+
+    def setUp(self):
+        self.saved_pool = db.connection_pool
+        self.fake = FakePool(1)
+        db.connection_pool = self.pool = ConnectionPool(size=1, overflow=0, timeout=0.1, pool=self.fake)
+
+    def tearDown(self):
+        db.connection_pool = self.saved_pool
+
+    def test_streams_in_batches_on_an_unbuffered_cursor(self):
+        rows = iter_db_rows("SELECT id FROM logs", batch_size=4)
+        self.assertEqual(self.pool.stats()['checkouts'], 0)  # nothing until iterated
+        self.assertEqual([r['id'] for r in rows], list(range(10)))
+        cnx = self.fake.idle[0]
+        self.assertEqual(cnx.cursor_kwargs, {'dictionary': True, 'buffered': False})
+        self.assertEqual(cnx.last_cursor.fetches, 4)  # 4 + 4 + 2 + empty
+        self.assertEqual(self.pool.stats()['in_use'], 0)
+
+    def test_closing_early_returns_the_connection(self):
+        rows = iter_db_rows("SELECT id FROM logs", batch_size=4)
+        next(rows)
+        self.assertEqual(self.pool.stats()['in_use'], 1)
+        rows.close()
+        self.assertEqual(self.pool.stats()['in_use'], 0)
+        self.assertEqual(self.fake.idle[0].last_cursor.rows, [])
+
+    def test_in_a_request_hands_back_the_shared_connection_first(self):
+        app = Flask(__name__)
+        db.init_app(app)
+        with app.test_request_context('/'):
+            with get_db_cursor() as cursor:
+                cursor.execute("SELECT 1")
+            # one connection in the pool: streaming must not wait on the request's own
+            self.assertEqual(len(list(iter_db_rows("SELECT id FROM logs"))), 10)
+            self.assertEqual(self.pool.stats()['in_use'], 0)
+        self.assertEqual(self.pool.stats()['timeouts'], 0)
+
+
+class TestReplicaRouting(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = (db.connection_pool, db.replica_pool, db.replica_config, dict(db._replica_state))
+        db.connection_pool = self.primary = ConnectionPool(size=2, overflow=0, timeout=0.1, pool=FakePool(2))
+        db.replica_pool = self.replica = ConnectionPool(size=2, overflow=0, timeout=0.1, pool=FakePool(2))
+        db.replica_config = {'host': 'replica'}
+        db._replica_state.update(healthy=False, lag_s=None, checked_at=None, down_until=0.0, reads=0, fallbacks=0)
+        self.lag = mock.patch.object(db, '_check_replica', return_value=(True, 0))
+        self.check = self.lag.start()
+        self.app = Flask(__name__)
+        db.init_app(self.app)
+
+    def tearDown(self):
+        self.lag.stop()
+        db.connection_pool, db.replica_pool, db.replica_config, state = self.saved
+        db._replica_state.update(state)
+
+    def read(self, **kwargs):
+        with get_db_cursor(**kwargs) as cursor:
+            cursor.execute("SELECT 1")
+
+    def test_reports_read_from_the_replica(self):
+        self.read(read_only=True)
+        self.read()
+        self.read(read_only=True, commit=True)
+        self.assertEqual(self.replica.stats()['checkouts'], 1)
+        self.assertEqual(self.primary.stats()['checkouts'], 2)
+        self.assertEqual(db.pool_stats()['replica']['reads'], 1)
+
+    def test_falls_back_when_lagging_or_down(self):
+        self.check.return_value = (False, 12)
+        self.read(read_only=True)
+        db._replica_state['checked_at'] = None
+        self.check.side_effect = mysql.connector.errors.InterfaceError("Can't connect")
+        self.read(read_only=True)
+        self.assertEqual(self.replica.stats()['checkouts'], 0)
+        self.assertEqual(self.primary.stats()['checkouts'], 2)
+        replica = db.pool_stats()['replica']
+        self.assertEqual(replica['fallbacks'], 2)
+        self.assertTrue(replica['down'])
+
+    def test_replica_down_in_a_request_uses_one_primary_connection(self):
+        self.check.return_value = (False, None)
+        with self.app.test_request_context('/'):
+            self.read(read_only=True)
+            self.read()
+            self.read(read_only=True)
+            self.assertEqual(self.primary.stats()['in_use'], 1)
+        self.assertEqual(self.primary.stats()['checkouts'], 1)
+        self.assertEqual(self.replica.stats()['checkouts'], 0)
+
+    def test_read_your_writes(self):
+        with read_your_writes():
+            self.read(read_only=True)
+        self.assertEqual(self.replica.stats()['checkouts'], 0)
+        with self.app.test_request_context('/'):
+            self.read(read_only=True)
+            self.read(commit=True)
+            self.read(read_only=True)  # after a write, reads stay on the primary
+            self.assertEqual(self.replica.stats()['in_use'], 1)
+            self.assertEqual(self.primary.stats()['in_use'], 1)
+        self.assertEqual(self.replica.stats()['checkouts'], 1)
+        self.assertEqual(self.primary.stats()['checkouts'], 2)
+        self.assertEqual(self.replica.stats()['in_use'] + self.primary.stats()['in_use'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
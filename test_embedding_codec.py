@@ -0,0 +1,42 @@
+import unittest
+import json
+import numpy as np
+from models.embedding_codec import encode_embeddings, decode_embeddings, read_stored_embeddings, FORMAT_F64
+
+
+class TestEmbeddingCodec(unittest.TestCase):
+
+    def setUp(self):
+        self.emb = np.random.rand(128).tolist()
+
+    def test_single_vector_round_trip(self):
+        blob = encode_embeddings(self.emb)
+        self.assertEqual(len(blob), 3 + 128 * 4)
+        decoded = decode_embeddings(blob)
+        self.assertEqual(decoded.shape, (1, 128))
+        np.testing.assert_allclose(decoded[0], self.emb, rtol=1e-6)
+
+    def test_float64_is_exact(self):
+        decoded = decode_embeddings(encode_embeddings(self.emb, fmt=FORMAT_F64))
+        self.assertEqual(decoded[0].tolist(), self.emb)
+
+    def test_multi_angle_round_trip(self):
+        angles = [self.emb, self.emb, self.emb]
+        self.assertEqual(decode_embeddings(encode_embeddings(angles)).shape, (3, 128))
+
+    def test_reads_legacy_json(self):
+        # single vector as stored by face_embeddings.embedding_json
+        arr = read_stored_embeddings(None, json.dumps(self.emb))
+        self.assertEqual(arr.shape, (1, 128))
+        # list of lists and bytes, as mysql-connector returns admins.face_embedding
+        arr = read_stored_embeddings(None, json.dumps([self.emb, self.emb]).encode('utf-8'))
+        self.assertEqual(arr.shape, (2, 128))
+        self.assertIsNone(read_stored_embeddings(None, None))
+
+    def test_blob_preferred_over_json(self):
+        arr = read_stored_embeddings(encode_embeddings([1.0] * 128), json.dumps(self.emb))
+        self.assertEqual(arr[0, 0], 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import time
+import unittest
+from services.embedding_tokens import EmbeddingTokens
+
+SECRET = 'test-secret'
+
+
+class TestEmbeddingTokens(unittest.TestCase):
+
+    def test_redeem_once_for_matched_client(self):
+        tokens = EmbeddingTokens(ttl=60)
+        token = tokens.issue('C1', [0.5] * 128, SECRET)
+        self.assertIsNone(tokens.redeem(token, 'C2', SECRET))
+        self.assertIsNone(tokens.redeem(token, 'C1', 'other-secret'))
+        self.assertEqual(tokens.redeem(token, 'C1', SECRET), [0.5] * 128)
+        self.assertIsNone(tokens.redeem(token, 'C1', SECRET))
+
+    def test_expired_and_evicted(self):
+        tokens = EmbeddingTokens(ttl=0.01, max_entries=2)
+        token = tokens.issue('C1', [0.1], SECRET)
+        time.sleep(0.02)
+        self.assertIsNone(tokens.redeem(token, 'C1', SECRET))
+
+        tokens.ttl = 60
+        first = tokens.issue('A', [1.0], SECRET)
+        tokens.issue('B', [2.0], SECRET)
+        tokens.issue('C', [3.0], SECRET)
+        self.assertIsNone(tokens.redeem(first, 'A', SECRET))
+        self.assertEqual(tokens.stats()['outstanding'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import io
+import unittest
+import numpy as np
+from PIL import Image
+from services.face_detect import decode_for_detection, scale_boxes, effective_downscale, face_quality, quality_issues
+
+
+def _encoded(fmt, size=(800, 600)):
+    img = Image.fromarray(np.random.default_rng(0).integers(0, 255, (size[1], size[0], 3), dtype=np.uint8))
+    buf = io.BytesIO()
+    img.save(buf, format=fmt)
+    return buf.getvalue()
+
+
+class TestReducedResolutionDetection(unittest.TestCase):
+
+    def test_jpeg_decoded_at_reduced_scale(self):
+        full, small, scale = decode_for_detection(_encoded('JPEG'), downscale=4)
+        self.assertEqual(full.shape, (600, 800, 3))
+        self.assertEqual(small.shape, (150, 200, 3))
+        self.assertEqual(scale, 4.0)
+
+    def test_png_falls_back_to_resize(self):
+        full, small, scale = decode_for_detection(_encoded('PNG'), downscale=2)
+        self.assertEqual(small.shape, (300, 400, 3))
+        self.assertEqual(scale, 2.0)
+
+    def test_boxes_mapped_back_and_clipped(self):
+        boxes = scale_boxes([(10, 120, 90, 40), (100, 205, 160, 150)], 4.0, (600, 800, 3))
+        self.assertEqual(boxes[0], (40, 480, 360, 160))
+        self.assertEqual(boxes[1], (400, 800, 600, 600))
+
+    def test_downscale_capped_by_min_face(self):
+        self.assertEqual(effective_downscale(4, min_face=80, upsample=1), 2)
+        self.assertEqual(effective_downscale(4, min_face=200, upsample=1), 4)
+        self.assertEqual(effective_downscale(4, min_face=30, upsample=0), 1)
+
+
+    def test_face_quality_metrics(self):
+        rng = np.random.default_rng(1)
+        sharp = rng.integers(0, 255, (200, 200, 3)).astype(np.uint8)
+        flat = np.full((200, 200, 3), 30, dtype=np.uint8)
+        box = (50, 150, 150, 50)
+
+        q = face_quality(sharp, box)
+        self.assertEqual((q['face_width'], q['face_height']), (100, 100))
+        self.assertAlmostEqual(q['face_fraction'], 0.25)
+        self.assertGreater(q['sharpness'], 1000)
+        self.assertEqual(quality_issues(q), [])
+
+        q = face_quality(flat, box)
+        self.assertEqual(q['sharpness'], 0.0)
+        self.assertAlmostEqual(q['brightness'], 30.0, places=0)
+        self.assertEqual(len(quality_issues(q)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,24 @@
+import unittest
+from services.face_encoder import FaceEncoder, EncoderBusy
+
+
+class TestFaceEncoderBackpressure(unittest.TestCase):
+
+    def test_full_queue_rejects_immediately(self):
+        encoder = FaceEncoder(workers=1, max_queue=0, timeout=0.1)
+        # occupy the only slot as an in-flight encoding would
+        encoder._slots.acquire()
+        with self.assertRaises(EncoderBusy) as ctx:
+            encoder.encode(b"not-an-image")
+        self.assertGreater(ctx.exception.retry_after, 0)
+        with self.assertRaises(EncoderBusy):
+            encoder.encode(b"not-an-image", block=True)
+
+        stats = encoder.stats()
+        self.assertEqual(stats['rejected'], 2)
+        self.assertEqual(stats['submitted'], 0)
+        self.assertIsNone(encoder._pool)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import unittest
+import numpy as np
+from models.face_gallery import FaceGallery
+from models.face_ivf import IVFIndex
+
+
+class TestFaceGallery(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.rows = [(i + 1, f"C{i // 3}", rng.random(128).tolist()) for i in range(30)]
+        self.load_calls = 0
+
+        def loader():
+            self.load_calls += 1
+            return list(self.rows)
+
+        self.gallery = FaceGallery(loader)
+
+    def test_exact_match(self):
+        row_id, owner, emb = self.rows[7]
+        matched, dist = self.gallery.search(emb)
+        self.assertEqual(matched, owner)
+        self.assertLess(dist, 0.001)
+
+    def test_matches_brute_force(self):
+        query = np.random.default_rng(1).random(128)
+        dists = [np.linalg.norm(np.array(e) - query) for _, _, e in self.rows]
+        best = int(np.argmin(dists))
+        matched, dist = self.gallery.search(query.tolist())
+        self.assertEqual(matched, self.rows[best][1])
+        self.assertAlmostEqual(dist, dists[best], places=4)
+
+    def test_search_many_agrees_with_search(self):
+        probes = [self.rows[2][2], np.random.default_rng(3).random(128).tolist(), self.rows[20][2]]
+        batched = self.gallery.search_many(probes)
+        for probe, (owner, dist) in zip(probes, batched):
+            single_owner, single_dist = self.gallery.search(probe)
+            self.assertEqual(owner, single_owner)
+            self.assertAlmostEqual(dist, single_dist, places=6)
+        self.assertEqual(FaceGallery(lambda: []).search_many(probes[:2]), [(None, None)] * 2)
+
+    def test_in_place_updates_do_not_reload(self):
+        self.gallery.search(self.rows[0][2])
+        new_emb = [5.0] * 128
+        self.gallery.add(999, "NEW", new_emb)
+        self.assertEqual(self.gallery.search(new_emb)[0], "NEW")
+
+        self.gallery.update(999, [9.0] * 128)
+        self.assertEqual(self.gallery.search([9.0] * 128)[0], "NEW")
+
+        self.gallery.remove_owner("NEW")
+        self.assertNotEqual(self.gallery.search([9.0] * 128)[0], "NEW")
+        self.assertEqual(len(self.gallery), 30)
+        self.assertEqual(self.load_calls, 1)
+
+    def test_replace_owner(self):
+        self.gallery.search(self.rows[0][2])
+        self.gallery.replace_owner("C0", [501, 502], [[3.0] * 128, [4.0] * 128])
+        self.assertEqual(self.gallery.search([4.0] * 128)[0], "C0")
+        self.assertNotEqual(self.gallery.search(self.rows[0][2])[0], "C0")
+        self.assertEqual(len(self.gallery), 29)
+
+    def test_replace_owner_notifies_once_after_the_lock(self):
+        self.gallery.search(self.rows[0][2])
+        calls = []
+        self.gallery.subscribe(lambda owner: calls.append((owner, self.gallery._lock._is_owned())))
+        self.gallery.replace_owner("C0", [501], [[3.0] * 128])
+        self.assertEqual(calls, [("C0", False)])
+        self.gallery.remove_owner("NOBODY")
+        self.assertEqual(len(calls), 1)
+
+    def test_invalidate_reloads(self):
+        self.gallery.search(self.rows[0][2])
+        self.gallery.invalidate()
+        self.gallery.search(self.rows[0][2])
+        self.assertEqual(self.load_calls, 2)
+
+    def test_top_k_one_entry_per_owner(self):
+        query = np.random.default_rng(3).random(128)
+        ranked = self.gallery.search_top_k(query.tolist(), k=4)
+        owners = [o for o, _ in ranked]
+        self.assertEqual(len(owners), 4)
+        self.assertEqual(len(set(owners)), 4)
+
+        # brute-force per-owner minimum
+        per_owner = {}
+        for _, owner, emb in self.rows:
+            d = np.linalg.norm(np.array(emb) - query)
+            per_owner[owner] = min(per_owner.get(owner, np.inf), d)
+        expected = sorted(per_owner.items(), key=lambda x: x[1])[:4]
+        self.assertEqual(owners, [o for o, _ in expected])
+        for (_, d), (_, e) in zip(ranked, expected):
+            self.assertAlmostEqual(d, e, places=4)
+
+    def test_top_k_larger_than_gallery(self):
+        ranked = self.gallery.search_top_k(self.rows[0][2], k=50)
+        self.assertEqual(len(ranked), 10)
+        self.assertEqual(ranked[0][0], self.rows[0][1])
+
+    def test_ivf_index_finds_stored_rows(self):
+        rng = np.random.default_rng(5)
+        centres = rng.normal(0, 0.06, (200, 128))
+        rows = [(i + 1, f"C{i // 3}", centres[i // 3] + rng.normal(0, 0.02, 128)) for i in range(600)]
+        gallery = FaceGallery(lambda: rows, index=IVFIndex(nlist=16, nprobe=4, min_rows=0))
+        for row_id, owner, emb in rows[::37]:
+            self.assertEqual(gallery.search(emb)[0], owner)
+        self.assertTrue(gallery.index.is_trained)
+
+        # rows added after training are assigned to an existing cell
+        gallery.add(10000, "LATE", centres[0] + 0.5)
+        self.assertEqual(gallery.search(centres[0] + 0.5)[0], "LATE")
+
+    def test_ivf_below_min_rows_is_exact(self):
+        gallery = FaceGallery(lambda: self.rows, index=IVFIndex(min_rows=1000))
+        self.assertEqual(gallery.search(self.rows[4][2])[0], self.rows[4][1])
+        self.assertFalse(gallery.index.is_trained)
+
+    def test_empty_gallery(self):
+        gallery = FaceGallery(lambda: [])
+        self.assertEqual(gallery.search([0.1] * 128), (None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,7 @@ import json
 import numpy as np
 import face_recognition
 from db import get_db
+from models.embedding_codec import read_stored_embeddings
 import os
 
 def test_match():
@@ -11,7 +12,7 @@ def test_match():
         return
     
     cursor = db.cursor(dictionary=True)
-    cursor.execute("SELECT client_id, embedding_json FROM face_embeddings")
+    cursor.execute("SELECT client_id, embedding_blob, embedding_json FROM face_embeddings")
     embeddings = cursor.fetchall()
     print(f"Loaded {len(embeddings)} embeddings from DB")
     
@@ -36,17 +37,12 @@ def test_match():
     
     for r in embeddings:
         cid = r['client_id']
+        emb_blob = r['embedding_blob']
         emb_json = r['embedding_json']
         
         try:
-            print(f"Processing {cid}, type of emb_json: {type(emb_json)}")
-            if isinstance(emb_json, (bytes, bytearray)):
-                 emb_json = emb_json.decode('utf-8')
-            
-            if isinstance(emb_json, str):
-                emb = np.array(json.loads(emb_json))
-            else:
-                emb = np.array(emb_json)
+            print(f"Processing {cid}, binary: {emb_blob is not None}, type of emb_json: {type(emb_json)}")
+            emb = read_stored_embeddings(emb_blob, emb_json)[0]
             
             if emb.shape != target.shape:
                 print(f"Shape mismatch for {cid}: {emb.shape} vs {target.shape}")
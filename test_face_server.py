@@ -0,0 +1,140 @@
+import os
+import socket
+import tempfile
+import threading
+import unittest
+import numpy as np
+from services import face_protocol as proto
+from services.face_encoder import EncoderBusy
+from services.face_server import make_server
+from services.face_service import RemoteFaceService
+
+
+class FakeService:
+    """Stands in for LocalFaceService: 'face' images yield one 128-d vector."""
+
+    def __init__(self):
+        self.changed = []
+        self.busy = False
+
+    def _vectors(self, image_bytes):
+        if self.busy:
+            raise EncoderBusy(3)
+        return [np.full(128, 0.25)] if image_bytes.startswith(b"face") else []
+
+    def encode(self, image_bytes, block=False):
+        return self._vectors(image_bytes)
+
+    def encode_many(self, images, block=True):
+        return [None if b is None else self._vectors(b) for b in images]
+
+    def detect(self, image_bytes, block=False):
+        return {'frame': [640, 480], 'faces': [] if not image_bytes.startswith(b"face") else [{'box': [1, 2, 3, 4]}]}
+
+    def identify(self, image_bytes, k=1):
+        vectors = self._vectors(image_bytes)
+        if not vectors:
+            return None, [], None
+        return list(vectors[0]), [("C1", 0.31), ("C2", 0.52)][:k], 0.21
+
+    def identify_all(self, image_bytes):
+        box = {'top': 10, 'right': 90, 'bottom': 90, 'left': 10}
+        return [(box, [0.5] * 128, "C1", 0.3), (box, [0.1] * 128, None, None)] if image_bytes.startswith(b"face") else []
+
+    def verify(self, client_id, image_bytes):
+        vectors = self._vectors(image_bytes)
+        if not vectors:
+            return None, False, None
+        return list(vectors[0]), client_id == "C1", 0.31
+
+    def stats(self):
+        return {'workers': 2}
+
+
+class TestFaceServer(unittest.TestCase):
+
+    def setUp(self):
+        if hasattr(socket, "AF_UNIX"):
+            self.tmp = tempfile.mkdtemp()
+            address = "unix:" + os.path.join(self.tmp, "face.sock")
+        else:
+            self.tmp = None
+            address = "tcp:127.0.0.1:0"
+        self.service = FakeService()
+        self.server = make_server(address, self.service)
+        if address.startswith("tcp:"):
+            address = "tcp:127.0.0.1:%d" % self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = RemoteFaceService(address, timeout=5)
+
+    def tearDown(self):
+        self.client._drop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_encode_roundtrip(self):
+        vectors = self.client.encode(b"face-jpeg")
+        self.assertEqual(len(vectors), 1)
+        np.testing.assert_array_equal(vectors[0], np.full(128, 0.25))
+        self.assertEqual(self.client.encode(b"empty"), [])
+
+    def test_encode_many_keeps_positions(self):
+        results = self.client.encode_many([b"face-1", None, b"nothing", b"face-2"])
+        self.assertEqual([None if r is None else len(r) for r in results], [1, None, 0, 1])
+
+    def test_identify_and_verify(self):
+        encoding, matches, margin = self.client.identify(b"face", k=2)
+        self.assertEqual(len(encoding), 128)
+        self.assertEqual(matches, [("C1", 0.31), ("C2", 0.52)])
+        self.assertAlmostEqual(margin, 0.21)
+        self.assertEqual(self.client.identify(b"blank"), (None, [], None))
+
+        encoding, matched, distance = self.client.verify("C1", b"face")
+        self.assertTrue(matched)
+        self.assertAlmostEqual(distance, 0.31)
+        self.assertFalse(self.client.verify("C9", b"face")[1])
+
+    def test_identify_all_keeps_unmatched_faces(self):
+        faces = self.client.identify_all(b"face-group")
+        self.assertEqual([(cid, dist) for _, _, cid, dist in faces], [("C1", 0.3), (None, None)])
+        self.assertEqual(faces[0][0]['right'], 90)
+        self.assertAlmostEqual(faces[1][1][0], 0.1)
+        self.assertEqual(self.client.identify_all(b"blank"), [])
+
+    def test_detect_and_stats(self):
+        self.assertEqual(self.client.detect(b"face")['faces'], [{'box': [1, 2, 3, 4]}])
+        self.assertEqual(self.client.stats()['workers'], 2)
+
+    def test_busy_is_raised_as_encoder_busy(self):
+        self.service.busy = True
+        with self.assertRaises(EncoderBusy) as ctx:
+            self.client.encode(b"face")
+        self.assertEqual(ctx.exception.retry_after, 3)
+
+    def test_reconnects_after_dropped_connection(self):
+        self.client.encode(b"face")
+        self.client._local.sock.close()
+        self.assertEqual(len(self.client.encode(b"face")), 1)
+
+
+class TestProtocol(unittest.TestCase):
+
+    def test_frame_roundtrip(self):
+        a, b = socket.socketpair()
+        try:
+            body = bytes(range(256)) * 10
+            proto.send_message(a, proto.OP_VERIFY, {'client_id': "C1"}, body)
+            op, meta, received = proto.recv_message(b)
+            self.assertEqual((op, meta, received), (proto.OP_VERIFY, {'client_id': "C1"}, body))
+        finally:
+            a.close()
+            b.close()
+
+    def test_parse_address(self):
+        self.assertEqual(proto.parse_address("tcp:127.0.0.1:5055"), (socket.AF_INET, ("127.0.0.1", 5055)))
+        with self.assertRaises(ValueError):
+            proto.parse_address("http://localhost")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import io
+import time
+import unittest
+import numpy as np
+from PIL import Image
+from services.frame_cache import FrameCache, frame_hash
+
+
+def _jpeg(pixels, quality=90):
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format='JPEG', quality=quality)
+    return buf.getvalue()
+
+
+def _dhash(image_bytes):
+    # the 64-bit perceptual hash the cache used to be keyed on
+    img = Image.open(io.BytesIO(image_bytes)).convert('L').resize((9, 8), Image.BILINEAR)
+    thumb = np.asarray(img, dtype=np.int16)
+    return int.from_bytes(np.packbits((thumb[:, 1:] > thumb[:, :-1]).ravel()).tobytes(), 'big')
+
+
+class TestFrameCache(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        base = np.kron(rng.integers(0, 255, (8, 9)), np.ones((60, 60))).astype(np.uint8)
+        self.frame = _jpeg(np.dstack([base] * 3))
+        # another capture of the same scene: same thumbnail, different bytes
+        self.retake = _jpeg(np.dstack([base] * 3), quality=80)
+        self.other = _jpeg(np.dstack([base[:, ::-1]] * 3))
+        self.cache = FrameCache(ttl=60, max_entries=8)
+
+    def test_same_frame_hits_in_same_scope_only(self):
+        self.cache.put('kiosk-a', frame_hash(self.frame), 1, 'C1', {'client_id': 'C1'})
+        self.assertEqual(self.cache.get('kiosk-a', frame_hash(self.frame), 1), {'client_id': 'C1'})
+        self.assertIsNone(self.cache.get('kiosk-b', frame_hash(self.frame), 1))
+        self.assertIsNone(self.cache.get('kiosk-a', frame_hash(self.other), 1))
+        self.assertIsNone(self.cache.get('kiosk-a', frame_hash(self.frame), 3))
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 3))
+
+    def test_similar_frame_is_not_reused(self):
+        self.assertEqual(_dhash(self.frame), _dhash(self.retake))
+        self.assertNotEqual(self.frame, self.retake)
+        self.cache.put('kiosk-a', frame_hash(self.frame), 1, 'C1', {'client_id': 'C1'})
+        self.assertIsNone(self.cache.get('kiosk-a', frame_hash(self.retake), 1))
+
+    def test_invalidate_owner_and_expiry(self):
+        h = frame_hash(self.frame)
+        self.cache.put('k1', h, 1, 'C1', {'client_id': 'C1'})
+        self.cache.put('k2', h, 1, 'C2', {'client_id': 'C2'})
+        self.cache.invalidate_owner('C1')
+        self.assertIsNone(self.cache.get('k1', h, 1))
+        self.assertIsNotNone(self.cache.get('k2', h, 1))
+
+        self.cache.ttl = 0.01
+        self.cache.put('k3', h, 1, 'C3', {})
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get('k3', h, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+from models import face_embedding_model, log_model
+from models.face_embedding_model import find_best_matches
+import routes.all_routes as all_routes
+from app import app
+
+
+class TestFindBestMatches(unittest.TestCase):
+
+    def match(self, ranked, threshold=0.7):
+        with mock.patch.object(face_embedding_model.face_gallery, 'search_many', return_value=ranked) as search:
+            result = find_best_matches(['e'] * len(ranked), threshold=threshold)
+        search.assert_called_once()
+        return result
+
+    def test_client_matched_by_several_faces_keeps_the_closest(self):
+        ranked = [('C1', 0.5), ('C2', 0.4), ('C1', 0.3), ('C1', 0.6)]
+        self.assertEqual(self.match(ranked), [(None, None), ('C2', 0.4), ('C1', 0.3), (None, None)])
+
+    def test_faces_beyond_threshold_are_unmatched(self):
+        ranked = [('C1', 0.8), ('C2', 0.7), (None, None)]
+        self.assertEqual(self.match(ranked), [(None, None), ('C2', 0.7), (None, None)])
+
+    def test_duplicate_beyond_threshold_does_not_hide_a_match(self):
+        self.assertEqual(self.match([('C1', 0.9), ('C1', 0.2)]), [(None, None), ('C1', 0.2)])
+
+
+class TestLogActionGroup(unittest.TestCase):
+
+    def post(self, body):
+        with mock.patch.object(all_routes, 'add_time_in_many') as time_in_many, \
+                mock.patch.object(all_routes, 'add_time_out_many') as time_out_many, \
+                mock.patch.object(all_routes, 'add_time_in') as time_in:
+            resp = app.test_client().post('/log_action', json=body)
+        self.time_in_many, self.time_out_many, self.time_in = time_in_many, time_out_many, time_in
+        return resp
+
+    def test_group_time_in_dedups_ids(self):
+        resp = self.post({'client_ids': ['C1', 'C2', 'C1'], 'action': 'time_in', 'purposes': ['A', 'B']})
+        self.assertEqual(resp.get_json(), {'ok': True, 'count': 2})
+        self.time_in_many.assert_called_once_with(['C1', 'C2'], 'A, B', None)
+        self.time_in.assert_not_called()
+
+    def test_group_time_out(self):
+        resp = self.post({'client_ids': ['C1', 'C2'], 'action': 'time_out'})
+        self.assertEqual(resp.status_code, 200)
+        self.time_out_many.assert_called_once_with(['C1', 'C2'])
+
+    def test_invalid_client_ids_are_rejected(self):
+        for client_ids in ('C1', ['C1', ''], ['C1', 7], {'C1': 1}):
+            resp = self.post({'client_ids': client_ids, 'action': 'time_in'})
+            self.assertEqual(resp.status_code, 400, client_ids)
+        self.time_in_many.assert_not_called()
+
+    def test_group_size_is_capped(self):
+        ids = [f"C{i}" for i in range(all_routes.MAX_GROUP_SIZE)]
+        self.assertEqual(self.post({'client_ids': ids, 'action': 'time_in'}).status_code, 200)
+        resp = self.post({'client_ids': ids + ['EXTRA'], 'action': 'time_in'})
+        self.assertEqual(resp.status_code, 400)
+        self.time_in_many.assert_not_called()
+
+
+class FakeCursor:
+    def __init__(self, open_logs):
+        self.open_logs = open_logs  # {client_id: log id}
+        self.calls = []
+        self._row = None
+
+    def execute(self, sql, params=()):
+        self.calls.append((sql.split()[0], params))
+        if sql.startswith("SELECT"):
+            log_id = self.open_logs.get(params[0])
+            self._row = {'id': log_id} if log_id else None
+
+    def executemany(self, sql, seq):
+        self.calls.append((sql.split()[0], list(seq)))
+
+    def fetchone(self):
+        return self._row
+
+
+class TestGroupLogWrites(unittest.TestCase):
+
+    @contextmanager
+    def transactions(self, open_logs=None):
+        self.cursor = FakeCursor(open_logs or {})
+        self.commits = []
+
+        @contextmanager
+        def fake_cursor(commit=False, read_only=False):
+            yield self.cursor
+            self.commits.append(commit)
+
+        with mock.patch.object(log_model, 'get_db_cursor', fake_cursor):
+            yield
+
+    def test_time_in_many_is_one_insert_in_one_transaction(self):
+        with self.transactions():
+            log_model.add_time_in_many(['c1', 'C2'], 'inquire', 'note')
+        self.assertEqual(self.commits, [True])
+        (verb, rows), = self.cursor.calls
+        self.assertEqual(verb, 'INSERT')
+        self.assertEqual([(r[0], r[2], r[3], r[4]) for r in rows], [('C1', None, 'INQUIRE', 'NOTE'), ('C2', None, 'INQUIRE', 'NOTE')])
+        self.assertEqual(rows[0][1], rows[1][1])  # one time_in for the whole group
+
+    def test_time_out_many_updates_open_logs_in_one_transaction(self):
+        with self.transactions({'C1': 11, 'C3': 33}):
+            log_model.add_time_out_many(['C1', 'C2', 'C3'])
+        self.assertEqual(self.commits, [True])
+        updates = [params for verb, params in self.cursor.calls if verb == 'UPDATE']
+        self.assertEqual([log_id for _, log_id in updates], [11, 33])
+        self.assertEqual(updates[0][0], updates[1][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
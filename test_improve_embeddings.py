@@ -0,0 +1,120 @@
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+import numpy as np
+from models import face_embedding_model
+from models.embedding_codec import encode_embeddings, read_stored_embeddings
+from models.face_embedding_model import improve_client_embeddings
+
+
+def _vec(x):
+    # distance between _vec(a) and _vec(b) is |a - b|
+    vector = np.zeros(128)
+    vector[0] = x
+    return vector
+
+
+class FakeCursor:
+    """Answers the queries improve_client_embeddings makes from in-memory tables."""
+
+    def __init__(self, clients, embeddings):
+        self.clients = clients
+        self.embeddings = embeddings  # {row_id: (client_id, vector)}
+        self.queries = []
+        self.updates = []
+        self.inserts = []
+        self.lastrowid = None
+        self._rows = []
+
+    def execute(self, sql, params=()):
+        self.queries.append(sql)
+        if sql.startswith("SELECT client_id FROM clients"):
+            self._rows = [{'client_id': c} for c in self.clients if c in params]
+        elif sql.startswith("SELECT id, client_id"):
+            self._rows = [{'id': row_id, 'client_id': c, 'embedding_blob': encode_embeddings(v), 'embedding_json': None}
+                          for row_id, (c, v) in sorted(self.embeddings.items()) if c in params]
+        elif sql.startswith("INSERT INTO face_embeddings"):
+            self.lastrowid = max(self.embeddings, default=0) + len(self.inserts) + 1
+            self.inserts.append((params[0], read_stored_embeddings(params[1], None)[0]))
+
+    def executemany(self, sql, seq):
+        self.updates.extend((row_id, read_stored_embeddings(blob, None)[0]) for blob, _, row_id in seq)
+
+    def fetchall(self):
+        return self._rows
+
+
+class TestImproveClientEmbeddings(unittest.TestCase):
+
+    def improve(self, samples, clients=('C1',), embeddings=None, **kwargs):
+        self.cursor = FakeCursor(list(clients), embeddings or {})
+
+        @contextmanager
+        def fake_cursor(commit=False, read_only=False):
+            self.assertTrue(commit)
+            yield self.cursor
+
+        with mock.patch.object(face_embedding_model, 'get_db_cursor', fake_cursor), \
+                mock.patch.object(face_embedding_model, 'face_gallery') as self.gallery, \
+                mock.patch.object(face_embedding_model, 'notify_embeddings_changed') as self.notify:
+            return improve_client_embeddings(samples, **kwargs)
+
+    def test_locks_clients_shared_and_embeddings_for_update(self):
+        self.improve([('C1', _vec(0.1))], embeddings={1: ('C1', _vec(0))})
+        self.assertTrue(self.cursor.queries[0].endswith("LOCK IN SHARE MODE"))
+        self.assertTrue(self.cursor.queries[1].endswith("FOR UPDATE"))
+
+    def test_close_sample_is_merged(self):
+        results = self.improve([('c1', _vec(0.1))], embeddings={1: ('C1', _vec(0))})
+        self.assertEqual(results, ["merged_existing"])
+        (row_id, vector), = self.cursor.updates
+        self.assertEqual(row_id, 1)
+        np.testing.assert_allclose(vector, _vec(0.02))  # 0.8 * old + 0.2 * new
+        self.assertEqual(self.cursor.inserts, [])
+        self.gallery.update.assert_called_once()
+        self.notify.assert_called_once_with('C1')
+
+    def test_first_and_distinct_samples_add_variants(self):
+        self.assertEqual(self.improve([('C1', _vec(0))]), ["added_initial"])
+        results = self.improve([('C1', _vec(0.4))], embeddings={1: ('C1', _vec(0))})
+        self.assertEqual(results, ["added_new_variant"])
+        (client_id, vector), = self.cursor.inserts
+        self.assertEqual(client_id, 'C1')
+        np.testing.assert_allclose(vector, _vec(0.4))
+        self.gallery.add.assert_called_once()
+        self.assertEqual(self.cursor.updates, [])
+
+    def test_max_embeddings_merges_into_the_closest(self):
+        existing = {1: ('C1', _vec(0)), 2: ('C1', _vec(1))}
+        results = self.improve([('C1', _vec(0.4))], embeddings=existing, max_embeddings=2)
+        self.assertEqual(results, ["merged_limit_reached"])
+        (row_id, vector), = self.cursor.updates
+        self.assertEqual(row_id, 1)
+        np.testing.assert_allclose(vector, _vec(0.12))  # 0.7 * old + 0.3 * new
+        self.assertEqual(self.cursor.inserts, [])
+
+    def test_outlier_is_rejected(self):
+        self.assertEqual(self.improve([('C1', _vec(0.9))], embeddings={1: ('C1', _vec(0))}), ["rejected_outlier"])
+        self.assertEqual((self.cursor.updates, self.cursor.inserts), ([], []))
+        self.notify.assert_not_called()
+
+    def test_several_samples_for_one_client_write_each_row_once(self):
+        samples = [('C1', _vec(0.1)), ('C1', _vec(0.1)), ('C1', _vec(0.6))]
+        results = self.improve(samples, embeddings={1: ('C1', _vec(0))})
+        self.assertEqual(results, ["merged_existing", "merged_existing", "added_new_variant"])
+        (row_id, vector), = self.cursor.updates
+        self.assertEqual(row_id, 1)
+        np.testing.assert_allclose(vector, _vec(0.036))  # second merge builds on the first
+        self.assertEqual(len(self.cursor.inserts), 1)
+        self.notify.assert_called_once_with('C1')
+
+    def test_unknown_client_is_dropped_without_failing_the_batch(self):
+        samples = [('GONE', _vec(0)), ('C1', _vec(0.1))]
+        results = self.improve(samples, embeddings={1: ('C1', _vec(0))})
+        self.assertEqual(results, ["unknown_client", "merged_existing"])
+        self.assertEqual([client_id for client_id, _ in self.cursor.inserts], [])
+        self.notify.assert_called_once_with('C1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import time
+import threading
+import unittest
+from services.learning_queue import LearningQueue
+
+
+class TestLearningQueue(unittest.TestCase):
+
+    def test_samples_are_batched_and_counted(self):
+        batches = []
+        applied = threading.Event()
+
+        def apply_batch(samples):
+            batches.append(samples)
+            applied.set()
+            return ['merged_existing'] * len(samples)
+
+        q = LearningQueue(apply_batch, maxsize=10, batch_max=10, interval=0.2)
+        for i in range(4):
+            self.assertTrue(q.enqueue(f"C{i % 2}", [float(i)] * 4))
+        self.assertTrue(applied.wait(2))
+        q.stop()
+
+        self.assertEqual(len(batches), 1)
+        self.assertEqual([cid for cid, _ in batches[0]], ["C0", "C1", "C0", "C1"])
+        stats = q.stats()
+        self.assertEqual(stats['applied'], 4)
+        self.assertEqual(stats['clients'], 2)
+        self.assertEqual(stats['results'], {'merged_existing': 4})
+        self.assertEqual(stats['depth'], 0)
+
+    def test_full_queue_drops(self):
+        gate = threading.Event()
+        q = LearningQueue(lambda samples: gate.wait(2) and [], maxsize=1, batch_max=1, interval=0)
+        q.enqueue("A", [0.0])
+        time.sleep(0.05)  # worker takes "A" and blocks in apply_batch
+        self.assertTrue(q.enqueue("B", [0.0]))
+        self.assertFalse(q.enqueue("C", [0.0]))
+        self.assertEqual(q.stats()['dropped'], 1)
+        gate.set()
+        q.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import io
+import base64
+import unittest
+import numpy as np
+from PIL import Image
+from services.photo_decode import decode_photo_data, decode_rgb, PhotoTooLarge
+
+
+class TestPhotoDecode(unittest.TestCase):
+
+    def setUp(self):
+        buf = io.BytesIO()
+        Image.new('RGB', (64, 48), (200, 30, 30)).save(buf, format='JPEG')
+        self.jpeg = buf.getvalue()
+        self.b64 = base64.b64encode(self.jpeg).decode('ascii')
+
+    def test_data_url_and_bare_base64(self):
+        self.assertEqual(decode_photo_data('data:image/jpeg;base64,' + self.b64), self.jpeg)
+        self.assertEqual(decode_photo_data(self.b64), self.jpeg)
+        self.assertEqual(decode_photo_data(('data:image/png;base64,' + self.b64).encode('ascii')), self.jpeg)
+
+    def test_size_limit_checked_before_decoding(self):
+        with self.assertRaises(PhotoTooLarge):
+            decode_photo_data('data:image/jpeg;base64,' + self.b64, max_bytes=len(self.jpeg) - 1)
+        self.assertEqual(decode_photo_data(self.b64, max_bytes=len(self.jpeg)), self.jpeg)
+
+    def test_invalid_base64(self):
+        with self.assertRaises(ValueError):
+            decode_photo_data('data:image/jpeg;base64,abc')
+
+    def test_decode_rgb(self):
+        rgb = decode_rgb(self.jpeg)
+        self.assertEqual(rgb.shape, (48, 64, 3))
+        self.assertEqual(rgb.dtype, np.uint8)
+        self.assertGreater(rgb[..., 0].mean(), 150)
+
+
+class TestRequestPhotoBytes(unittest.TestCase):
+    """The kiosk endpoints accept a raw body, a file part or the old data URL."""
+
+    def setUp(self):
+        from flask import Flask
+        from routes.all_routes import request_photo_bytes
+        self.app = Flask(__name__)
+        self.read = request_photo_bytes
+        buf = io.BytesIO()
+        Image.new('RGB', (32, 32)).save(buf, format='JPEG')
+        self.jpeg = buf.getvalue()
+
+    def _read(self, **kwargs):
+        with self.app.test_request_context('/identify', method='POST', **kwargs):
+            return self.read()
+
+    def test_raw_jpeg_body(self):
+        self.assertEqual(self._read(data=self.jpeg, content_type='image/jpeg'), self.jpeg)
+
+    def test_multipart_file_part(self):
+        data = {'photo_data': (io.BytesIO(self.jpeg), 'frame.jpg', 'image/jpeg')}
+        self.assertEqual(self._read(data=data, content_type='multipart/form-data'), self.jpeg)
+
+    def test_base64_form_field(self):
+        url = 'data:image/jpeg;base64,' + base64.b64encode(self.jpeg).decode('ascii')
+        self.assertEqual(self._read(data={'photo_data': url}), self.jpeg)
+        self.assertEqual(self._read(json={'photo_data': url}), self.jpeg)
+
+    def test_missing_photo(self):
+        self.assertIsNone(self._read(data={}))
+
+
+if __name__ == '__main__':
+    unittest.main()
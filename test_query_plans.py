@@ -0,0 +1,184 @@
+import inspect
+import random
+import unittest
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from unittest import mock
+import mysql.connector
+import db
+from models import client_model, csm_form_model, log_model
+from scripts.migrate import apply_migration, load_migrations, split_statements
+
+SCRATCH_DB = db.db_config["database"] + "_plan_test"
+
+
+class ExplainingCursor:
+    """Wraps a cursor and records the EXPLAIN plan of every query it runs."""
+
+    def __init__(self, cursor, plans):
+        self._cursor = cursor
+        self._plans = plans
+
+    def execute(self, sql, params=()):
+        if sql.split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE"):
+            self._cursor.execute("EXPLAIN " + sql, params)
+            self._plans.append((" ".join(sql.split()), self._cursor.fetchall()))
+        return self._cursor.execute(sql, params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class TestQueryPlans(unittest.TestCase):
+    """
+    Runs the hot model queries, including the iter_* streaming variants,
+    against a scratch copy of the schema (with every migration applied and
+    enough rows for the optimizer to prefer an index) and fails if any of
+    them scans a whole table. Not checked, because they read every row by
+    design: dashboard totals (get_total_logs, get_department_counts,
+    get_purpose_counts), unlimited client listings, and the "contains" client
+    searches (%text%), which no index can serve.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        config = {k: v for k, v in db.db_config.items() if k != "database"}
+        try:
+            cls.connection = mysql.connector.connect(**config)
+        except mysql.connector.Error as err:
+            raise unittest.SkipTest(f"MySQL unavailable: {err}")
+        cursor = cls.connection.cursor(dictionary=True, buffered=True)
+        cursor.execute(f"DROP DATABASE IF EXISTS {SCRATCH_DB}")
+        cursor.execute(f"CREATE DATABASE {SCRATCH_DB}")
+        cursor.execute(f"USE {SCRATCH_DB}")
+        with open("schema.sql") as f:
+            for stmt in split_statements(f.read()):
+                if not stmt.upper().startswith(("USE", "CREATE DATABASE")):
+                    cursor.execute(stmt)
+        for migration in load_migrations():
+            apply_migration(cursor, migration)
+        cls.seed(cursor)
+        cls.connection.commit()
+        cursor.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cursor = cls.connection.cursor()
+        cursor.execute(f"DROP DATABASE IF EXISTS {SCRATCH_DB}")
+        cursor.close()
+        cls.connection.close()
+
+    @classmethod
+    def seed(cls, cursor):
+        rng = random.Random(7)
+        letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+        def word():
+            return "".join(rng.choice(letters) for _ in range(rng.randint(4, 9)))
+
+        clients = []
+        for i in range(1, 5001):
+            # enough MARIAs for the prefix search to fill its list on its own
+            fname, lname = ("MARIA" if i % 250 == 0 else word()), word()
+            clients.append((str(i), f"{fname} {lname}", fname, lname, rng.choice(["HR", "IT", "FIN", None])))
+        cursor.executemany("INSERT INTO clients (client_id, full_name, fname, lname, department) "
+                           "VALUES (%s, %s, %s, %s, %s)", clients)
+
+        now = datetime.now()
+        logs = []
+        for _ in range(30000):
+            time_in = now - timedelta(days=rng.randint(0, 365), minutes=rng.randint(0, 600))
+            time_out = None if rng.random() < 0.02 else time_in + timedelta(minutes=30)
+            logs.append((str(rng.randint(1, 5000)), time_in, time_out, "INQUIRE"))
+        cursor.executemany("INSERT INTO logs (client_id, time_in, time_out, purpose) VALUES (%s, %s, %s, %s)", logs)
+
+        forms = []
+        for i in range(6000):
+            date = (now - timedelta(days=rng.randint(0, 730))).date()
+            forms.append((f"HR-S{date.strftime('%y')}-{i:04d}", date, rng.choice(["Male", "Female"])))
+        cursor.executemany("INSERT INTO csm_form (control_no, date, sex) VALUES (%s, %s, %s)", forms)
+
+        cursor.execute("ANALYZE TABLE clients, logs, csm_form")
+        cursor.fetchall()
+
+    @contextmanager
+    def explaining(self, plans):
+        @contextmanager
+        def scratch_cursor(commit=False, read_only=False):
+            cursor = self.connection.cursor(dictionary=True, buffered=True)
+            try:
+                yield ExplainingCursor(cursor, plans)
+                if commit:
+                    self.connection.commit()
+            finally:
+                cursor.close()
+
+        def scratch_rows(sql, params=(), batch_size=None, read_only=False):
+            with scratch_cursor() as cursor:
+                cursor.execute(sql, params)
+                yield from cursor.fetchall()
+
+        with mock.patch.object(log_model, "get_db_cursor", scratch_cursor), \
+                mock.patch.object(client_model, "get_db_cursor", scratch_cursor), \
+                mock.patch.object(csm_form_model, "get_db_cursor", scratch_cursor), \
+                mock.patch.object(log_model, "iter_db_rows", scratch_rows), \
+                mock.patch.object(client_model, "iter_db_rows", scratch_rows), \
+                mock.patch.object(csm_form_model, "iter_db_rows", scratch_rows):
+            yield
+
+    def assertNoFullScan(self, call, *args, **kwargs):
+        plans = []
+        with self.explaining(plans):
+            result = call(*args, **kwargs)
+            if inspect.isgenerator(result):
+                result = list(result)
+        self.assertTrue(plans, f"{call.__name__} ran no query")
+        for sql, rows in plans:
+            for row in rows:
+                self.assertNotEqual(row["type"], "ALL",
+                                    f"{call.__name__}: full scan of {row['table']} in: {sql}")
+        return result
+
+    def test_log_queries(self):
+        today = datetime.now().strftime("%Y-%m-%d")
+        month_ago = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+        self.assertNoFullScan(log_model.get_logs, start_date=today, end_date=today)
+        self.assertNoFullScan(log_model.get_logs, start_date=month_ago, end_date=today, limit="100")
+        self.assertNoFullScan(log_model.get_logs, limit="50")
+        self.assertNoFullScan(log_model.iter_logs, start_date=month_ago, end_date=today)
+        self.assertNoFullScan(log_model.iter_logs, limit="500")
+        self.assertNoFullScan(log_model.get_logs_by_day, days=14)
+        self.assertNoFullScan(log_model.add_time_out, "42")
+
+    def test_client_queries(self):
+        self.assertNoFullScan(client_model.get_client_by_client_id, "42")
+        self.assertEqual(len(self.assertNoFullScan(client_model.search_clients, "MARIA")), 10)
+        self.assertNoFullScan(client_model.get_clients_filtered, limit="25")
+        self.assertNoFullScan(client_model.iter_clients_filtered, limit="100")
+
+    def test_csm_form_queries(self):
+        today = datetime.now().strftime("%Y-%m-%d")
+        month_ago = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+        self.assertNoFullScan(csm_form_model.get_csm_forms_filtered, start_date=month_ago, end_date=today)
+        self.assertNoFullScan(csm_form_model.get_csm_forms_filtered, limit="50")
+        self.assertNoFullScan(csm_form_model.iter_csm_forms_filtered, start_date=month_ago, end_date=today)
+        self.assertNoFullScan(csm_form_model.iter_csm_forms_filtered, limit="500")
+        prefix = f"HR-S{datetime.now().strftime('%y')}-"
+        self.assertIsNotNone(self.assertNoFullScan(csm_form_model.get_latest_control_no, prefix))
+
+
+class TestMigrationFiles(unittest.TestCase):
+
+    def test_versions_are_unique_and_statements_parse(self):
+        migrations = load_migrations()
+        self.assertTrue(migrations)
+        self.assertEqual([m.version for m in migrations], sorted({m.version for m in migrations}))
+        for m in migrations:
+            statements = split_statements(m.sql)
+            self.assertTrue(statements, m.name)
+            for stmt in statements:
+                self.assertFalse(stmt.startswith("--"), stmt)
+
+
+if __name__ == '__main__':
+    unittest.main()
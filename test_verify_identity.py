@@ -0,0 +1,80 @@
+import unittest
+from unittest import mock
+import numpy as np
+from models import face_embedding_model
+from models.face_embedding_model import verify_client_face
+import routes.all_routes as all_routes
+from app import app
+
+
+def _rows(*vectors):
+    # get_embeddings_by_client_id decodes stored rows into embedding_json
+    return [{'client_id': 'C1', 'embedding_json': list(v)} for v in vectors]
+
+
+class TestVerifyClientFace(unittest.TestCase):
+
+    def setUp(self):
+        self.probe = np.zeros(128)
+
+    def verify(self, rows, threshold=0.6):
+        with mock.patch.object(face_embedding_model, 'get_embeddings_by_client_id', return_value=rows) as lookup:
+            result = verify_client_face('C1', list(self.probe), threshold=threshold)
+        lookup.assert_called_once_with('C1')
+        return result
+
+    def test_accepts_within_threshold_using_closest_angle(self):
+        far, near = np.full(128, 0.2), np.full(128, 0.05)  # distances ~2.26 and ~0.57
+        matched, distance = self.verify(_rows(far, near))
+        self.assertTrue(matched)
+        self.assertAlmostEqual(distance, np.linalg.norm(near))
+
+    def test_rejects_beyond_threshold(self):
+        matched, distance = self.verify(_rows(np.full(128, 0.06)))  # ~0.68
+        self.assertFalse(matched)
+        self.assertGreater(distance, 0.6)
+
+    def test_threshold_is_inclusive(self):
+        vector = np.zeros(128)
+        vector[0] = 0.5
+        self.assertEqual(self.verify(_rows(vector), threshold=0.5), (True, 0.5))
+
+    def test_unknown_client_is_not_matched(self):
+        self.assertEqual(self.verify([]), (False, None))
+
+
+class FakeService:
+    def __init__(self, result):
+        self.result = result
+
+    def verify(self, client_id, image_bytes):
+        return self.result
+
+
+class TestVerifyIdentityRoute(unittest.TestCase):
+
+    def post(self, result, data=None):
+        data = data if data is not None else {'client_id': 'C1', 'photo_data': (b'jpeg', 'frame.jpg')}
+        with mock.patch.object(all_routes, 'face_service', FakeService(result)), \
+                mock.patch.object(all_routes, 'request_photo_bytes', return_value=b'jpeg' if 'photo_data' in data else None):
+            return app.test_client().post('/verify_identity', data=data, content_type='multipart/form-data')
+
+    def test_match_and_mismatch(self):
+        body = self.post(([0.0] * 128, True, 0.31)).get_json()
+        self.assertEqual((body['ok'], body['match'], body['distance']), (True, True, 0.31))
+        body = self.post(([0.0] * 128, False, 0.82)).get_json()
+        self.assertEqual((body['ok'], body['match']), (True, False))
+
+    def test_unknown_client_and_no_face(self):
+        body = self.post(([0.0] * 128, False, None)).get_json()
+        self.assertEqual(body, {'ok': False, 'error': 'No enrolled face for this client'})
+        body = self.post((None, False, None)).get_json()
+        self.assertEqual(body['error'], 'No face detected')
+
+    def test_missing_client_id(self):
+        resp = self.post(([0.0] * 128, True, 0.3), data={'photo_data': (b'jpeg', 'frame.jpg')})
+        self.assertEqual(resp.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
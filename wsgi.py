@@ -1,4 +1,6 @@
-from app import app
+from app import app, start_background_warmup
+
+start_background_warmup()
 
 if __name__ == "__main__":
     app.run(host='0.0.0.0')